@@ -0,0 +1,415 @@
+"""
+Background ingestion jobs persisted in a local SQLite queue.
+Jobs survive restarts and are processed by a bounded pool of asyncio workers, no external broker is needed.
+A claimed job is leased to its worker process, which renews the lease while the job runs. Jobs are only taken over
+by another worker once their lease expired, so several server processes can share the queue.
+"""
+
+import os
+import json
+import time
+import socket
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.models.model import JobStatus
+from app.core.config import JOB_QUEUE_PATH, JOB_WORKERS, JOB_POLL_INTERVAL, JOB_LEASE_SECONDS
+
+logger = logging.getLogger("jobs")
+
+_JOB_COLUMNS = (
+    "id",
+    "kind",
+    "status",
+    "stage",
+    "payload",
+    "done",
+    "total",
+    "metrics",
+    "result",
+    "error",
+    "created_at",
+    "started_at",
+    "finished_at",
+    "owner",
+    "lease_expires",
+)
+# columns added after the first release, added to existing job tables on open
+_LEASE_COLUMNS = {"owner": "TEXT", "lease_expires": "REAL"}
+
+
+class JobStore:
+    """
+    On-disk job table. A single connection is shared by all threads behind a lock,
+    jobs are claimed in a write transaction so that several server processes can share the file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+                "stage TEXT, payload TEXT NOT NULL, done INTEGER NOT NULL DEFAULT 0, total INTEGER, "
+                "metrics TEXT NOT NULL DEFAULT '{}', result TEXT, error TEXT, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL, owner TEXT, lease_expires REAL)"
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for name, column_type in _LEASE_COLUMNS.items():
+                if name not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+
+    def create(self, kind: str, payload: dict) -> str:
+        """Enqueue a job & return its id"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, stage, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, JobStatus.QUEUED.value, JobStatus.QUEUED.value, json.dumps(payload), time.time()),
+            )
+        return job_id
+
+    def claim_next(self, owner: str, lease: float) -> Optional[dict]:
+        """
+        Requeue running jobs whose lease expired, then lease the oldest queued job to owner for lease seconds,
+        mark it as running & return it, None if the queue is empty
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._requeue_expired(now)
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JobStatus.QUEUED.value,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, stage = ?, started_at = ?, owner = ?, lease_expires = ? "
+                        "WHERE id = ?",
+                        (JobStatus.RUNNING.value, "started", now, owner, now + lease, row["id"]),
+                    )
+                    row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row) if row is not None else None
+
+    def renew_lease(self, job_id: str, owner: str, lease: float) -> bool:
+        """Extend the lease of a running job held by owner, False if the job is no longer leased to owner"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND owner = ? AND status = ?",
+                (time.time() + lease, job_id, owner, JobStatus.RUNNING.value),
+            )
+        return cursor.rowcount > 0
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        """Set job columns, dict & list values are stored as json"""
+        if not fields:
+            return
+        unknown = set(fields) - set(_JOB_COLUMNS)
+        if unknown:
+            raise ValueError(f"unknown job fields {unknown}")
+        values = [json.dumps(value) if isinstance(value, (dict, list)) else value for value in fields.values()]
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?", (*values, job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def list(self, limit: int = 50) -> List[dict]:
+        """Most recent jobs first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def requeue_expired(self) -> int:
+        """Put running jobs whose worker stopped renewing their lease back into the queue"""
+        with self._lock:
+            return self._requeue_expired(time.time())
+
+    def release(self, owner: str) -> int:
+        """Put the running jobs leased to owner back into the queue, e.g. on shutdown"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, started_at = NULL, owner = NULL, lease_expires = NULL "
+                "WHERE status = ? AND owner = ?",
+                (JobStatus.QUEUED.value, JobStatus.QUEUED.value, JobStatus.RUNNING.value, owner),
+            )
+        return cursor.rowcount
+
+    def _requeue_expired(self, now: float) -> int:
+        # jobs claimed before leases were recorded have no expiry & are requeued as well
+        cursor = self._conn.execute(
+            "UPDATE jobs SET status = ?, stage = ?, started_at = NULL, owner = NULL, lease_expires = NULL "
+            "WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+            (JobStatus.QUEUED.value, JobStatus.QUEUED.value, JobStatus.RUNNING.value, now),
+        )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        for name in ("payload", "metrics", "result"):
+            if job[name] is not None:
+                job[name] = json.loads(job[name])
+        return job
+
+
+class JobContext:
+    """
+    Progress reporting handle passed to job handlers, it can be updated from the event loop or from worker threads.
+    With a loop the updates are coalesced & written by a task in a thread, so that handlers never block the loop
+    on the job store; flush() waits for the pending updates.
+    """
+
+    def __init__(self, store: JobStore, job_id: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.store = store
+        self.job_id = job_id
+        self.metrics: Dict[str, Any] = {}
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Any] = {}
+        self._writer: Optional[asyncio.Task] = None
+
+    def update(
+        self, stage: Optional[str] = None, done: Optional[int] = None, total: Optional[int] = None, **metrics: Any
+    ) -> None:
+        """Record the current stage, the done/total progress units & cumulative metrics, e.g. chunks or entries"""
+        fields: Dict[str, Any] = {}
+        if stage is not None:
+            fields["stage"] = stage
+        if done is not None:
+            fields["done"] = done
+        if total is not None:
+            fields["total"] = total
+        with self._lock:
+            if metrics:
+                self.metrics.update(metrics)
+                fields["metrics"] = dict(self.metrics)
+            if self._loop is not None:
+                self._pending.update(fields)
+        if self._loop is None:
+            self.store.update(self.job_id, **fields)
+        else:
+            self._loop.call_soon_threadsafe(self._start_writer)
+
+    async def flush(self) -> None:
+        """Wait until the pending updates are written"""
+        self._start_writer()
+        if self._writer is not None:
+            await self._writer
+
+    def _start_writer(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write())
+
+    async def _write(self) -> None:
+        while True:
+            with self._lock:
+                fields, self._pending = self._pending, {}
+            if not fields:
+                return
+            await asyncio.to_thread(self.store.update, self.job_id, **fields)
+
+
+class _NullJobContext(JobContext):
+    """Progress handle of ingestions running inside a request"""
+
+    def __init__(self) -> None:
+        self.metrics = {}
+
+    def update(self, stage=None, done=None, total=None, **metrics) -> None:
+        self.metrics.update(metrics)
+
+
+NULL_JOB = _NullJobContext()
+
+JobHandler = Callable[[dict, JobContext], Awaitable[dict]]
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds") if timestamp else None
+
+
+def job_report(job: dict) -> dict:
+    """Public view of a job with its progress & throughput of each numeric metric since the job started"""
+    end = job["finished_at"] or time.time()
+    elapsed = end - job["started_at"] if job["started_at"] else 0.0
+    total = job["total"]
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": {
+            "done": job["done"],
+            "total": total,
+            "fraction": round(job["done"] / total, 4) if total else None,
+        },
+        "metrics": job["metrics"],
+        "throughput": {
+            f"{name}_per_s": round(value / elapsed, 2)
+            for name, value in job["metrics"].items()
+            if elapsed and isinstance(value, (int, float)) and not isinstance(value, bool)
+        },
+        "elapsed_s": round(elapsed, 3),
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": _isoformat(job["created_at"]),
+        "started_at": _isoformat(job["started_at"]),
+        "finished_at": _isoformat(job["finished_at"]),
+    }
+
+
+class JobQueue:
+    """
+    Runs the handler registered for the kind of each queued job on one of n_workers asyncio workers.
+    Handlers should offload blocking work to threads so that the workers do not stall the event loop.
+    A running job is leased to the process for lease seconds & renewed every lease / 3 seconds,
+    jobs of a process that died are requeued once their lease expired.
+    Handlers may run again for a job that was interrupted & should skip the work that was completed before.
+    """
+
+    def __init__(self, path: str, n_workers: int = 2, poll_interval: float = 1.0, lease: float = 60.0) -> None:
+        self.path = path
+        self.n_workers = max(1, n_workers)
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._store: Optional[JobStore] = None
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> JobStore:
+        """The on-disk job store, opened on first use"""
+        with self._lock:
+            if self._store is None:
+                self._store = JobStore(self.path)
+            return self._store
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """Process jobs of kind with the coroutine function handler(payload, job_context) -> result"""
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, payload: dict) -> str:
+        """Enqueue a job & return its id"""
+        if kind not in self._handlers:
+            raise ValueError(f"no handler registered for job kind {kind}")
+        job_id = self.store.create(kind, payload)
+        if self._wake is not None:
+            self._wake.set()
+        logger.info("Queued %s job %s", kind, job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = self.store.get(job_id)
+        return job_report(job) if job is not None else None
+
+    def list(self, limit: int = 50) -> List[dict]:
+        return [job_report(job) for job in self.store.list(limit)]
+
+    async def start(self) -> None:
+        """Requeue interrupted jobs whose lease expired & start the workers"""
+        if self._workers:
+            return
+        n_requeued = await asyncio.to_thread(self.store.requeue_expired)
+        if n_requeued:
+            logger.info("Requeued %d interrupted job(s)", n_requeued)
+        self._wake = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work(i)) for i in range(self.n_workers)]
+        logger.info("Started %d job worker(s)", self.n_workers)
+
+    async def stop(self) -> None:
+        """Cancel the workers & put their running jobs back into the queue"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wake = None
+        with self._lock:
+            if self._store is not None:
+                self._store.release(self.owner)
+                self._store.close()
+                self._store = None
+
+    async def _work(self, worker_id: int) -> None:
+        while True:
+            self._wake.clear()
+            job = await asyncio.to_thread(self.store.claim_next, self.owner, self.lease)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(job, worker_id)
+
+    async def run_job(self, job: dict, worker_id: int = 0) -> None:
+        """Run the handler of a claimed job, renewing its lease, & record its result or error"""
+        handler = self._handlers.get(job["kind"])
+        logger.info("Worker %d running %s job %s", worker_id, job["kind"], job["id"])
+        job_context = JobContext(self.store, job["id"], asyncio.get_running_loop())
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            if handler is None:
+                raise ValueError(f"no handler registered for job kind {job['kind']}")
+            result = await handler(job["payload"], job_context)
+        except asyncio.CancelledError:
+            raise
+        except Exception as excep:
+            logger.exception("%s job %s failed: %s", job["kind"], job["id"], excep)
+            await job_context.flush()
+            await asyncio.to_thread(
+                self.store.update,
+                job["id"],
+                status=JobStatus.FAILED.value,
+                stage="failed",
+                error=str(excep) or repr(excep),
+                finished_at=time.time(),
+            )
+            return
+        finally:
+            heartbeat.cancel()
+        await job_context.flush()
+        await asyncio.to_thread(
+            self.store.update,
+            job["id"],
+            status=JobStatus.SUCCEEDED.value,
+            stage="done",
+            result=result,
+            finished_at=time.time(),
+        )
+        logger.info("%s job %s succeeded", job["kind"], job["id"])
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await asyncio.to_thread(self.store.renew_lease, job_id, self.owner, self.lease):
+                logger.warning("Lost the lease of job %s", job_id)
+                return
+
+
+# process wide job queue, started by the app lifespan
+job_queue = JobQueue(JOB_QUEUE_PATH, n_workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL, lease=JOB_LEASE_SECONDS)
@@ -0,0 +1,293 @@
+"""
+Cache of /qa answers keyed by the normalized query, model, retrieval params & vector collection version
+"""
+
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from app.api.langchain_custom.embedding_cache import normalize_query, text_sha
+from app.core.config import (
+    QA_ANSWER_CACHE_CAPACITY,
+    QA_ANSWER_CACHE_TTL,
+    QA_ANSWER_CACHE_PATH,
+    QA_ANSWER_CACHE_DISK_CAPACITY,
+)
+
+logger = logging.getLogger("answer_cache")
+
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_COALESCED = "coalesced"
+
+
+def answer_cache_key(query: str, model: str, params: Dict[str, Any], collection: str, version: int) -> str:
+    """sha256 of the case & whitespace normalized query, the model, the retrieval params & the collection version"""
+    payload = {
+        "query": normalize_query(query),
+        "model": model,
+        "params": params,
+        "collection": collection,
+        "version": version,
+    }
+    return text_sha(json.dumps(payload, sort_keys=True, default=str))
+
+
+class _MemoryEntry(NamedTuple):
+    value: dict
+    expires_at: float
+    collection: str
+    version: int
+
+
+class SQLiteAnswerStore:
+    """
+    On-disk tier of the answer cache & the collection versions, shared by all processes using path.
+    Holds at most capacity answers, the oldest are evicted first. A single connection is shared behind a lock.
+    """
+
+    def __init__(self, path: str, capacity: int = 10_000) -> None:
+        self.path = path
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, collection TEXT NOT NULL, "
+                "version INTEGER NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_expires_at ON answers (expires_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS collection_versions (collection TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[dict, float]]:
+        """(answer, expiry time) of key if stored & not expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM answers WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def put(self, key: str, collection: str, version: int, value: dict, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, collection, version, value, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, collection, version, json.dumps(value, default=str), expires_at),
+            )
+            self._conn.execute("DELETE FROM answers WHERE expires_at <= ?", (time.time(),))
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.capacity,),
+            )
+            self._conn.commit()
+
+    def version(self, collection: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (collection,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, collection: str) -> int:
+        """Increment the version of collection & drop the answers of older versions"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO collection_versions (collection, version) VALUES (?, 1) "
+                "ON CONFLICT (collection) DO UPDATE SET version = version + 1",
+                (collection,),
+            )
+            version = self._conn.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (collection,)
+            ).fetchone()[0]
+            self._conn.execute("DELETE FROM answers WHERE collection = ? AND version < ?", (collection, version))
+            self._conn.commit()
+        return version
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class AnswerCache:
+    """
+    Two tier answer cache: an in-memory LRU tier of capacity answers & an optional on-disk tier in path,
+    both expiring answers after ttl seconds (0 keeps them until evicted).
+    Concurrent requests for the same key are coalesced into one computation whose result all of them receive.
+    Answers are keyed by the collection version, which is bumped whenever the collection changes,
+    so answers built from an older collection are never served. Versions are kept on disk if path is set.
+    """
+
+    def __init__(
+        self, capacity: int = 1024, ttl: float = 3600, path: Optional[str] = None, disk_capacity: int = 10_000
+    ) -> None:
+        self.capacity = capacity
+        self.ttl = ttl
+        self.path = path
+        self.disk_capacity = disk_capacity
+        self._store: Optional[SQLiteAnswerStore] = None
+        self._memory: "OrderedDict[str, _MemoryEntry]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    @property
+    def store(self) -> Optional[SQLiteAnswerStore]:
+        """The on-disk tier, opened on first use. None if disabled"""
+        with self._lock:
+            if self.path and self._store is None:
+                self._store = SQLiteAnswerStore(self.path, self.disk_capacity)
+            return self._store
+
+    def collection_version(self, collection: str) -> int:
+        store = self.store
+        if store is not None:
+            return store.version(collection)
+        with self._lock:
+            return self._versions.get(collection, 0)
+
+    def bump_collection_version(self, collection: str) -> int:
+        """Invalidate the cached answers of collection. Returns the new version"""
+        store = self.store
+        if store is not None:
+            version = store.bump(collection)
+        with self._lock:
+            if store is None:
+                version = self._versions[collection] = self._versions.get(collection, 0) + 1
+            for key in [key for key, entry in self._memory.items() if entry.collection == collection]:
+                del self._memory[key]
+        logger.info("Collection %s is at version %d, cached answers invalidated", collection, version)
+        return version
+
+    def _expires_at(self) -> float:
+        return time.time() + self.ttl if self.ttl > 0 else float("inf")
+
+    def _remember(self, key: str, entry: _MemoryEntry) -> None:
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.capacity:
+                self._memory.popitem(last=False)
+
+    def _get_memory(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self._metrics["memory_hits"] += 1
+            return entry.value
+
+    async def _get_disk(self, key: str, collection: str, version: int) -> Optional[dict]:
+        store = self.store
+        if store is None:
+            return None
+        stored = await asyncio.to_thread(store.get, key)
+        if stored is None:
+            return None
+        value, expires_at = stored
+        self._remember(key, _MemoryEntry(value, expires_at, collection, version))
+        with self._lock:
+            self._metrics["disk_hits"] += 1
+        return value
+
+    async def get(self, key: str, collection: str, version: int) -> Optional[dict]:
+        """Cached answer of key or None, without computing it. A lookup finding nothing counts as a miss"""
+        value = self._get_memory(key)
+        if value is None:
+            value = await self._get_disk(key, collection, version)
+        if value is None:
+            with self._lock:
+                self._metrics["misses"] += 1
+        return value
+
+    async def put(self, key: str, collection: str, version: int, value: dict) -> None:
+        """Cache the answer of key in both tiers"""
+        entry = _MemoryEntry(value, self._expires_at(), collection, version)
+        self._remember(key, entry)
+        store = self.store
+        if store is not None:
+            try:
+                await asyncio.to_thread(store.put, key, collection, version, value, entry.expires_at)
+            except sqlite3.Error as excep:
+                logger.warning("Failed to persist answer: %s", excep)
+
+    async def _load_or_compute(
+        self, key: str, collection: str, version: int, compute: Callable[[], Awaitable[dict]]
+    ) -> Tuple[dict, str]:
+        value = await self._get_disk(key, collection, version)
+        if value is not None:
+            return value, CACHE_HIT
+        with self._lock:
+            self._metrics["misses"] += 1
+        value = await compute()
+        await self.put(key, collection, version, value)
+        return value, CACHE_MISS
+
+    async def get_or_compute(
+        self, key: str, collection: str, version: int, compute: Callable[[], Awaitable[dict]]
+    ) -> Tuple[dict, str]:
+        """
+        Return (answer, status) of key: a cached answer ("hit"), the answer of a computation already running
+        for key ("coalesced") or the answer of the coroutine function compute, which is then cached ("miss").
+        The computation is shielded from the cancellation of any single request waiting for it.
+        """
+        value = self._get_memory(key)
+        if value is not None:
+            return value, CACHE_HIT
+        task = self._inflight.get(key)
+        if task is not None:
+            with self._lock:
+                self._metrics["coalesced"] += 1
+            value, _ = await asyncio.shield(task)
+            return value, CACHE_COALESCED
+        task = asyncio.ensure_future(self._load_or_compute(key, collection, version, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Hit/miss/coalescing metrics of both tiers"""
+        with self._lock:
+            hits = self._metrics["memory_hits"] + self._metrics["disk_hits"]
+            lookups = hits + self._metrics["misses"] + self._metrics["coalesced"]
+            return {
+                **self._metrics,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_size": len(self._memory),
+                "capacity": self.capacity,
+                "ttl": self.ttl,
+                "disk_enabled": bool(self.path),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._store is not None:
+                self._store.close()
+            self._store = None
+            self._memory.clear()
+
+
+# process wide /qa answer cache & collection versions
+answer_cache = AnswerCache(
+    capacity=QA_ANSWER_CACHE_CAPACITY,
+    ttl=QA_ANSWER_CACHE_TTL,
+    path=QA_ANSWER_CACHE_PATH or None,
+    disk_capacity=QA_ANSWER_CACHE_DISK_CAPACITY,
+)
@@ -0,0 +1,146 @@
+"""
+Assembly of the /qa prompt context from the selected chunks:
+adjacent chunks of a source are merged without their overlap, near-duplicates are dropped & the result is trimmed
+"""
+
+import re
+import hashlib
+import logging
+from typing import Dict, List, NamedTuple, Sequence
+
+from langchain_core.documents import Document
+
+from app.api.langchain_custom.tokens import count_tokens, truncate_tokens
+
+logger = logging.getLogger("context_assembly")
+
+CONTEXT_SEPARATOR = "\n\n"
+_WORD_RE = re.compile(r"\w+")
+_SHINGLE_SIZE = 3
+# longest overlap searched between adjacent chunks, above the chunk_overlap of all splitters
+_MAX_OVERLAP_CHARS = 400
+_MIN_OVERLAP_CHARS = 8
+# shortest tail of a block kept when it is truncated to the token budget
+_MIN_TRUNCATED_TOKENS = 32
+
+
+class AssembledContext(NamedTuple):
+    """
+    text: prompt context
+    documents: merged chunks in the context, best ranked first
+    raw_tokens: tokens of the selected chunks concatenated as they are
+    tokens: tokens of text
+    merged: chunks merged into an adjacent chunk
+    duplicates: near-duplicate blocks dropped
+    trimmed: blocks dropped or truncated to fit into the token budget
+    """
+
+    text: str
+    documents: List[Document]
+    raw_tokens: int
+    tokens: int
+    merged: int
+    duplicates: int
+    trimmed: int
+
+
+def simhash(text: str, n_bits: int = 64) -> int:
+    """SimHash of the word 3-shingles of text, near-duplicate texts differ in few bits"""
+    words = _WORD_RE.findall(text.lower())
+    shingles = [" ".join(words[i : i + _SHINGLE_SIZE]) for i in range(max(1, len(words) - _SHINGLE_SIZE + 1))]
+    weights = [0] * n_bits
+    for shingle in shingles:
+        digest = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=n_bits // 8).digest(), "big")
+        for bit in range(n_bits):
+            weights[bit] += 1 if digest >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def join_overlapping(head: str, tail: str) -> str:
+    """Join two consecutive chunks, dropping the start of tail repeated at the end of head by the splitter overlap"""
+    for size in range(min(len(head), len(tail), _MAX_OVERLAP_CHARS), _MIN_OVERLAP_CHARS - 1, -1):
+        if head.endswith(tail[:size]):
+            return head + tail[size:]
+    return head + "\n" + tail
+
+
+def _merge_adjacent(docs: Sequence[Document]) -> List[Document]:
+    """Merge runs of consecutive chunk_index of a source into one document placed at its best ranked chunk"""
+    by_source: Dict[str, List[int]] = {}
+    for rank, doc in enumerate(docs):
+        if doc.metadata.get("source") is not None and doc.metadata.get("chunk_index") is not None:
+            by_source.setdefault(doc.metadata["source"], []).append(rank)
+
+    merged_into: Dict[int, List[int]] = {rank: [rank] for rank in range(len(docs))}
+    for ranks in by_source.values():
+        ranks.sort(key=lambda rank: docs[rank].metadata["chunk_index"])
+        run = [ranks[0]]
+        for rank in ranks[1:] + [None]:
+            if rank is not None and docs[rank].metadata["chunk_index"] == docs[run[-1]].metadata["chunk_index"] + 1:
+                run.append(rank)
+                continue
+            if len(run) > 1:
+                best_rank = min(run)
+                for member in run:
+                    merged_into.pop(member, None)
+                merged_into[best_rank] = run
+            run = [rank]
+
+    blocks = []
+    for best_rank in sorted(merged_into):
+        members = merged_into[best_rank]
+        text = docs[members[0]].page_content
+        for member in members[1:]:
+            text = join_overlapping(text, docs[member].page_content)
+        metadata = dict(docs[best_rank].metadata)
+        if len(members) > 1:
+            metadata["chunk_indexes"] = [docs[member].metadata["chunk_index"] for member in members]
+        blocks.append(Document(page_content=text, metadata=metadata, id=docs[best_rank].id))
+    return blocks
+
+
+def assemble_context(docs: Sequence[Document], token_budget: int, max_hamming_distance: int = 6) -> AssembledContext:
+    """
+    Build the prompt context of docs, ranked best first: merge adjacent chunks of the same source,
+    drop blocks within max_hamming_distance simhash bits of a better ranked block (-1 disables it)
+    and keep the best ranked blocks within token_budget, truncating the first block that does not fit
+    """
+    raw_tokens = count_tokens(CONTEXT_SEPARATOR.join(doc.page_content for doc in docs))
+    blocks = _merge_adjacent(docs)
+    n_merged = len(docs) - len(blocks)
+
+    unique_blocks, fingerprints = [], []
+    for block in blocks:
+        fingerprint = simhash(block.page_content)
+        if any(hamming_distance(fingerprint, seen) <= max_hamming_distance for seen in fingerprints):
+            continue
+        fingerprints.append(fingerprint)
+        unique_blocks.append(block)
+    n_duplicates = len(blocks) - len(unique_blocks)
+
+    kept, n_tokens, n_truncated = [], 0, 0
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    for block in unique_blocks:
+        block_tokens = count_tokens(block.page_content) + (separator_tokens if kept else 0)
+        if n_tokens + block_tokens <= token_budget:
+            kept.append(block)
+            n_tokens += block_tokens
+            continue
+        remaining = token_budget - n_tokens - (separator_tokens if kept else 0)
+        if remaining >= _MIN_TRUNCATED_TOKENS or not kept:
+            truncated = truncate_tokens(block.page_content, max(remaining, 0))
+            kept.append(Document(page_content=truncated, metadata=block.metadata, id=block.id))
+            n_truncated = 1
+        break
+    n_trimmed = len(unique_blocks) - len(kept) + n_truncated
+
+    text = CONTEXT_SEPARATOR.join(block.page_content for block in kept)
+    assembled = AssembledContext(text, kept, raw_tokens, count_tokens(text), n_merged, n_duplicates, n_trimmed)
+    logger.debug(
+        "Assembled %d chunk(s) into %d block(s), %d -> %d tokens", len(docs), len(kept), raw_tokens, assembled.tokens
+    )
+    return assembled
@@ -0,0 +1,218 @@
+"""
+Embedding caches keyed by (embedding model, text hash)
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger("embedding_cache")
+
+_SQLITE_MAX_VARIABLES = 500
+
+
+def normalize_query(text: str) -> str:
+    """Case & whitespace insensitive form of a query"""
+    return " ".join(text.split()).lower()
+
+
+def text_sha(text: str) -> str:
+    """sha256 hex digest of text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SQLiteEmbeddingStore:
+    """
+    On-disk content addressed store of embeddings keyed by (model, key), surviving restarts.
+    Vectors are stored as float32 blobs. A single connection is shared by all threads behind a lock.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, key))"
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Return {key: vector} of the stored keys"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQLITE_MAX_VARIABLES):
+                batch = keys[start : start + _SQLITE_MAX_VARIABLES]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({', '.join('?' * len(batch))})",
+                    (model, *batch),
+                ).fetchall()
+                found.update({key: np.frombuffer(vector, dtype=np.float32).tolist() for key, vector in rows})
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """Store {key: vector}"""
+        if not vectors:
+            return
+        rows = [(model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Query embeddings cached by (model, sha of the normalized query) in an in-memory LRU tier of capacity entries
+    and an optional on-disk tier. Document embeddings are passed through to the wrapped embeddings.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        capacity: int = 2048,
+        store: Optional[SQLiteEmbeddingStore] = None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model = model
+        self.capacity = capacity
+        self.store = store
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._metrics["memory_hits"] += 1
+                return vector
+        if self.store is not None:
+            vector = self.store.get_many(self.model, [key]).get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                with self._lock:
+                    self._metrics["disk_hits"] += 1
+                return vector
+        with self._lock:
+            self._metrics["misses"] += 1
+        return None
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.capacity:
+                self._memory.popitem(last=False)
+
+    def _store(self, key: str, vector: List[float]) -> None:
+        self._remember(key, vector)
+        if self.store is not None:
+            try:
+                self.store.put_many(self.model, {key: vector})
+            except sqlite3.Error as excep:
+                logger.warning("Failed to persist query embedding: %s", excep)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_sha(normalize_query(text))
+        vector = self._lookup(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = text_sha(normalize_query(text))
+        vector = self._lookup(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._store(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def stats(self) -> dict:
+        """Hit/miss metrics of both tiers"""
+        with self._lock:
+            hits = self._metrics["memory_hits"] + self._metrics["disk_hits"]
+            lookups = hits + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_size": len(self._memory),
+                "capacity": self.capacity,
+                "disk_enabled": self.store is not None,
+            }
+
+
+def _split_cached(
+    model: str, texts: List[str], store: Optional[SQLiteEmbeddingStore]
+) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+    """Keys of texts, the stored {key: vector} & the unseen, unique {key: text}"""
+    keys = [text_sha(text) for text in texts]
+    vectors = store.get_many(model, keys) if store is not None else {}
+    missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+    return keys, vectors, missing
+
+
+def _store_new_vectors(model: str, store: Optional[SQLiteEmbeddingStore], new_vectors: Dict[str, List[float]]) -> None:
+    if store is not None:
+        try:
+            store.put_many(model, new_vectors)
+        except sqlite3.Error as excep:
+            logger.warning("Failed to persist chunk embeddings: %s", excep)
+
+
+def embed_documents_cached(
+    embeddings: Embeddings, model: str, texts: List[str], store: Optional[SQLiteEmbeddingStore]
+) -> Tuple[List[List[float]], int]:
+    """
+    Embed texts, reusing the vectors of byte-identical texts in store keyed by (model, sha of the text).
+    Only unseen & unique texts are embedded, in one embed_documents call, and added to store.
+    Returns the vectors in the order of texts and the number of embedded texts.
+    """
+    keys, vectors, missing = _split_cached(model, texts, store)
+    if missing:
+        new_vectors = dict(zip(missing, embeddings.embed_documents(list(missing.values()))))
+        _store_new_vectors(model, store, new_vectors)
+        vectors.update(new_vectors)
+    logger.info("Embedded %d of %d chunk(s), %d reused from cache", len(missing), len(texts), len(texts) - len(missing))
+    return [vectors[key] for key in keys], len(missing)
+
+
+async def aembed_documents_cached(
+    aembed_documents: Callable[[List[str]], Awaitable[List[List[float]]]],
+    model: str,
+    texts: List[str],
+    store: Optional[SQLiteEmbeddingStore],
+) -> Tuple[List[List[float]], int]:
+    """embed_documents_cached embedding the unseen texts with the coroutine aembed_documents, e.g. of a pipeline"""
+    keys, vectors, missing = _split_cached(model, texts, store)
+    if missing:
+        new_vectors = dict(zip(missing, await aembed_documents(list(missing.values()))))
+        _store_new_vectors(model, store, new_vectors)
+        vectors.update(new_vectors)
+    logger.info("Embedded %d of %d chunk(s), %d reused from cache", len(missing), len(texts), len(texts) - len(missing))
+    return [vectors[key] for key in keys], len(missing)
@@ -0,0 +1,121 @@
+"""
+Batched, concurrent document embedding with retries on rate limits
+"""
+
+import time
+import random
+import asyncio
+import logging
+from typing import List, Tuple
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+from app.api.langchain_custom.tokens import count_tokens
+
+logger = logging.getLogger("embedding_pipeline")
+
+# transient embedding api errors retried with exponential backoff
+RETRYABLE_EMBEDDING_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def make_batches(n_tokens: List[int], batch_size: int, batch_tokens: int) -> List[Tuple[int, int]]:
+    """
+    Split consecutive texts with n_tokens tokens each into (start, end) batches of at most batch_size texts
+    and batch_tokens tokens. A text longer than batch_tokens is sent in a batch of its own.
+    """
+    batches = []
+    start = total = 0
+    for i, tokens in enumerate(n_tokens):
+        if i > start and (i - start >= batch_size or total + tokens > batch_tokens):
+            batches.append((start, i))
+            start, total = i, 0
+        total += tokens
+    if start < len(n_tokens):
+        batches.append((start, len(n_tokens)))
+    return batches
+
+
+class EmbeddingPipeline:
+    """
+    Embeds documents in batches of at most batch_size texts & batch_tokens tokens with up to max_concurrency
+    batches in flight. Batches failing with a rate limit or transient api error are retried max_retries times
+    with exponential backoff starting at backoff seconds. Vectors are reassembled in the order of the texts.
+    Throughput over all calls of the pipeline is reported by stats().
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str = "text-embedding-ada-002",
+        batch_size: int = 256,
+        batch_tokens: int = 50_000,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.batch_tokens = max(1, batch_tokens)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._metrics = {"chunks": 0, "tokens": 0, "batches": 0, "retries": 0, "elapsed_s": 0.0}
+
+    async def _embed_batch(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        attempt = 0
+        while True:
+            async with semaphore:
+                try:
+                    return await self.embeddings.aembed_documents(texts)
+                except RETRYABLE_EMBEDDING_ERRORS as excep:
+                    if attempt >= self.max_retries:
+                        raise
+                    error = excep
+            # back off outside of the semaphore so that other batches keep the slot busy
+            delay = self.backoff * 2**attempt * (1 + random.random())
+            attempt += 1
+            self._metrics["retries"] += 1
+            logger.warning("Embedding batch of %d text(s) failed, retrying in %.1fs: %s", len(texts), delay, error)
+            await asyncio.sleep(delay)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts & return their vectors in order"""
+        if not texts:
+            return []
+        start_time = time.perf_counter()
+        n_tokens = [count_tokens(text, self.model) for text in texts]
+        batches = make_batches(n_tokens, self.batch_size, self.batch_tokens)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*(self._embed_batch(texts[start:end], semaphore) for start, end in batches))
+        vectors = [vector for batch_vectors in results for vector in batch_vectors]
+
+        elapsed = time.perf_counter() - start_time
+        self._metrics["chunks"] += len(texts)
+        self._metrics["tokens"] += sum(n_tokens)
+        self._metrics["batches"] += len(batches)
+        self._metrics["elapsed_s"] += elapsed
+        logger.info(
+            "Embedded %d chunk(s) with %d token(s) in %d batch(es) in %.2fs",
+            len(texts),
+            sum(n_tokens),
+            len(batches),
+            elapsed,
+        )
+        return vectors
+
+    def stats(self) -> dict:
+        """Embedded chunks & tokens, batches, retries and throughput"""
+        elapsed = self._metrics["elapsed_s"]
+        return {
+            **self._metrics,
+            "elapsed_s": round(elapsed, 3),
+            "chunks_per_s": round(self._metrics["chunks"] / elapsed, 2) if elapsed else 0.0,
+            "tokens_per_s": round(self._metrics["tokens"] / elapsed, 2) if elapsed else 0.0,
+        }
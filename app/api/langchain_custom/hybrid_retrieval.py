@@ -0,0 +1,73 @@
+"""
+Hybrid lexical & vector retrieval fused with reciprocal rank fusion
+"""
+
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from app.api.langchain_custom.lexical_index import LexicalIndex
+
+logger = logging.getLogger("hybrid_retrieval")
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], rrf_k: int = 60, weights: Optional[Sequence[float]] = None
+) -> List[Tuple[str, float]]:
+    """
+    Fuse rankings of ids, best first, into one ranking by sum(weight / (rrf_k + rank)).
+    Ids ranked by several rankings rise to the top, the scores of the rankers need not be comparable.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += weight / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def _where_sources(where: Optional[Dict]) -> Optional[List[str]]:
+    """Sources of a where clause built by metadata_where, pre-filtering the lexical matches"""
+    if not where:
+        return None
+    for clause in where.get("$and", [where]):
+        if "source" in clause:
+            return clause["source"]["$in"]
+    return None
+
+
+def hybrid_search(
+    vector_store: Chroma,
+    lexical_index: LexicalIndex,
+    query: str,
+    k: int = 6,
+    fetch_k: int = 20,
+    rrf_k: int = 60,
+    where: Optional[Dict] = None,
+    embedding: Optional[List[float]] = None,
+) -> List[Document]:
+    """
+    Top k chunks of the fused rankings of the fetch_k nearest chunks of vector_store
+    and the fetch_k best bm25 matches of lexical_index, both restricted to the chunks matching the where clause.
+    Lexical matches missing from the collection are skipped.
+    The query is embedded by vector_store unless its embedding is given.
+    """
+    if embedding is None:
+        vector_docs = vector_store.similarity_search(query, k=fetch_k, filter=where)
+    else:
+        vector_docs = vector_store.similarity_search_by_vector(embedding, k=fetch_k, filter=where)
+    docs_by_id = {doc.id: doc for doc in vector_docs}
+    lexical_hits = lexical_index.search(vector_store._collection.name, query, fetch_k, sources=_where_sources(where))
+    lexical_ids = [chunk_id for chunk_id, _ in lexical_hits]
+    missing_ids = [chunk_id for chunk_id in lexical_ids if chunk_id not in docs_by_id]
+    if missing_ids:
+        records = vector_store._collection.get(ids=missing_ids, where=where, include=["documents", "metadatas"])
+        for chunk_id, text, metadata in zip(records["ids"], records["documents"], records["metadatas"]):
+            docs_by_id[chunk_id] = Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+    lexical_ids = [chunk_id for chunk_id in lexical_ids if chunk_id in docs_by_id]
+    fused = reciprocal_rank_fusion([[doc.id for doc in vector_docs], lexical_ids], rrf_k)
+    logger.debug("Fused %d vector & %d lexical match(es) of %r", len(vector_docs), len(lexical_ids), query)
+    return [docs_by_id[chunk_id] for chunk_id, _ in fused[:k]]
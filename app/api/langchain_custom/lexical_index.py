@@ -0,0 +1,136 @@
+"""
+On-disk BM25 inverted index of vector store chunks for exact token matches, e.g. error codes & node names
+"""
+
+import logging
+import sqlite3
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("lexical_index")
+
+_SQLITE_MAX_VARIABLES = 500
+_MAX_QUERY_TERMS = 64
+# underscores & dashes are part of tokens so that goal_type, node-03 or E-1023 are matched as a whole
+_TOKENIZER = "unicode61 tokenchars '_-'"
+
+
+def fts_query(query: str) -> Optional[str]:
+    """FTS5 query matching any whitespace separated term of query, each quoted to escape the FTS5 syntax"""
+    terms = list(dict.fromkeys(term.replace('"', '""') for term in query.split()))[:_MAX_QUERY_TERMS]
+    return " OR ".join(f'"{term}"' for term in terms) if terms else None
+
+
+class LexicalIndex:
+    """
+    BM25 index of chunk texts in an SQLite FTS5 table, keyed by (collection, chunk id) like the vector store
+    so it is updated incrementally alongside it. The database is memory-mapped up to mmap_size bytes.
+    A single connection is shared by all threads behind a lock.
+    """
+
+    def __init__(self, path: str, mmap_size: int = 256 << 20) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+            self._conn.executescript(
+                f"""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    collection TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    source TEXT,
+                    text TEXT NOT NULL,
+                    UNIQUE (collection, chunk_id)
+                );
+                CREATE INDEX IF NOT EXISTS chunks_source ON chunks (collection, source);
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts
+                    USING fts5(text, content='chunks', content_rowid='id', tokenize="{_TOKENIZER}");
+                CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                    INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                    INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                END;
+                """
+            )
+            self._conn.commit()
+
+    def count(self, collection: str) -> int:
+        """Number of indexed chunks of collection"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks WHERE collection = ?", (collection,)).fetchone()[0]
+
+    def chunk_ids(self, collection: str) -> set:
+        """Ids of the indexed chunks of collection"""
+        with self._lock:
+            return {
+                row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks WHERE collection = ?", (collection,))
+            }
+
+    def add(
+        self, collection: str, chunk_ids: Sequence[str], texts: Sequence[str], sources: Sequence[Optional[str]]
+    ) -> None:
+        """Index the chunks that are not indexed yet. Chunk ids are content derived, so indexed chunks are kept"""
+        rows = [(collection, chunk_id, source, text) for chunk_id, text, source in zip(chunk_ids, texts, sources)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunks (collection, chunk_id, source, text) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def delete(self, collection: str, chunk_ids: Sequence[str]) -> None:
+        """Remove chunks from the index"""
+        chunk_ids = list(chunk_ids)
+        with self._lock:
+            for start in range(0, len(chunk_ids), _SQLITE_MAX_VARIABLES):
+                batch = chunk_ids[start : start + _SQLITE_MAX_VARIABLES]
+                self._conn.execute(
+                    f"DELETE FROM chunks WHERE collection = ? AND chunk_id IN ({', '.join('?' * len(batch))})",
+                    (collection, *batch),
+                )
+            self._conn.commit()
+
+    def sync_source(self, collection: str, source: str, chunk_ids: Sequence[str], texts: Sequence[str]) -> int:
+        """
+        Make the indexed chunks of source equal to chunk_ids: index the missing chunks & remove the stale ones.
+        Returns the number of removed chunks
+        """
+        with self._lock:
+            indexed_ids = {
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE collection = ? AND source = ?", (collection, source)
+                )
+            }
+        stale_ids = indexed_ids - set(chunk_ids)
+        self.delete(collection, stale_ids)
+        self.add(collection, chunk_ids, texts, [source] * len(chunk_ids))
+        return len(stale_ids)
+
+    def search(
+        self, collection: str, query: str, k: int = 20, sources: Optional[Sequence[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """Top k (chunk id, bm25 score) of collection, of sources if set, matching any term of query, best first"""
+        match = fts_query(query)
+        if match is None:
+            return []
+        source_filter, source_params = "", ()
+        if sources:
+            sources = list(sources)[:_SQLITE_MAX_VARIABLES]
+            source_filter = f" AND chunks.source IN ({', '.join('?' * len(sources))})"
+            source_params = tuple(sources)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunks.chunk_id, -bm25(chunks_fts) AS score FROM chunks_fts "
+                "JOIN chunks ON chunks.id = chunks_fts.rowid "
+                f"WHERE chunks_fts MATCH ? AND chunks.collection = ?{source_filter} ORDER BY score DESC LIMIT ?",
+                (match, collection, *source_params, k),
+            ).fetchall()
+        return [(chunk_id, score) for chunk_id, score in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
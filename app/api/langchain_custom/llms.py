@@ -1,6 +1,57 @@
+import threading
+from functools import lru_cache
+
+import httpx
 from langchain_openai import ChatOpenAI
 from langchain_community.llms.llamafile import Llamafile
 from app.models.model import LLMModel
+from app.core.config import (
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HTTP_TIMEOUT,
+)
+
+_HTTP_CLIENT_LOCK = threading.Lock()
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+@lru_cache(maxsize=1)
+def _get_shared_http_client() -> httpx.Client:
+    return httpx.Client(limits=_http_limits(), timeout=LLM_HTTP_TIMEOUT)
+
+
+@lru_cache(maxsize=1)
+def _get_shared_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=_http_limits(), timeout=LLM_HTTP_TIMEOUT)
+
+
+def get_shared_http_clients() -> tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    Return the process wide sync & async http clients used by all LLM clients,
+    so that connection pools and TLS sessions are kept warm across requests.
+    """
+    with _HTTP_CLIENT_LOCK:
+        return _get_shared_http_client(), _get_shared_async_http_client()
+
+
+def load_chat_openai(model: str, temperature: float = 0, **kwargs) -> ChatOpenAI:
+    """Create a ChatOpenAI client that uses the shared http connection pools"""
+    http_client, http_async_client = get_shared_http_clients()
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        **kwargs,
+    )
 
 
 def is_valid_model_value(model_value):
@@ -16,5 +67,5 @@ def load_llm(llm_name: str | LLMModel):
         return Llamafile()
     if is_valid_model_value(model_name):
         # defaults to openai models
-        return ChatOpenAI(temperature=0, model=model_name)
+        return load_chat_openai(model=model_name, temperature=0)
     raise ValueError(f"Unsupported llm name: {model_name}")
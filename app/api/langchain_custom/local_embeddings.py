@@ -0,0 +1,193 @@
+"""
+Process wide registry of local embedding models.
+Each model is loaded once and concurrent embedding calls are coalesced into single forward passes.
+"""
+
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+from app.core.config import (
+    LOCAL_EMBEDDING_NUM_THREADS,
+    LOCAL_EMBEDDING_MAX_BATCH_SIZE,
+    LOCAL_EMBEDDING_MAX_WAIT_MS,
+)
+
+logger = logging.getLogger("local_embeddings")
+
+
+class _EmbeddingRequest(NamedTuple):
+    texts: List[str]
+    future: Future
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Embeds the texts of concurrent calls in one embed_documents call of the wrapped local model.
+    A batching thread waits up to max_wait_ms after the first pending call for more calls
+    until max_batch_size texts are collected, so a single caller waits at most max_wait_ms longer.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 64, max_wait_ms: float = 5.0) -> None:
+        self.embeddings = embeddings
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue[Optional[_EmbeddingRequest]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._metrics = {"requests": 0, "texts": 0, "forward_passes": 0}
+
+    def _submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-micro-batcher", daemon=True)
+                self._thread.start()
+            self._metrics["requests"] += 1
+        self._queue.put(_EmbeddingRequest(list(texts), future))
+        return future
+
+    def _collect(self, first: _EmbeddingRequest) -> List[_EmbeddingRequest]:
+        batch, n_texts = [first], len(first.texts)
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while n_texts < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # keep the stop signal for the run loop
+                self._queue.put(None)
+                break
+            batch.append(request)
+            n_texts += len(request.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as excep:
+                for request in batch:
+                    request.future.set_exception(excep)
+                continue
+            with self._lock:
+                self._metrics["texts"] += len(texts)
+                self._metrics["forward_passes"] += 1
+            start = 0
+            for request in batch:
+                request.future.set_result(vectors[start : start + len(request.texts)])
+                start += len(request.texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._submit(texts).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text]).result()[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self._submit(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await asyncio.wrap_future(self._submit([text])))[0]
+
+    def stats(self) -> dict:
+        """Embedding calls, texts & forward passes of the wrapped model"""
+        with self._lock:
+            passes = self._metrics["forward_passes"]
+            return {**self._metrics, "texts_per_pass": round(self._metrics["texts"] / passes, 2) if passes else 0.0}
+
+    def close(self) -> None:
+        """Stop the batching thread once the pending calls are embedded"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+            # drop the stop signal in case it was put back by _collect
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+
+def _set_num_threads(num_threads: int) -> None:
+    """Limit the intra-op threads of torch, 0 keeps the torch default"""
+    if num_threads <= 0:
+        return
+    try:
+        import torch
+    except ImportError:
+        logger.warning("torch is not installed, LOCAL_EMBEDDING_NUM_THREADS=%d is ignored", num_threads)
+        return
+    torch.set_num_threads(num_threads)
+    logger.info("Set torch intra-op threads to %d", num_threads)
+
+
+class LocalEmbeddingRegistry:
+    """
+    Loads each local embedding model once per process with load_model & shares it behind a MicroBatchingEmbeddings.
+    The torch intra-op threads are set to num_threads before the first model is loaded.
+    """
+
+    def __init__(
+        self,
+        num_threads: int = 0,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        load_model: Callable[[str], Embeddings] = lambda model_name: HuggingFaceEmbeddings(model_name=model_name),
+    ) -> None:
+        self.num_threads = num_threads
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._load_model = load_model
+        self._models: Dict[str, MicroBatchingEmbeddings] = {}
+        self._threads_set = False
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str) -> MicroBatchingEmbeddings:
+        """Return the shared embeddings of model_name, loading the model on first use"""
+        with self._lock:
+            if model_name not in self._models:
+                if not self._threads_set:
+                    _set_num_threads(self.num_threads)
+                    self._threads_set = True
+                start = time.perf_counter()
+                model = self._load_model(model_name)
+                logger.info("Loaded local embedding model %s in %.2fs", model_name, time.perf_counter() - start)
+                self._models[model_name] = MicroBatchingEmbeddings(model, self.max_batch_size, self.max_wait_ms)
+            return self._models[model_name]
+
+    def stats(self) -> dict:
+        """Micro-batching metrics of each loaded model"""
+        with self._lock:
+            return {model_name: embeddings.stats() for model_name, embeddings in self._models.items()}
+
+    def close(self) -> None:
+        """Stop the batching threads, the models stay loaded"""
+        with self._lock:
+            models = list(self._models.values())
+        for embeddings in models:
+            embeddings.close()
+
+
+# process wide local embedding models
+local_embedding_registry = LocalEmbeddingRegistry(
+    num_threads=LOCAL_EMBEDDING_NUM_THREADS,
+    max_batch_size=LOCAL_EMBEDDING_MAX_BATCH_SIZE,
+    max_wait_ms=LOCAL_EMBEDDING_MAX_WAIT_MS,
+)
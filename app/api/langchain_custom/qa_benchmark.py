@@ -0,0 +1,305 @@
+"""
+Offline benchmark of the /qa pipeline on a labelled question -> expected chunk dataset.
+The chunks are indexed into a temporary vector store & lexical index with a deterministic local embedding model,
+answers are generated by a stub llm, so runs need no network and are comparable across commits.
+Reports recall@k, MRR & the p50/p95/p99 latency of each stage (embed, search, rerank, format, generate) as JSON.
+
+    python -m app.api.langchain_custom.qa_benchmark -o qa_benchmark.json
+    python -m app.api.langchain_custom.qa_benchmark --retrieval vector -k 3 --baseline qa_benchmark.json
+"""
+
+import re
+import json
+import time
+import hashlib
+import logging
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListLLM
+from langchain_core.output_parsers import StrOutputParser
+
+from app.api.langchain_custom.hybrid_retrieval import hybrid_search
+from app.api.langchain_custom.rerank import get_reranker
+from app.api.langchain_custom.vector_store import VectorStoreManager
+from app.routes.qa import RAG_PROMPT, build_context, rerank_docs
+from app.core.config import (
+    QA_HYBRID_FETCH_K,
+    QA_RRF_K,
+    QA_RERANKER,
+    QA_RERANK_MODEL,
+    QA_RERANK_FETCH_K,
+    QA_CONTEXT_TOKEN_BUDGET,
+    QA_CONTEXT_ASSEMBLY,
+)
+
+logger = logging.getLogger("qa_benchmark")
+
+DEFAULT_DATASET = Path(__file__).resolve().parents[2] / "static" / "benchmark" / "qa_dataset.json"
+HASHING_EMBEDDINGS = "hashing"
+STAGES = ("embed", "search", "rerank", "format", "generate")
+STUB_ANSWER = "This is a stub answer of the benchmark."
+
+_COLLECTION = "qa_benchmark"
+_TOKEN_RE = re.compile(r"[\w-]+")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic bag of words embeddings: the lower-cased words & word bigrams of a text are hashed into dim
+    signed buckets and the vector is l2 normalized. Texts sharing words are close, no model is loaded.
+    """
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        words = _TOKEN_RE.findall(text.lower())
+        features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def load_dataset(path: str) -> Dict:
+    """
+    Load a dataset {"chunks": [{"id", "text", "source", ...metadata}], "questions": [{"question", "expected"}]}
+    where expected are the ids of the chunks answering the question
+    """
+    with open(path, "r", encoding="utf-8") as fptr:
+        dataset = json.load(fptr)
+    chunk_ids = {chunk["id"] for chunk in dataset["chunks"]}
+    for question in dataset["questions"]:
+        unknown = set(question["expected"]) - chunk_ids
+        if unknown:
+            raise ValueError(f"expected chunks {sorted(unknown)} of {question['question']!r} are not in the dataset")
+    return dataset
+
+
+def retrieval_metrics(retrieved: List[str], expected: List[str], k: int) -> Dict[str, float]:
+    """Recall@k of the expected chunk ids & reciprocal rank of the first expected chunk in retrieved, best first"""
+    expected = set(expected)
+    recall = len(expected.intersection(retrieved[:k])) / len(expected) if expected else 0.0
+    rank = next((rank for rank, chunk_id in enumerate(retrieved, start=1) if chunk_id in expected), None)
+    return {"recall": recall, "reciprocal_rank": 1 / rank if rank else 0.0}
+
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+        "mean": round(float(np.mean(latencies_ms)), 3),
+    }
+
+
+def git_commit() -> Optional[str]:
+    """Commit of the checkout of this module, None outside of a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            check=True,
+            text=True,
+            timeout=10,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(
+    dataset: Dict,
+    k: int = 6,
+    retrieval: str = "hybrid",
+    embeddings: Embeddings = None,
+    embedding_model: str = HASHING_EMBEDDINGS,
+    repeat: int = 1,
+) -> Dict:
+    """
+    Index the dataset chunks into a temporary collection & answer each question repeat times with the /qa stages:
+    embed the question, search (hybrid or vector), rerank, format the context & generate with a stub llm.
+    Latencies are recorded per stage after an untimed warm-up question.
+    """
+    embeddings = embeddings or HashingEmbeddings()
+    chain = RAG_PROMPT | FakeListLLM(responses=[STUB_ANSWER]) | StrOutputParser()
+    reranked = get_reranker(QA_RERANKER, QA_RERANK_MODEL) is not None
+    n_candidates = max(k, QA_RERANK_FETCH_K) if reranked else k
+    fetch_k = max(n_candidates, QA_HYBRID_FETCH_K)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = VectorStoreManager(
+            str(Path(tmp_dir) / "chroma"),
+            load_embeddings=lambda model: embeddings,
+            lexical_index_path=str(Path(tmp_dir) / "lexical.sqlite3") if retrieval == "hybrid" else None,
+        )
+        try:
+            vector_store = manager.get_vector_store(_COLLECTION, embedding_model)
+            chunks = dataset["chunks"]
+            metadatas = [{key: value for key, value in chunk.items() if key not in ("id", "text")} for chunk in chunks]
+            index_start = time.perf_counter()
+            vector_store.add_texts(
+                [chunk["text"] for chunk in chunks], metadatas=metadatas, ids=[chunk["id"] for chunk in chunks]
+            )
+            manager.reconcile_lexical_index(_COLLECTION)
+            index_s = time.perf_counter() - index_start
+            lexical_index = manager.get_lexical_index()
+
+            def _answer(question: str) -> Dict:
+                timings = {}
+                start = time.perf_counter()
+                embedding = embeddings.embed_query(question)
+                timings["embed"] = time.perf_counter() - start
+                start = time.perf_counter()
+                if lexical_index is None:
+                    docs = vector_store.similarity_search_by_vector(embedding, k=n_candidates)
+                else:
+                    docs = hybrid_search(
+                        vector_store,
+                        lexical_index,
+                        question,
+                        k=n_candidates,
+                        fetch_k=fetch_k,
+                        rrf_k=QA_RRF_K,
+                        embedding=embedding,
+                    )
+                timings["search"] = time.perf_counter() - start
+                start = time.perf_counter()
+                scored_docs = rerank_docs(question, docs, k)
+                timings["rerank"] = time.perf_counter() - start
+                start = time.perf_counter()
+                context, _ = build_context([doc for doc, _ in scored_docs])
+                timings["format"] = time.perf_counter() - start
+                start = time.perf_counter()
+                chain.invoke({"context": context, "question": question})
+                timings["generate"] = time.perf_counter() - start
+                return {"retrieved": [doc.id for doc, _ in scored_docs], "timings": timings}
+
+            questions = dataset["questions"]
+            if questions:
+                _answer(questions[0]["question"])
+            latencies: Dict[str, List[float]] = {stage: [] for stage in (*STAGES, "total")}
+            per_question = []
+            for run in range(repeat):
+                for item in questions:
+                    answered = _answer(item["question"])
+                    for stage, seconds in answered["timings"].items():
+                        latencies[stage].append(seconds * 1000)
+                    latencies["total"].append(sum(answered["timings"].values()) * 1000)
+                    if run == 0:
+                        per_question.append(
+                            {
+                                "question": item["question"],
+                                "expected": item["expected"],
+                                "retrieved": answered["retrieved"],
+                                **retrieval_metrics(answered["retrieved"], item["expected"], k),
+                            }
+                        )
+        finally:
+            manager.close()
+
+    recalls = [item["recall"] for item in per_question] or [0.0]
+    reciprocal_ranks = [item["reciprocal_rank"] for item in per_question] or [0.0]
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "embedding_model": embedding_model,
+            "retrieval": retrieval,
+            "k": k,
+            "fetch_k": fetch_k if retrieval == "hybrid" else n_candidates,
+            "rrf_k": QA_RRF_K,
+            "reranker": QA_RERANKER,
+            "context_token_budget": QA_CONTEXT_TOKEN_BUDGET,
+            "context_assembly": QA_CONTEXT_ASSEMBLY,
+            "chunks": len(dataset["chunks"]),
+            "questions": len(dataset["questions"]),
+            "repeat": repeat,
+        },
+        "metrics": {
+            f"recall@{k}": round(float(np.mean(recalls)), 4),
+            "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        },
+        "index_s": round(index_s, 3),
+        "latency_ms": {stage: latency_summary(values) for stage, values in latencies.items() if values},
+        "questions": per_question,
+    }
+
+
+def compare_results(result: Dict, baseline: Dict) -> Dict:
+    """Change of the metrics & the p50/p95/p99 stage latencies of result against baseline, positive if larger"""
+    return {
+        "commit": baseline.get("commit"),
+        "metrics": {
+            name: round(value - baseline["metrics"][name], 4)
+            for name, value in result["metrics"].items()
+            if name in baseline.get("metrics", {})
+        },
+        "latency_ms": {
+            stage: {
+                percentile: round(value - baseline["latency_ms"][stage][percentile], 3)
+                for percentile, value in summary.items()
+                if percentile != "mean"
+            }
+            for stage, summary in result["latency_ms"].items()
+            if stage in baseline.get("latency_ms", {})
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser("Offline /qa pipeline benchmark")
+    parser.add_argument("-d", "--dataset", default=str(DEFAULT_DATASET), help="(default: %(default)s)")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this path")
+    parser.add_argument("-k", type=int, default=6, help="chunks kept per question. (default: %(default)s)")
+    parser.add_argument("--retrieval", choices=("hybrid", "vector"), default="hybrid", help="(default: %(default)s)")
+    parser.add_argument(
+        "--embedding-model",
+        default=HASHING_EMBEDDINGS,
+        help="'hashing' or a local sentence-transformers model, e.g. all-MiniLM-L6-v2. (default: %(default)s)",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="runs over the questions. (default: %(default)s)")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    if args.embedding_model == HASHING_EMBEDDINGS:
+        embeddings = HashingEmbeddings()
+    else:
+        from app.api.langchain_custom.local_embeddings import local_embedding_registry
+
+        embeddings = local_embedding_registry.get(args.embedding_model)
+    result = run_benchmark(
+        load_dataset(args.dataset),
+        k=args.k,
+        retrieval=args.retrieval,
+        embeddings=embeddings,
+        embedding_model=args.embedding_model,
+        repeat=args.repeat,
+    )
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fptr:
+            result["baseline_delta"] = compare_results(result, json.load(fptr))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fptr:
+            json.dump(result, fptr, indent=2)
+    summary = {key: value for key, value in result.items() if key != "questions"}
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
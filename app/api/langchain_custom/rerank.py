@@ -0,0 +1,146 @@
+"""
+CPU-friendly reranking of retrieved chunks & selection of the chunks put into the /qa prompt
+"""
+
+import re
+import logging
+import threading
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from app.api.langchain_custom.tokens import count_tokens
+
+logger = logging.getLogger("rerank")
+
+LEXICAL_RERANKER = "lexical"
+CROSS_ENCODER_RERANKER = "cross-encoder"
+
+_TERM_RE = re.compile(r"[\w\-]+")
+_STOPWORDS = {
+    "a",
+    "an",
+    "and",
+    "are",
+    "at",
+    "be",
+    "by",
+    "did",
+    "do",
+    "does",
+    "for",
+    "from",
+    "how",
+    "in",
+    "is",
+    "it",
+    "of",
+    "on",
+    "or",
+    "the",
+    "to",
+    "was",
+    "were",
+    "what",
+    "when",
+    "where",
+    "which",
+    "who",
+    "why",
+    "with",
+}
+
+
+def _terms(text: str) -> set:
+    return {term for term in _TERM_RE.findall(text.lower()) if term not in _STOPWORDS}
+
+
+class LexicalOverlapReranker:
+    """Scores a chunk by the fraction of the distinct query terms it contains, in [0, 1]"""
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        query_terms = _terms(query)
+        if not query_terms:
+            return [0.0] * len(texts)
+        return [len(query_terms & _terms(text)) / len(query_terms) for text in texts]
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, chunk) pairs with a small sentence-transformers cross-encoder in one batch,
+    squashed into [0, 1] with a sigmoid. The model is loaded on first use.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 32, max_length: int = 512) -> None:
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                import torch
+                from sentence_transformers import CrossEncoder
+
+                # models such as ms-marco-MiniLM declare an identity activation & would return raw logits
+                try:
+                    self._model = CrossEncoder(
+                        self.model_name, device="cpu", max_length=self.max_length, activation_fn=torch.nn.Sigmoid()
+                    )
+                except TypeError:  # sentence-transformers<4
+                    self._model = CrossEncoder(
+                        self.model_name,
+                        device="cpu",
+                        max_length=self.max_length,
+                        default_activation_function=torch.nn.Sigmoid(),
+                    )
+                logger.info("Loaded cross-encoder %s", self.model_name)
+            return self._model
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        if not texts:
+            return []
+        scores = self.model.predict([(query, text) for text in texts], batch_size=self.batch_size)
+        return [float(score) for score in scores]
+
+
+@lru_cache(maxsize=None)
+def get_reranker(name: str, model_name: Optional[str] = None):
+    """Return the process wide reranker called name, None for any other name, e.g. "none" """
+    if name == LEXICAL_RERANKER:
+        return LexicalOverlapReranker()
+    if name == CROSS_ENCODER_RERANKER:
+        return CrossEncoderReranker(model_name)
+    return None
+
+
+def select_context(
+    scored_docs: Sequence[Tuple[Document, float]],
+    threshold: float,
+    max_chunks: int,
+    token_budget: int,
+    min_chunks: int = 1,
+) -> List[Tuple[Document, float]]:
+    """
+    Best scored chunks above threshold, at most max_chunks that fit into token_budget.
+    The best min_chunks chunks are kept regardless of their score so the prompt is never empty.
+    """
+    selected, n_tokens = [], 0
+    for doc, score in sorted(scored_docs, key=lambda item: item[1], reverse=True):
+        if len(selected) >= max_chunks:
+            break
+        doc_tokens = count_tokens(doc.page_content)
+        if len(selected) >= min_chunks and (score < threshold or n_tokens + doc_tokens > token_budget):
+            continue
+        selected.append((doc, score))
+        n_tokens += doc_tokens
+    return selected
+
+
+def rerank_documents(reranker, query: str, docs: Sequence[Document]) -> List[Tuple[Document, float]]:
+    """(chunk, score) of docs scored by reranker in one batch"""
+    return list(zip(docs, reranker.score(query, [doc.page_content for doc in docs])))
@@ -0,0 +1,321 @@
+"""
+Semantic cache of question -> SQL query for text2sql
+"""
+
+import re
+import json
+import time
+import logging
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from app.core.config import (
+    SQL_SEMANTIC_CACHE_THRESHOLD,
+    SQL_SEMANTIC_CACHE_CAPACITY,
+    SQL_SEMANTIC_CACHE_PATH,
+    SQL_SEMANTIC_CACHE_EMBEDDING_MODEL,
+)
+
+logger = logging.getLogger("sql_semantic_cache")
+
+_GUARD_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?|[a-z]+")
+_CONTRACTED_NOT_RE = re.compile(r"n't\b")
+# words that change the rows a question asks for while barely moving its embedding
+_DATE_WORDS = set(
+    "today yesterday tomorrow tonight now current this last past previous next ago since before after between until "
+    "hour hours day days daily week weeks weekly month months monthly quarter year years yearly morning evening night "
+    "weekend monday tuesday wednesday thursday friday saturday sunday january february march april may june july "
+    "august september october november december".split()
+)
+_STATUS_WORDS = set(
+    "anomaly anomalies anomalous normal detected undetected failed failure failures success successful succeeded "
+    "error errors rejected accepted idle active inactive".split()
+)
+_NEGATION_WORDS = {"not", "no", "none", "never", "without", "except", "excluding", "non"}
+_GUARD_WORDS = _DATE_WORDS | _STATUS_WORDS | _NEGATION_WORDS
+
+
+def _guard_tokens(question: str) -> List[str]:
+    """
+    Numbers, date, status & negation words of a question. Questions only share SQL if they have the same guard
+    tokens, i.e. latest 5 vs latest 10, anomalies today vs yesterday or anomalies vs not anomalies
+    """
+    words = _GUARD_TOKEN_RE.findall(_CONTRACTED_NOT_RE.sub(" not", question.lower()))
+    return sorted(word for word in words if word[0].isdigit() or word in _GUARD_WORDS)
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class SQLiteSemanticCacheStore:
+    """
+    On-disk entries of the semantic sql cache keyed by (log_type, model, question), written one entry at a time.
+    Vectors are stored as float32 blobs. A single connection is shared by all threads behind a lock.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # entries of earlier releases were not keyed by the llm model
+            self._conn.execute("DROP TABLE IF EXISTS entries")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sql_entries (log_type TEXT NOT NULL, model TEXT NOT NULL, "
+                "question TEXT NOT NULL, query TEXT NOT NULL, guard TEXT NOT NULL, vector BLOB NOT NULL, "
+                "last_used REAL NOT NULL, hits INTEGER NOT NULL, PRIMARY KEY (log_type, model, question))"
+            )
+            self._conn.commit()
+
+    def load(self) -> Dict[Tuple[str, str], List[dict]]:
+        """All stored entries by (log_type, model)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT log_type, model, question, query, guard, vector, last_used, hits FROM sql_entries"
+            ).fetchall()
+        entries: Dict[Tuple[str, str], List[dict]] = {}
+        for log_type, model, question, query, guard, vector, last_used, hits in rows:
+            entries.setdefault((log_type, model), []).append(
+                {
+                    "question": question,
+                    "query": query,
+                    "guard": json.loads(guard),
+                    "vector": np.frombuffer(vector, dtype=np.float32),
+                    "last_used": last_used,
+                    "hits": hits,
+                }
+            )
+        return entries
+
+    def put(self, key: Tuple[str, str], entry: dict) -> None:
+        """Insert or replace entry of the (log_type, model) key"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sql_entries "
+                "(log_type, model, question, query, guard, vector, last_used, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    *key,
+                    entry["question"],
+                    entry["query"],
+                    json.dumps(entry["guard"]),
+                    np.asarray(entry["vector"], dtype=np.float32).tobytes(),
+                    entry["last_used"],
+                    entry["hits"],
+                ),
+            )
+            self._conn.commit()
+
+    def touch(self, key: Tuple[str, str], entry: dict) -> None:
+        """Persist the usage of entry of the (log_type, model) key"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sql_entries SET last_used = ?, hits = ? WHERE log_type = ? AND model = ? AND question = ?",
+                (entry["last_used"], entry["hits"], *key, entry["question"]),
+            )
+            self._conn.commit()
+
+    def delete(self, keys: Iterable[Tuple[str, str, str]]) -> None:
+        """Delete the (log_type, model, question) entries"""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM sql_entries WHERE log_type = ? AND model = ? AND question = ?", list(keys)
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_entries")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SemanticCacheLookup(NamedTuple):
+    """Result of a semantic cache lookup. vector is the question embedding, reusable for SemanticSQLCache.store"""
+
+    entry: Optional[dict]
+    similarity: float
+    vector: np.ndarray
+
+
+class SemanticSQLCache:
+    """
+    Capacity bounded cache of previously answered questions and their SQL queries.
+    Lookups embed the question and return the stored query of the most similar question with the same log type
+    & llm model when the cosine similarity is at least threshold and both questions have the same guard tokens.
+    The least recently used entries are evicted once capacity is reached.
+    Entries are persisted one at a time to an sqlite database at persist_path if set.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = 0.92,
+        capacity: int = 1000,
+        persist_path: Optional[str] = None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.capacity = capacity
+        self.persist_path = persist_path
+        self._entries: Dict[Tuple[str, str], List[dict]] = {}
+        self._matrices: Dict[Tuple[str, str], np.ndarray] = {}
+        self._lock = threading.RLock()
+        self._metrics = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._store: Optional[SQLiteSemanticCacheStore] = None
+        if persist_path:
+            self._load()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
+
+    def lookup(self, log_type: str, question: str, model: str = "") -> SemanticCacheLookup:
+        """Find the stored query of the nearest previously answered question for log_type & the llm model"""
+        vector = _normalize(self.embeddings.embed_query(question))
+        key = (log_type, model)
+        with self._lock:
+            entries = self._entries.get(key, [])
+            best_entry, best_similarity = None, 0.0
+            # a persisted cache from a different embedding model can not be compared
+            if entries and self._matrices[key].shape[1] == vector.shape[0]:
+                similarities = self._matrices[key] @ vector
+                guard = _guard_tokens(question)
+                for idx in np.argsort(-similarities):
+                    if similarities[idx] < self.threshold:
+                        break
+                    if entries[idx]["guard"] == guard:
+                        best_entry, best_similarity = entries[idx], float(similarities[idx])
+                        break
+            if best_entry is None:
+                self._metrics["misses"] += 1
+                return SemanticCacheLookup(None, best_similarity, vector)
+            self._metrics["hits"] += 1
+            best_entry["last_used"] = time.time()
+            best_entry["hits"] += 1
+            self._persist(lambda store: store.touch(key, best_entry))
+            return SemanticCacheLookup(dict(best_entry), best_similarity, vector)
+
+    def store(self, log_type: str, question: str, query: str, model: str = "", vector=None) -> None:
+        """Add a question and the SQL query generated by the llm model. vector is the question embedding if computed"""
+        vector = _normalize(self.embeddings.embed_query(question) if vector is None else vector)
+        key = (log_type, model)
+        with self._lock:
+            entries = self._entries.setdefault(key, [])
+            for entry in entries:
+                if entry["question"] == question:
+                    entry.update({"query": query, "last_used": time.time()})
+                    break
+            else:
+                entry = {
+                    "question": question,
+                    "query": query,
+                    "guard": _guard_tokens(question),
+                    "vector": vector,
+                    "last_used": time.time(),
+                    "hits": 0,
+                }
+                entries.append(entry)
+                self._metrics["stores"] += 1
+                evicted = self._evict()
+                self._rebuild_matrices()
+                if evicted:
+                    self._persist(lambda store: store.delete(evicted))
+            self._persist(lambda store: store.put(key, entry))
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            self._persist(lambda store: store.clear())
+
+    def stats(self) -> dict:
+        """Hit/miss metrics and cache size"""
+        with self._lock:
+            lookups = self._metrics["hits"] + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "hit_rate": self._metrics["hits"] / lookups if lookups else 0.0,
+                "size": len(self),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+            }
+
+    def _evict(self) -> List[Tuple[str, str, str]]:
+        """Drop the least recently used entries beyond capacity. Returns their (log_type, model, question)"""
+        n_evict = len(self) - self.capacity
+        if n_evict <= 0:
+            return []
+        all_entries = sorted(
+            (entry["last_used"], *key, entry["question"]) for key, entries in self._entries.items() for entry in entries
+        )
+        evicted = [tuple(entry[1:]) for entry in all_entries[:n_evict]]
+        evicted_keys = set(evicted)
+        for key, entries in self._entries.items():
+            self._entries[key] = [entry for entry in entries if (*key, entry["question"]) not in evicted_keys]
+        self._metrics["evictions"] += n_evict
+        return evicted
+
+    def _rebuild_matrices(self) -> None:
+        self._matrices = {
+            key: np.vstack([entry["vector"] for entry in entries]) for key, entries in self._entries.items() if entries
+        }
+
+    def _persist(self, write) -> None:
+        """Apply write to the on-disk store. Persistence failures never fail the cache"""
+        if self._store is None:
+            return
+        try:
+            write(self._store)
+        except sqlite3.Error as excep:
+            logger.error("Failed to persist semantic sql cache to %s: %s", self.persist_path, excep)
+
+    def _load(self) -> None:
+        try:
+            self._store = SQLiteSemanticCacheStore(self.persist_path)
+            entries = self._store.load()
+        except sqlite3.Error as excep:
+            logger.error(
+                "Failed to load semantic sql cache from %s, keeping it in memory: %s", self.persist_path, excep
+            )
+            self._store = None
+            return
+        self._entries = {
+            key: [{**entry, "vector": _normalize(entry["vector"])} for entry in key_entries]
+            for key, key_entries in entries.items()
+        }
+        evicted = self._evict()
+        if evicted:
+            self._persist(lambda store: store.delete(evicted))
+        self._rebuild_matrices()
+        logger.info("Loaded %d semantic sql cache entries from %s", len(self), self.persist_path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._store is not None:
+                self._store.close()
+            self._store = None
+
+
+@lru_cache(maxsize=1)
+def get_sql_semantic_cache() -> SemanticSQLCache:
+    """Return the process wide semantic sql cache configured from app.core.config"""
+    return SemanticSQLCache(
+        embeddings=OpenAIEmbeddings(model=SQL_SEMANTIC_CACHE_EMBEDDING_MODEL),
+        threshold=SQL_SEMANTIC_CACHE_THRESHOLD,
+        capacity=SQL_SEMANTIC_CACHE_CAPACITY,
+        persist_path=SQL_SEMANTIC_CACHE_PATH,
+    )
@@ -1,14 +1,27 @@
 import json
 import re
-from typing import Any
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import Runnable
+
+from app.api.langchain_custom.llms import load_chat_openai
 
 _THINK_BLOCK_RE = re.compile(r"<think>[\s\S]*?(?:</think>|$)", flags=re.IGNORECASE)
 _CODE_BLOCK_RE = re.compile(r"```(?:sql)?\s*(.*?)```", flags=re.IGNORECASE | re.DOTALL)
 _SQL_START_RE = re.compile(r"\b(SELECT|WITH|SHOW|DESCRIBE|EXPLAIN)\b", flags=re.IGNORECASE)
 
+# prepared text2sql runnables keyed by (log type, model, temperature, top_k, verbose)
+_TEXT2SQL_RUNNABLE_CACHE: Dict[Tuple[str, str, float, int, bool], Runnable] = {}
+_TEXT2SQL_RUNNABLE_LOCK = threading.Lock()
+
+TEXT2SQL_OUTPUT_INSTRUCTION = (
+    "Return exactly one SQL query only. Do not include reasoning, markdown, XML tags, or explanations."
+)
+TEXT2SQL_REPAIR_INSTRUCTION = "The SQL query failed with the error: {error}\nReturn a corrected SQL query."
+
 
 def _message_to_text(message: Any) -> str:
     """Convert a LangChain message payload into plain text."""
@@ -65,12 +78,77 @@ def _extract_sql_query(raw_output: str) -> str:
     return output
 
 
+def _build_text2sql_runnable(
+    text2sql_cfg_obj: object, model: str, temperature: float, top_k: int, verbose: bool
+) -> Runnable:
+    """
+    Build the prompt | llm runnable for a text2sql config.
+    The system prompt defaults to the static sql_prompt_template of the config and can be overridden per invocation
+    """
+    text2sql_prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", "{system_prompt}"),
+            ("system", TEXT2SQL_OUTPUT_INSTRUCTION),
+            ("human", "{input}"),
+            MessagesPlaceholder("repair_messages", optional=True),
+        ]
+    )
+    static_system_prompt = text2sql_cfg_obj.sql_prompt_template.format(
+        table_info=text2sql_cfg_obj.table_info, table_name=text2sql_cfg_obj.table_name, top_k=top_k
+    )
+    text2sql_model = load_chat_openai(model=model, temperature=temperature, verbose=verbose)
+    text2sql_runnable = text2sql_prompt.partial(system_prompt=static_system_prompt) | text2sql_model
+    return text2sql_runnable.with_config({"run_name": "text2sql_runnable"})
+
+
+def get_text2sql_runnable(
+    text2sql_cfg_obj: object, model: str, temperature: float, top_k: int = 5, verbose: bool = False
+) -> Runnable:
+    """
+    Return the prepared text2sql runnable for the config & llm params.
+    Runnables are built once per (log type, model, temperature, top_k) and reused across requests.
+    """
+    key = (text2sql_cfg_obj.table_name, model, temperature, top_k, verbose)
+    runnable = _TEXT2SQL_RUNNABLE_CACHE.get(key)
+    if runnable is None:
+        with _TEXT2SQL_RUNNABLE_LOCK:
+            runnable = _TEXT2SQL_RUNNABLE_CACHE.get(key)
+            if runnable is None:
+                runnable = _build_text2sql_runnable(text2sql_cfg_obj, model, temperature, top_k, verbose)
+                _TEXT2SQL_RUNNABLE_CACHE[key] = runnable
+    return runnable
+
+
+def clear_text2sql_runnable_cache() -> None:
+    """Drop all prepared text2sql runnables"""
+    with _TEXT2SQL_RUNNABLE_LOCK:
+        _TEXT2SQL_RUNNABLE_CACHE.clear()
+
+
+def _runnable_input(
+    question: str, system_prompt: Optional[str], failed_attempts: Optional[List[Tuple[str, str]]]
+) -> dict:
+    runnable_input = {"input": question}
+    if system_prompt is not None:
+        runnable_input["system_prompt"] = system_prompt
+    if failed_attempts:
+        # replay the failed queries with their database errors so the model can repair them
+        repair_messages = []
+        for failed_query, error in failed_attempts:
+            repair_messages.append(AIMessage(content=failed_query))
+            repair_messages.append(HumanMessage(content=TEXT2SQL_REPAIR_INSTRUCTION.format(error=error)))
+        runnable_input["repair_messages"] = repair_messages
+    return runnable_input
+
+
 def text_to_sql(
     question: str,
     text2sql_cfg_obj: object,
     llm_config: dict,
     top_k: int = 5,
     verbose: bool = False,
+    system_prompt: Optional[str] = None,
+    failed_attempts: Optional[List[Tuple[str, str]]] = None,
 ) -> str:
     """
     Convert plain text to sql using LLM
@@ -78,26 +156,43 @@ def text_to_sql(
         question: str = Plaintext question to convert to sql.
         text2sql_cfg_obj: object = class with prompt template & table info. eg in core/setup.py
         llm_config: dict = dict containing llm params {"model": ..., "temperature": ...}
+        system_prompt: Optional[str] = system prompt replacing the static prompt template, e.g. from Text2SQLPromptBuilder
+        failed_attempts: Optional[List[Tuple[str, str]]] = previously generated (query, error) pairs to repair
     """
     assert "model" in llm_config, "Model must be provided (model: ...)"
     assert "temperature" in llm_config, "Temperature must be provided (temperature: ...)"
-    text2sql_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", text2sql_cfg_obj.sql_prompt_template),
-            ("system", "Return exactly one SQL query only. Do not include reasoning, markdown, XML tags, or explanations.",),
-            ("human", "{input}"),
-        ]
-    )
-
-    text2sql_model = ChatOpenAI(
+    text2sql_runnable = get_text2sql_runnable(
+        text2sql_cfg_obj,
         model=llm_config["model"],
         temperature=llm_config["temperature"],
+        top_k=top_k,
         verbose=verbose,
     )
-    text2sql_runnable = text2sql_prompt.partial(table_info=text2sql_cfg_obj.table_info, top_k=top_k) | text2sql_model
-
-    llm_response = text2sql_runnable.with_config({"run_name": "text2sql_runnable"}).invoke(
-        {"input": question, "table_name": text2sql_cfg_obj.table_name}
-    )
+    llm_response = text2sql_runnable.invoke(_runnable_input(question, system_prompt, failed_attempts))
     mysql_query = _extract_sql_query(_message_to_text(llm_response))
     return mysql_query
+
+
+async def atext_to_sql(
+    question: str,
+    text2sql_cfg_obj: object,
+    llm_config: dict,
+    top_k: int = 5,
+    verbose: bool = False,
+    system_prompt: Optional[str] = None,
+    failed_attempts: Optional[List[Tuple[str, str]]] = None,
+) -> str:
+    """
+    Async version of text_to_sql using the prepared runnable's ainvoke
+    """
+    assert "model" in llm_config, "Model must be provided (model: ...)"
+    assert "temperature" in llm_config, "Temperature must be provided (temperature: ...)"
+    text2sql_runnable = get_text2sql_runnable(
+        text2sql_cfg_obj,
+        model=llm_config["model"],
+        temperature=llm_config["temperature"],
+        top_k=top_k,
+        verbose=verbose,
+    )
+    llm_response = await text2sql_runnable.ainvoke(_runnable_input(question, system_prompt, failed_attempts))
+    return _extract_sql_query(_message_to_text(llm_response))
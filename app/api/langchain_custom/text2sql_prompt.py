@@ -0,0 +1,239 @@
+"""
+Schema-aware, token-budgeted system prompts for text2sql.
+Table profiles (columns, types & a sample of distinct values or ranges) are introspected from the live database,
+cached and refreshed in the background once older than the refresh interval rather than on every request.
+"""
+
+import time
+import logging
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.api.langchain_custom.tokens import count_tokens
+from app.core.setup import TEXT2SQL_INSTRUCTIONS, pooled_mysql_conn
+from app.core.config import (
+    TEXT2SQL_PROMPT_TOKEN_BUDGET,
+    TEXT2SQL_SCHEMA_REFRESH_INTERVAL,
+    TEXT2SQL_SCHEMA_MAX_DISTINCT_VALUES,
+)
+
+logger = logging.getLogger("text2sql_prompt")
+
+# optional prompt sections in the order they are added while the token budget allows it
+PROMPT_SECTIONS = ("column_descriptions", "value_samples", "table_description", "example_questions")
+
+_RANGE_TYPES = ("float", "double", "decimal", "date", "time", "year")
+_MAX_VALUE_CHARS = 40
+_N_EXAMPLE_VALUES = 2
+
+
+class ColumnProfile(NamedTuple):
+    """
+    values: all distinct values of a low-cardinality column
+    examples: a few values of a high-cardinality text column
+    value_range: (min, max) of numeric & temporal columns
+    """
+
+    name: str
+    type: str
+    values: Optional[List[Any]] = None
+    examples: Optional[List[Any]] = None
+    value_range: Optional[Tuple[Any, Any]] = None
+
+
+class TableProfile(NamedTuple):
+    """Columns of a table. live is False if the profile was built from the static config"""
+
+    table_name: str
+    columns: List[ColumnProfile]
+    refreshed_at: float
+    live: bool
+
+
+class Text2SQLPrompt(NamedTuple):
+    """
+    system_prompt: rendered text2sql system prompt
+    n_tokens: number of tokens of system_prompt
+    sections: optional sections that fit into the token budget
+    live_schema: whether the prompt was built from the live table schema
+    """
+
+    system_prompt: str
+    n_tokens: int
+    sections: List[str]
+    live_schema: bool
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (float, Decimal)):
+        return f"{float(value):.6g}"
+    if isinstance(value, str):
+        value = value if len(value) <= _MAX_VALUE_CHARS else value[:_MAX_VALUE_CHARS] + "..."
+        return f"'{value}'"
+    return str(value)
+
+
+def introspect_table_profile(mysql_conn: Callable, table_name: str, max_distinct_values: int = 8) -> TableProfile:
+    """
+    Read the columns of table_name and profile their values.
+    Columns with at most max_distinct_values distinct values list all of them,
+    numeric & temporal columns with more values report their range and text columns a few examples.
+    """
+    columns = []
+    with mysql_conn() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SHOW COLUMNS FROM {table_name}")
+            column_rows = cursor.fetchall()
+            for row in column_rows:
+                name, col_type = row["Field"], row["Type"].lower()
+                if col_type.startswith(_RANGE_TYPES):
+                    cursor.execute(f"SELECT MIN(`{name}`) AS min_val, MAX(`{name}`) AS max_val FROM {table_name}")
+                    bounds = cursor.fetchone()
+                    columns.append(ColumnProfile(name, col_type, value_range=(bounds["min_val"], bounds["max_val"])))
+                    continue
+                cursor.execute(
+                    f"SELECT DISTINCT `{name}` AS val FROM {table_name} WHERE `{name}` IS NOT NULL LIMIT %s",
+                    (max_distinct_values + 1,),
+                )
+                values = [value_row["val"] for value_row in cursor.fetchall()]
+                if len(values) <= max_distinct_values:
+                    columns.append(ColumnProfile(name, col_type, values=sorted(values)))
+                elif "int" in col_type:
+                    cursor.execute(f"SELECT MIN(`{name}`) AS min_val, MAX(`{name}`) AS max_val FROM {table_name}")
+                    bounds = cursor.fetchone()
+                    columns.append(ColumnProfile(name, col_type, value_range=(bounds["min_val"], bounds["max_val"])))
+                else:
+                    columns.append(ColumnProfile(name, col_type, examples=values[:_N_EXAMPLE_VALUES]))
+    return TableProfile(table_name, columns, time.time(), live=True)
+
+
+def static_table_profile(text2sql_cfg_obj: object) -> TableProfile:
+    """Profile with only the column names of a text2sql config"""
+    columns = [ColumnProfile(name, "") for name in text2sql_cfg_obj.column_descriptions]
+    return TableProfile(text2sql_cfg_obj.table_name, columns, time.time(), live=False)
+
+
+def render_text2sql_prompt(text2sql_cfg_obj: object, profile: TableProfile, top_k: int, sections: List[str]) -> str:
+    """Render the system prompt of profile with the optional sections"""
+    column_lines = []
+    for column in profile.columns:
+        notes = []
+        if "column_descriptions" in sections and column.name in text2sql_cfg_obj.column_descriptions:
+            notes.append(text2sql_cfg_obj.column_descriptions[column.name])
+        if "value_samples" in sections:
+            if column.values:
+                notes.append("values " + ", ".join(_format_value(value) for value in column.values))
+            elif column.examples:
+                notes.append("e.g. " + ", ".join(_format_value(value) for value in column.examples))
+            elif column.value_range is not None and column.value_range[0] is not None:
+                notes.append(f"range {_format_value(column.value_range[0])} to {_format_value(column.value_range[1])}")
+        line = f"  {column.name} {column.type}".rstrip()
+        column_lines.append(f"{line} -- {'; '.join(notes)}" if notes else line)
+
+    prompt = TEXT2SQL_INSTRUCTIONS.format(table_name=text2sql_cfg_obj.table_name, top_k=top_k)
+    prompt += f"\n\nOnly use the following table:\n{profile.table_name} (\n" + "\n".join(column_lines) + "\n)"
+    if "table_description" in sections:
+        prompt += f"\n{text2sql_cfg_obj.table_description}"
+    if "example_questions" in sections:
+        examples = "\n".join(
+            f"{i}. {question}" for i, question in enumerate(text2sql_cfg_obj.example_questions, start=1)
+        )
+        prompt += f"\n\nHere are some examples of questions that you may get:\n{examples}"
+    return prompt
+
+
+class Text2SQLPromptBuilder:
+    """
+    Builds the minimal text2sql system prompt under token_budget from cached live table profiles.
+    The instructions, column names & types are always included, the PROMPT_SECTIONS are added in order while they fit.
+    Profiles older than refresh_interval seconds are served while being refreshed on a background thread.
+    If the table can not be introspected the builder falls back to the column names of the static config.
+    """
+
+    def __init__(
+        self,
+        mysql_conn: Callable,
+        token_budget: int = 700,
+        refresh_interval: float = 600,
+        max_distinct_values: int = 8,
+    ) -> None:
+        self.mysql_conn = mysql_conn
+        self.token_budget = token_budget
+        self.refresh_interval = refresh_interval
+        self.max_distinct_values = max_distinct_values
+        self._profiles: Dict[str, TableProfile] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        """Drop all cached table profiles"""
+        with self._lock:
+            self._profiles.clear()
+
+    def _load_profile(self, text2sql_cfg_obj: object) -> TableProfile:
+        try:
+            profile = introspect_table_profile(self.mysql_conn, text2sql_cfg_obj.table_name, self.max_distinct_values)
+            logger.info("Refreshed text2sql table profile of %s", text2sql_cfg_obj.table_name)
+        except Exception as excep:
+            logger.warning(
+                "Could not introspect %s, using the static text2sql config: %s", text2sql_cfg_obj.table_name, excep
+            )
+            profile = static_table_profile(text2sql_cfg_obj)
+        with self._lock:
+            self._profiles[text2sql_cfg_obj.table_name] = profile
+            self._refreshing.discard(text2sql_cfg_obj.table_name)
+        return profile
+
+    def get_table_profile(self, text2sql_cfg_obj: object) -> TableProfile:
+        """Return the cached table profile, loading it on first use & refreshing it in the background when stale"""
+        table_name = text2sql_cfg_obj.table_name
+        with self._lock:
+            profile = self._profiles.get(table_name)
+            stale = profile is not None and time.time() - profile.refreshed_at >= self.refresh_interval
+            start_refresh = stale and table_name not in self._refreshing
+            if start_refresh:
+                self._refreshing.add(table_name)
+        if profile is None:
+            return self._load_profile(text2sql_cfg_obj)
+        if start_refresh:
+            threading.Thread(target=self._load_profile, args=(text2sql_cfg_obj,), daemon=True).start()
+        return profile
+
+    def build(self, text2sql_cfg_obj: object, top_k: int, model: str = "gpt-4o-mini") -> Text2SQLPrompt:
+        """Assemble the text2sql system prompt of text2sql_cfg_obj under the token budget"""
+        profile = self.get_table_profile(text2sql_cfg_obj)
+        sections: List[str] = []
+        system_prompt = render_text2sql_prompt(text2sql_cfg_obj, profile, top_k, sections)
+        n_tokens = count_tokens(system_prompt, model)
+        for section in PROMPT_SECTIONS:
+            candidate = render_text2sql_prompt(text2sql_cfg_obj, profile, top_k, sections + [section])
+            n_candidate_tokens = count_tokens(candidate, model)
+            if n_candidate_tokens <= self.token_budget:
+                sections.append(section)
+                system_prompt, n_tokens = candidate, n_candidate_tokens
+        if n_tokens > self.token_budget:
+            logger.warning(
+                "text2sql prompt of %s needs %d tokens, above the budget of %d",
+                text2sql_cfg_obj.table_name,
+                n_tokens,
+                self.token_budget,
+            )
+        return Text2SQLPrompt(system_prompt, n_tokens, sections, profile.live)
+
+
+@lru_cache(maxsize=1)
+def get_text2sql_prompt_builder() -> Text2SQLPromptBuilder:
+    """Return the process wide text2sql prompt builder configured from app.core.config"""
+    return Text2SQLPromptBuilder(
+        pooled_mysql_conn,
+        token_budget=TEXT2SQL_PROMPT_TOKEN_BUDGET,
+        refresh_interval=TEXT2SQL_SCHEMA_REFRESH_INTERVAL,
+        max_distinct_values=TEXT2SQL_SCHEMA_MAX_DISTINCT_VALUES,
+    )
@@ -0,0 +1,45 @@
+"""
+Token counting with tiktoken
+"""
+
+import math
+import logging
+from functools import lru_cache
+from typing import Optional
+
+import tiktoken
+
+logger = logging.getLogger("tokens")
+
+
+@lru_cache(maxsize=16)
+def _get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception as excep:
+        logger.warning("Could not load tiktoken encoding for %s, approximating token counts: %s", model, excep)
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as excep:
+        logger.warning("Could not load tiktoken encoding cl100k_base, approximating token counts: %s", excep)
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Number of tokens of text for model. Approximated with 4 chars per token if no encoding is available"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    """The first max_tokens tokens of text for model, approximated with 4 chars per token if no encoding is available"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[: max_tokens * 4]
+    tokens = encoding.encode(text)
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,306 @@
+"""
+Application lifetime vector store client, collections & embedding clients
+"""
+
+import uuid
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import chromadb
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from app.api.langchain_custom.embedding_cache import CachedQueryEmbeddings, SQLiteEmbeddingStore, text_sha
+from app.api.langchain_custom.lexical_index import LexicalIndex
+from app.api.langchain_custom.local_embeddings import local_embedding_registry
+from app.api.langchain_custom.llms import get_shared_http_clients
+from app.models.model import EmbeddingModel
+from app.core.config import (
+    VECTOR_STORE_DIR,
+    VECTOR_STORE_COLLECTION_NAME,
+    QUERY_EMBEDDING_CACHE_CAPACITY,
+    QUERY_EMBEDDING_CACHE_PATH,
+    CHUNK_EMBEDDING_CACHE_PATH,
+    LEXICAL_INDEX_PATH,
+    LEXICAL_INDEX_MMAP_SIZE,
+)
+
+logger = logging.getLogger("vector_store")
+
+
+def load_embeddings(embedding_model: str) -> Embeddings:
+    """
+    Create the embedding client of embedding_model. OpenAI clients use the shared http connection pools,
+    local models are loaded once per process by the local embedding registry
+    """
+    if embedding_model == EmbeddingModel.HUGGINGFACE_TEXT_EMBEDDING_MODEL.value:
+        return local_embedding_registry.get(embedding_model)
+    http_client, http_async_client = get_shared_http_clients()
+    return OpenAIEmbeddings(model=embedding_model, http_client=http_client, http_async_client=http_async_client)
+
+
+class VectorStoreManager:
+    """
+    Owns the persistent chromadb client, the embedding clients and the langchain Chroma collections.
+    All objects are created once, on startup or on first use, and shared by all requests.
+    The chromadb client and the embedding clients are safe to use from concurrent requests.
+    Query embeddings are cached in memory for query_cache_capacity queries (0 disables the cache)
+    and on disk in query_cache_path if set. Chunk embeddings are stored in chunk_cache_path if set.
+    Chunk texts are indexed for bm25 search in lexical_index_path if set.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str,
+        load_embeddings: Callable[[str], Embeddings] = load_embeddings,
+        query_cache_capacity: int = 0,
+        query_cache_path: Optional[str] = None,
+        chunk_cache_path: Optional[str] = None,
+        lexical_index_path: Optional[str] = None,
+        lexical_index_mmap_size: int = 256 << 20,
+    ) -> None:
+        self.persist_directory = persist_directory
+        self._load_embeddings = load_embeddings
+        self.query_cache_capacity = query_cache_capacity
+        self.query_cache_path = query_cache_path
+        self.chunk_cache_path = chunk_cache_path
+        self.lexical_index_path = lexical_index_path
+        self.lexical_index_mmap_size = lexical_index_mmap_size
+        self._query_cache_store: Optional[SQLiteEmbeddingStore] = None
+        self._chunk_cache_store: Optional[SQLiteEmbeddingStore] = None
+        self._lexical_index: Optional[LexicalIndex] = None
+        self._client: Optional[chromadb.ClientAPI] = None
+        self._embeddings: Dict[str, Embeddings] = {}
+        self._stores: Dict[Tuple[str, str], Chroma] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def client(self) -> chromadb.ClientAPI:
+        """The persistent chromadb client, opened on first use"""
+        with self._lock:
+            if self._client is None:
+                self._client = chromadb.PersistentClient(path=self.persist_directory)
+                logger.info("Opened vector store at %s", self.persist_directory)
+            return self._client
+
+    def get_embeddings(self, embedding_model: str = EmbeddingModel.OPENAI_TEXT_EMBEDDING_MODEL.value) -> Embeddings:
+        """Return the shared embedding client of embedding_model"""
+        with self._lock:
+            if embedding_model not in self._embeddings:
+                embeddings = self._load_embeddings(embedding_model)
+                if self.query_cache_capacity > 0:
+                    if self.query_cache_path and self._query_cache_store is None:
+                        self._query_cache_store = SQLiteEmbeddingStore(self.query_cache_path)
+                    embeddings = CachedQueryEmbeddings(
+                        embeddings, embedding_model, self.query_cache_capacity, self._query_cache_store
+                    )
+                self._embeddings[embedding_model] = embeddings
+            return self._embeddings[embedding_model]
+
+    def get_chunk_embedding_store(self) -> Optional[SQLiteEmbeddingStore]:
+        """Return the content addressed store of chunk embeddings, None if disabled"""
+        with self._lock:
+            if self.chunk_cache_path and self._chunk_cache_store is None:
+                self._chunk_cache_store = SQLiteEmbeddingStore(self.chunk_cache_path)
+            return self._chunk_cache_store
+
+    def get_lexical_index(self) -> Optional[LexicalIndex]:
+        """Return the bm25 index of the chunk texts, None if disabled"""
+        with self._lock:
+            if self.lexical_index_path and self._lexical_index is None:
+                self._lexical_index = LexicalIndex(self.lexical_index_path, self.lexical_index_mmap_size)
+            return self._lexical_index
+
+    def reconcile_lexical_index(
+        self, collection_name: str = VECTOR_STORE_COLLECTION_NAME, batch_size: int = 1000
+    ) -> None:
+        """Index the chunks of collection_name missing from the lexical index & remove the chunks no longer stored"""
+        lexical_index = self.get_lexical_index()
+        if lexical_index is None:
+            return
+        collection = self.client.get_or_create_collection(collection_name)
+        stored_ids = set()
+        offset = 0
+        while True:
+            page = collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+            if not page["ids"]:
+                break
+            sources = [(metadata or {}).get("source") for metadata in page["metadatas"]]
+            lexical_index.add(collection_name, page["ids"], page["documents"], sources)
+            stored_ids.update(page["ids"])
+            offset += len(page["ids"])
+        lexical_index.delete(collection_name, lexical_index.chunk_ids(collection_name) - stored_ids)
+        logger.info("Lexical index of %s reconciled with %d chunk(s)", collection_name, len(stored_ids))
+
+    def query_cache_stats(self) -> dict:
+        """Hit/miss metrics of the query embedding cache of each embedding model"""
+        with self._lock:
+            return {
+                model: embeddings.stats()
+                for model, embeddings in self._embeddings.items()
+                if isinstance(embeddings, CachedQueryEmbeddings)
+            }
+
+    def get_vector_store(
+        self,
+        collection_name: str = VECTOR_STORE_COLLECTION_NAME,
+        embedding_model: str = EmbeddingModel.OPENAI_TEXT_EMBEDDING_MODEL.value,
+    ) -> Chroma:
+        """Return the shared langchain Chroma store of collection_name embedded with embedding_model"""
+        key = (collection_name, embedding_model)
+        with self._lock:
+            if key not in self._stores:
+                self._stores[key] = Chroma(
+                    client=self.client,
+                    collection_name=collection_name,
+                    embedding_function=self.get_embeddings(embedding_model),
+                )
+            return self._stores[key]
+
+    def forget_collection(self, collection_name: str) -> None:
+        """Drop the shared stores of collection_name, e.g. after it was rebuilt, so they are reopened on next use"""
+        with self._lock:
+            for key in [key for key in self._stores if key[0] == collection_name]:
+                del self._stores[key]
+
+    def warm_up(self, collection_name: str = VECTOR_STORE_COLLECTION_NAME) -> None:
+        """
+        Open the store & run one similarity search so that the collection index is loaded
+        and the embedding client connection is established before the first request
+        """
+        try:
+            vector_store = self.get_vector_store(collection_name)
+            if self.lexical_index_path:
+                self.reconcile_lexical_index(collection_name)
+            n_docs = vector_store._collection.count()
+            if n_docs:
+                vector_store.similarity_search("warm up", k=1)
+            logger.info("Vector store collection %s warmed up with %d document(s)", collection_name, n_docs)
+        except Exception as excep:
+            logger.warning("Vector store warm up of %s failed: %s", collection_name, excep)
+
+    def close(self) -> None:
+        """Drop the shared collections & client. They are reopened on next use"""
+        with self._lock:
+            self._stores.clear()
+            self._embeddings.clear()
+            self._client = None
+            for store in (self._query_cache_store, self._chunk_cache_store, self._lexical_index):
+                if store is not None:
+                    store.close()
+            self._query_cache_store = self._chunk_cache_store = self._lexical_index = None
+
+
+def add_embedded_documents(
+    vector_store: Chroma, documents: List[Document], vectors: List[List[float]], ids: Optional[List[str]] = None
+) -> List[str]:
+    """Write documents with precomputed vectors into the collection of vector_store, without re-embedding them"""
+    ids = ids or [str(uuid.uuid4()) for _ in documents]
+    collection = vector_store._collection
+    batch_size = vector_store._client.get_max_batch_size()
+    for start in range(0, len(documents), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=vectors[start:end],
+            documents=[doc.page_content for doc in documents[start:end]],
+            metadatas=[doc.metadata or None for doc in documents[start:end]],
+        )
+    return ids
+
+
+def metadata_where(
+    sources: Optional[List[str]] = None,
+    file_types: Optional[List[str]] = None,
+    ingested_after: Optional[datetime] = None,
+    ingested_before: Optional[datetime] = None,
+) -> Optional[Dict]:
+    """Chroma where clause of the chunks of any of sources & file_types ingested in the date range, None for all"""
+    clauses = []
+    if sources:
+        clauses.append({"source": {"$in": list(sources)}})
+    if file_types:
+        extensions = [f".{file_type.lower().lstrip('.')}" for file_type in file_types]
+        clauses.append({"file_type": {"$in": extensions}})
+    if ingested_after is not None:
+        clauses.append({"ingested_at": {"$gte": int(ingested_after.timestamp())}})
+    if ingested_before is not None:
+        clauses.append({"ingested_at": {"$lte": int(ingested_before.timestamp())}})
+    if len(clauses) > 1:
+        return {"$and": clauses}
+    return clauses[0] if clauses else None
+
+
+def stable_chunk_ids(source: str, texts: List[str]) -> List[str]:
+    """
+    Content derived chunk ids of the texts of source: the sha of the source, the text & its occurrence number,
+    so a chunk keeps its id across re-uploads of an edited file wherever it moves to
+    """
+    occurrences: Counter = Counter()
+    ids = []
+    for text in texts:
+        ids.append(text_sha(f"{source}\x00{occurrences[text]}\x00{text}")[:40])
+        occurrences[text] += 1
+    return ids
+
+
+class SourceChunkDiff(NamedTuple):
+    """Chunk ids of a source to add, to keep & to delete from the collection"""
+
+    new_ids: List[str]
+    kept_ids: List[str]
+    stale_ids: List[str]
+
+
+def source_has_version(vector_store: Chroma, source: str, file_md5: str) -> bool:
+    """Whether the chunks stored for source are those of the file with md5 file_md5"""
+    where = {"$and": [{"source": source}, {"file_md5": file_md5}]}
+    return bool(vector_store._collection.get(where=where, limit=1, include=[])["ids"])
+
+
+def diff_source_chunks(vector_store: Chroma, source: str, chunk_ids: List[str]) -> SourceChunkDiff:
+    """Diff the chunk ids of a new version of source against the chunks stored for source"""
+    stored_ids = set(vector_store._collection.get(where={"source": source}, include=[])["ids"])
+    new_ids = [chunk_id for chunk_id in chunk_ids if chunk_id not in stored_ids]
+    kept_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in stored_ids]
+    stale_ids = sorted(stored_ids - set(chunk_ids))
+    return SourceChunkDiff(new_ids, kept_ids, stale_ids)
+
+
+def sync_source_chunks(
+    vector_store: Chroma,
+    diff: SourceChunkDiff,
+    new_documents: List[Document],
+    new_vectors: List[List[float]],
+    kept_documents: List[Document],
+) -> None:
+    """
+    Apply diff to the collection: add the new chunks with their precomputed vectors,
+    refresh the metadata of the kept chunks without re-embedding them & delete the stale chunks
+    """
+    collection = vector_store._collection
+    batch_size = vector_store._client.get_max_batch_size()
+    add_embedded_documents(vector_store, new_documents, new_vectors, ids=diff.new_ids)
+    for start in range(0, len(diff.kept_ids), batch_size):
+        end = start + batch_size
+        collection.update(
+            ids=diff.kept_ids[start:end], metadatas=[doc.metadata or None for doc in kept_documents[start:end]]
+        )
+    for start in range(0, len(diff.stale_ids), batch_size):
+        collection.delete(ids=diff.stale_ids[start : start + batch_size])
+
+
+# process wide vector store manager, opened by the app lifespan
+vector_store_manager = VectorStoreManager(
+    VECTOR_STORE_DIR,
+    query_cache_capacity=QUERY_EMBEDDING_CACHE_CAPACITY,
+    query_cache_path=QUERY_EMBEDDING_CACHE_PATH or None,
+    chunk_cache_path=CHUNK_EMBEDDING_CACHE_PATH or None,
+    lexical_index_path=LEXICAL_INDEX_PATH or None,
+    lexical_index_mmap_size=LEXICAL_INDEX_MMAP_SIZE,
+)
@@ -0,0 +1,326 @@
+"""
+Vector store maintenance: collection stats, de-duplication, index rebuilds, HNSW tuning & a retrieval benchmark.
+Rebuilds copy the collection into a new one and swap it in, run them while no ingestion is writing to the collection.
+
+    python -m app.api.langchain_custom.vector_store_admin stats
+    python -m app.api.langchain_custom.vector_store_admin dedupe
+    python -m app.api.langchain_custom.vector_store_admin compact
+    python -m app.api.langchain_custom.vector_store_admin hnsw --M 32 --ef-construction 200 --ef-search 64
+    python -m app.api.langchain_custom.vector_store_admin benchmark --settings 16,100,10 16,100,50 32,200,100
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import chromadb
+import numpy as np
+
+logger = logging.getLogger("vector_store_admin")
+
+HNSW_PARAMS = ("M", "ef_construction", "ef_search")
+# collection metadata keys of the hnsw params & distance space
+_HNSW_METADATA_KEYS = {
+    "M": "hnsw:M",
+    "ef_construction": "hnsw:construction_ef",
+    "ef_search": "hnsw:search_ef",
+    "space": "hnsw:space",
+}
+# collection configuration keys of chromadb >= 1.0
+_HNSW_CONFIG_KEYS = {
+    "M": "max_neighbors",
+    "ef_construction": "ef_construction",
+    "ef_search": "ef_search",
+    "space": "space",
+}
+_HNSW_DEFAULTS = {"M": 16, "ef_construction": 100, "ef_search": 100, "space": "l2"}
+_REBUILD_SUFFIX = "-rebuild"
+
+
+def disk_usage(path: str) -> int:
+    """Bytes of all files under path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for fname in files:
+            try:
+                total += os.path.getsize(os.path.join(root, fname))
+            except OSError:
+                pass
+    return total
+
+
+def hnsw_params(collection) -> Dict:
+    """M, ef_construction, ef_search & space of the hnsw index of collection"""
+    configuration = getattr(collection, "configuration", None) or {}
+    hnsw = configuration.get("hnsw") if isinstance(configuration, dict) else None
+    if hnsw:
+        return {param: hnsw.get(key, _HNSW_DEFAULTS[param]) for param, key in _HNSW_CONFIG_KEYS.items()}
+    metadata = collection.metadata or {}
+    return {param: metadata.get(key, _HNSW_DEFAULTS[param]) for param, key in _HNSW_METADATA_KEYS.items()}
+
+
+def iter_records(collection, include: Sequence[str] = ("embeddings",), batch_size: int = 1000) -> Iterator[Dict]:
+    """Yield the records of collection in pages of batch_size as dicts of ids & the included fields"""
+    offset = 0
+    while True:
+        page = collection.get(limit=batch_size, offset=offset, include=list(include))
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def _embedding_key(embedding) -> bytes:
+    return hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).digest()
+
+
+def collection_stats(client: chromadb.ClientAPI, name: str, persist_directory: Optional[str] = None) -> Dict:
+    """Size, hnsw params & duplicate ratios of a collection and the on-disk footprint of the vector store"""
+    collection = client.get_collection(name)
+    n_records = collection.count()
+    embedding_keys, document_keys = set(), set()
+    dimension = None
+    for page in iter_records(collection, include=("embeddings", "documents")):
+        for embedding, document in zip(page["embeddings"], page["documents"]):
+            dimension = dimension or len(embedding)
+            embedding_keys.add(_embedding_key(embedding))
+            document_keys.add(hashlib.sha1((document or "").encode("utf-8")).digest())
+    n_duplicate_embeddings = n_records - len(embedding_keys)
+    stats = {
+        "collection": name,
+        "count": n_records,
+        "dimension": dimension,
+        "hnsw": hnsw_params(collection),
+        "duplicate_embeddings": n_duplicate_embeddings,
+        "duplicate_embedding_ratio": round(n_duplicate_embeddings / n_records, 4) if n_records else 0.0,
+        "duplicate_documents": n_records - len(document_keys),
+    }
+    if persist_directory:
+        stats["disk_bytes"] = disk_usage(persist_directory)
+    return stats
+
+
+def dedupe_collection(collection, batch_size: int = 1000) -> int:
+    """Delete records whose embedding is identical to an earlier record. Returns the number of deleted records"""
+    seen, duplicate_ids = set(), []
+    for page in iter_records(collection, include=("embeddings",), batch_size=batch_size):
+        for record_id, embedding in zip(page["ids"], page["embeddings"]):
+            key = _embedding_key(embedding)
+            if key in seen:
+                duplicate_ids.append(record_id)
+            else:
+                seen.add(key)
+    for start in range(0, len(duplicate_ids), batch_size):
+        collection.delete(ids=duplicate_ids[start : start + batch_size])
+    logger.info("Deleted %d duplicate record(s) from %s", len(duplicate_ids), collection.name)
+    return len(duplicate_ids)
+
+
+def _create_collection(client: chromadb.ClientAPI, name: str, params: Dict, metadata: Optional[Dict]):
+    metadata = {key: value for key, value in (metadata or {}).items() if not key.startswith("hnsw:")}
+    if int(chromadb.__version__.split(".")[0]) >= 1:
+        configuration = {"hnsw": {_HNSW_CONFIG_KEYS[param]: value for param, value in params.items()}}
+        return client.create_collection(name, configuration=configuration, metadata=metadata or None)
+    metadata.update({_HNSW_METADATA_KEYS[param]: value for param, value in params.items()})
+    return client.create_collection(name, metadata=metadata)
+
+
+def copy_collection(source, target, dedupe: bool = False, batch_size: int = 1000) -> int:
+    """Copy all records of source into target, skipping identical embeddings if dedupe. Returns the copied count"""
+    seen, n_copied = set(), 0
+    for page in iter_records(source, include=("embeddings", "documents", "metadatas"), batch_size=batch_size):
+        keep = range(len(page["ids"]))
+        if dedupe:
+            keep = []
+            for i, embedding in enumerate(page["embeddings"]):
+                key = _embedding_key(embedding)
+                if key not in seen:
+                    seen.add(key)
+                    keep.append(i)
+        if not keep:
+            continue
+        target.add(
+            ids=[page["ids"][i] for i in keep],
+            embeddings=[page["embeddings"][i] for i in keep],
+            documents=[page["documents"][i] for i in keep],
+            metadatas=[page["metadatas"][i] or None for i in keep],
+        )
+        n_copied += len(keep)
+    return n_copied
+
+
+def rebuild_collection(
+    client: chromadb.ClientAPI, name: str, hnsw: Optional[Dict] = None, dedupe: bool = False
+) -> Dict:
+    """
+    Rebuild the index of a collection by copying it into a new collection with the hnsw params updated by hnsw
+    and swapping it in. Drops deleted records left in the old index & optionally duplicate embeddings.
+    """
+    collection = client.get_collection(name)
+    params = {**hnsw_params(collection), **{key: value for key, value in (hnsw or {}).items() if value is not None}}
+    rebuild_name = name + _REBUILD_SUFFIX
+    try:
+        client.delete_collection(rebuild_name)
+    except Exception:
+        pass
+    start = time.perf_counter()
+    rebuilt = _create_collection(client, rebuild_name, params, collection.metadata)
+    n_before = collection.count()
+    n_copied = copy_collection(collection, rebuilt, dedupe=dedupe)
+    client.delete_collection(name)
+    rebuilt.modify(name=name)
+    elapsed = time.perf_counter() - start
+    logger.info("Rebuilt %s with %d of %d record(s) in %.2fs, hnsw %s", name, n_copied, n_before, elapsed, params)
+    return {
+        "collection": name,
+        "count": n_copied,
+        "removed_duplicates": n_before - n_copied,
+        "hnsw": params,
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+def set_hnsw_params(
+    client: chromadb.ClientAPI,
+    name: str,
+    M: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> Dict:
+    """
+    Set the hnsw params of a collection. ef_search is changed in place where chromadb supports it,
+    M & ef_construction only apply to a rebuilt index so the collection is rebuilt
+    """
+    collection = client.get_collection(name)
+    current = hnsw_params(collection)
+    if (M is None or M == current["M"]) and (ef_construction is None or ef_construction == current["ef_construction"]):
+        if ef_search is None or ef_search == current["ef_search"]:
+            return {"collection": name, "hnsw": current, "rebuilt": False}
+        try:
+            collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+            return {"collection": name, "hnsw": hnsw_params(client.get_collection(name)), "rebuilt": False}
+        except TypeError:
+            # chromadb < 1.0 can not modify the hnsw configuration
+            pass
+    result = rebuild_collection(client, name, {"M": M, "ef_construction": ef_construction, "ef_search": ef_search})
+    return {"collection": name, "hnsw": result["hnsw"], "rebuilt": True}
+
+
+def _exact_neighbors(embeddings: np.ndarray, queries: np.ndarray, k: int, space: str) -> List[set]:
+    if space == "cosine":
+        normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True).clip(1e-12)
+        scores = -(queries / np.linalg.norm(queries, axis=1, keepdims=True).clip(1e-12)) @ normed.T
+    elif space == "ip":
+        scores = -queries @ embeddings.T
+    else:
+        scores = (queries**2).sum(axis=1, keepdims=True) - 2 * queries @ embeddings.T + (embeddings**2).sum(axis=1)
+    return [set(row) for row in np.argsort(scores, axis=1)[:, :k]]
+
+
+def benchmark_hnsw(
+    client: chromadb.ClientAPI,
+    name: str,
+    settings: List[Dict],
+    n_queries: int = 100,
+    k: int = 6,
+    seed: int = 0,
+) -> List[Dict]:
+    """
+    Measure the query latency & recall@k against exact search of a copy of the collection built with each hnsw
+    setting ({"M", "ef_construction", "ef_search"}). Queries are stored embeddings with a little gaussian noise.
+    """
+    collection = client.get_collection(name)
+    ids, embeddings = [], []
+    for page in iter_records(collection, include=("embeddings",)):
+        ids.extend(page["ids"])
+        embeddings.extend(page["embeddings"])
+    if not ids:
+        raise ValueError(f"collection {name} is empty")
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(ids), size=min(n_queries, len(ids)), replace=False)
+    queries = embeddings[sample] + rng.normal(0, embeddings.std() * 0.05, size=(len(sample), embeddings.shape[1]))
+    queries = queries.astype(np.float32)
+    k = min(k, len(ids))
+    space = hnsw_params(collection)["space"]
+    exact = [{ids[i] for i in neighbors} for neighbors in _exact_neighbors(embeddings, queries, k, space)]
+
+    results = []
+    bench_name = name + "-benchmark"
+    for setting in settings:
+        params = {**hnsw_params(collection), **{key: value for key, value in setting.items() if value is not None}}
+        try:
+            client.delete_collection(bench_name)
+        except Exception:
+            pass
+        start = time.perf_counter()
+        bench = _create_collection(client, bench_name, params, None)
+        copy_collection(collection, bench)
+        build_s = time.perf_counter() - start
+        latencies, recalls = [], []
+        for query, truth in zip(queries, exact):
+            start = time.perf_counter()
+            found = bench.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(truth.intersection(found)) / k)
+        client.delete_collection(bench_name)
+        results.append(
+            {
+                "M": params["M"],
+                "ef_construction": params["ef_construction"],
+                "ef_search": params["ef_search"],
+                "build_s": round(build_s, 3),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+                f"recall@{k}": round(float(np.mean(recalls)), 4),
+            }
+        )
+    return results
+
+
+def _parse_setting(value: str) -> Dict:
+    """M,ef_construction,ef_search with empty fields keeping the collection value, e.g. 32,200,64 or ,,64"""
+    fields = value.split(",")
+    if len(fields) != 3:
+        raise argparse.ArgumentTypeError(f"expected M,ef_construction,ef_search, got {value}")
+    return {param: int(field) if field else None for param, field in zip(HNSW_PARAMS, fields)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from app.api.langchain_custom.vector_store import vector_store_manager
+    from app.core.config import VECTOR_STORE_COLLECTION_NAME, VECTOR_STORE_DIR
+
+    parser = argparse.ArgumentParser("Vector store maintenance")
+    parser.add_argument("command", choices=("stats", "dedupe", "compact", "hnsw", "benchmark"))
+    parser.add_argument("-c", "--collection", default=VECTOR_STORE_COLLECTION_NAME, help="(default: %(default)s)")
+    parser.add_argument("--M", type=int, help="hnsw max neighbors per node")
+    parser.add_argument("--ef-construction", type=int, help="hnsw candidate list size while building")
+    parser.add_argument("--ef-search", type=int, help="hnsw candidate list size while searching")
+    parser.add_argument("--settings", type=_parse_setting, nargs="+", help="benchmark M,ef_construction,ef_search")
+    parser.add_argument("--n-queries", type=int, default=100, help="benchmark queries. (default: %(default)s)")
+    parser.add_argument("-k", type=int, default=6, help="benchmark recall@k. (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    client = vector_store_manager.client
+    if args.command == "stats":
+        result = collection_stats(client, args.collection, VECTOR_STORE_DIR)
+    elif args.command == "dedupe":
+        result = {"collection": args.collection, "deleted": dedupe_collection(client.get_collection(args.collection))}
+    elif args.command == "compact":
+        result = rebuild_collection(client, args.collection)
+    elif args.command == "hnsw":
+        result = set_hnsw_params(client, args.collection, args.M, args.ef_construction, args.ef_search)
+    else:
+        settings = args.settings or [
+            {"M": args.M, "ef_construction": args.ef_construction, "ef_search": args.ef_search}
+        ]
+        result = benchmark_hnsw(client, args.collection, settings, n_queries=args.n_queries, k=args.k)
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Dictionary encoding of low-cardinality log columns
+"""
+
+import logging
+import threading
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger("log_format_api")
+
+
+def encoded_column_name(column: str) -> str:
+    """Return the data table column that stores the dictionary id of column"""
+    return f"{column}_id"
+
+
+class LogDictionaryEncoder:
+    """
+    Maps text values to the integer ids of their dictionary tables.
+    Known mappings are kept in an in-process cache so that only unseen values hit the database.
+    """
+
+    def __init__(self) -> None:
+        self._cache: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        """Drop all cached mappings"""
+        with self._lock:
+            self._cache.clear()
+
+    def get_ids(self, mysql_conn, dict_tb_name: str, values: Iterable[str]) -> Dict[str, int]:
+        """
+        Return {value: id} for all values, inserting unseen values into dict_tb_name.
+        New dictionary entries are committed on their own connection so that the ids stay
+        valid even if the caller's log insertion transaction is rolled back.
+        """
+        values = set(values)
+        with self._lock:
+            tb_cache = self._cache.setdefault(dict_tb_name, {})
+            missing = sorted(values - tb_cache.keys())
+
+        if missing:
+            placeholders = ", ".join(["%s"] * len(missing))
+            with mysql_conn() as conn:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.executemany(
+                            f"INSERT IGNORE INTO {dict_tb_name} (value) VALUES (%s)",
+                            [(value,) for value in missing],
+                        )
+                        cursor.execute(
+                            f"SELECT id, value FROM {dict_tb_name} WHERE value IN ({placeholders})",
+                            tuple(missing),
+                        )
+                        rows = cursor.fetchall()
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            logger.info("Added %d value(s) to dictionary table %s", len(missing), dict_tb_name)
+            with self._lock:
+                tb_cache.update({row["value"]: row["id"] for row in rows})
+
+        with self._lock:
+            unresolved = values - tb_cache.keys()
+            if unresolved:
+                raise ValueError(f"Could not resolve dictionary ids in {dict_tb_name} for {sorted(unresolved)}")
+            return {value: tb_cache[value] for value in values}
+
+    def encode_log_obj_list(self, mysql_conn, log_obj_list: List[dict], encoded_columns: Dict[str, str]) -> List[dict]:
+        """
+        Replace each column in encoded_columns ({column: dict_tb_name}) with its dictionary id column.
+        Column order of the log objects is preserved.
+        """
+        id_maps = {
+            column: self.get_ids(mysql_conn, dict_tb_name, (log_obj[column] for log_obj in log_obj_list))
+            for column, dict_tb_name in encoded_columns.items()
+        }
+        encoded_log_obj_list = []
+        for log_obj in log_obj_list:
+            encoded_log_obj_list.append(
+                {
+                    (encoded_column_name(col) if col in id_maps else col): (
+                        id_maps[col][val] if col in id_maps else val
+                    )
+                    for col, val in log_obj.items()
+                }
+            )
+        return encoded_log_obj_list
+
+
+# process wide encoder shared by all log insertions
+log_dict_encoder = LogDictionaryEncoder()
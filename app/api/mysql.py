@@ -2,11 +2,13 @@
 pymysql api functions
 """
 
-from typing import List, Tuple, Sequence
+from typing import Iterator, List, Optional, Tuple, Sequence
 from contextlib import contextmanager
 import re
 import logging
+import threading
 import pymysql
+from pymysql.cursors import SSDictCursor
 
 logger = logging.getLogger("mysql_api")
 
@@ -159,6 +161,78 @@ def run_sql_script(
         return {"status": "failed", "message": f"MySQL script execution error: {excep}"}
 
 
+def stream_sql_script(
+    mysql_conn, sql_script: str, params: Sequence | None = None, batch_size: int = 500
+) -> Iterator[List[dict]]:
+    """
+    Execute a read-only SQL script on a server-side cursor and yield the result rows in batches of batch_size.
+    Rows are not buffered client side, so the first batch is available before the full result set is read.
+    Raises ValueError if the script fails validation & pymysql.Error if the execution fails.
+    """
+    is_valid, validation_result = validate_sql_script(sql_script, allow_write=False)
+    if not is_valid:
+        raise ValueError(validation_result)
+
+    with mysql_conn() as conn:
+        # closing the connection of an abandoned stream discards the unread rows without draining them
+        cursor = conn.cursor(SSDictCursor)
+        cursor.execute(validation_result, tuple(params) if params else None)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield list(rows)
+        cursor.close()
+        logger.info("SQL script executed successfully, streamed results. ✅️")
+
+
+class RowBatchReader:
+    """
+    Reads the row batches of a stream_sql_script generator one batch per call, e.g. from worker threads.
+    close may be called while a read is still running in another thread: it waits for that read to finish
+    before closing the generator, so the server-side cursor & connection are always released.
+    """
+
+    def __init__(self, rows_iter: Iterator[List[dict]]) -> None:
+        self._rows_iter = rows_iter
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def read(self) -> Optional[List[dict]]:
+        """Next batch of rows, None once the result set is exhausted or the reader is closed"""
+        with self._lock:
+            if self._closed:
+                return None
+            return next(self._rows_iter, None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._rows_iter.close()
+
+
+def explain_sql_script(mysql_conn, sql_script: str, params: Sequence | None = None) -> dict:
+    """
+    Dry run a read-only SQL script with EXPLAIN to check its syntax, tables & columns without executing it.
+    Statements that can not be explained (SHOW, DESCRIBE, EXPLAIN) are only validated.
+    """
+    is_valid, validation_result = validate_sql_script(sql_script, allow_write=False)
+    if not is_valid:
+        return {"status": "failed", "message": validation_result}
+    if not validation_result.upper().startswith(("SELECT", "WITH")):
+        return {"status": "success", "message": "SQL script validated, EXPLAIN skipped."}
+
+    try:
+        with mysql_conn() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"EXPLAIN {validation_result}", tuple(params) if params else None)
+                cursor.fetchall()
+    except pymysql.Error as excep:
+        logger.warning("%s: SQL script EXPLAIN failed", excep)
+        return {"status": "failed", "message": f"MySQL script execution error: {excep}"}
+    return {"status": "success", "message": "SQL script passed EXPLAIN."}
+
+
 def insert_bulk_data_into_sql(mysql_conn, tb_name, data_dicts: list, commit: bool = True, conn=None) -> dict:
     """
     Insert multiple records into a MySQL table with param binding. Efficiently handles bulk inserts.
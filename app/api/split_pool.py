@@ -0,0 +1,80 @@
+"""
+Document extraction & splitting off the event loop, in a pool of worker processes.
+PDFs are extracted in parallel page ranges.
+"""
+
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional
+
+from langchain_core.documents import Document
+
+from app.utils.chunking import count_pdf_pages, split_file, split_pdf_pages
+from app.core.config import SPLIT_PROCESS_WORKERS, PDF_PAGES_PER_TASK
+
+logger = logging.getLogger("split_pool")
+
+
+class SplitPool:
+    """
+    Runs split_file in max_workers spawned worker processes, or in threads if max_workers is 0.
+    PDFs are split in ranges of pages_per_task pages that run concurrently and are reassembled in page order,
+    so the chunks are the same as splitting the whole file in one task.
+    """
+
+    def __init__(self, max_workers: int = 2, pages_per_task: int = 16) -> None:
+        self.max_workers = max_workers
+        self.pages_per_task = max(1, pages_per_task)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Optional[ProcessPoolExecutor]:
+        """The worker process pool, started on first use. None if disabled"""
+        with self._lock:
+            if self._executor is None and self.max_workers > 0:
+                # spawn as forking a process running threads & sqlite/http connections is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info("Started %d document splitting process(es)", self.max_workers)
+            return self._executor
+
+    async def _run(self, func: Callable, *args):
+        executor = self.executor
+        if executor is None:
+            return await asyncio.to_thread(func, *args)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # a crashed worker, e.g. killed for memory, breaks the pool. Start a new one on next use
+            logger.error("Document splitting process pool broke, restarting it on next use")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    async def split(self, fpath: str, f_ext: str) -> List[Document]:
+        """Load & split the stored file at fpath with the splitting strategy of f_ext"""
+        if f_ext != ".pdf":
+            return await self._run(split_file, fpath, f_ext)
+        n_pages = await self._run(count_pdf_pages, fpath)
+        ranges = [(start, start + self.pages_per_task) for start in range(0, n_pages, self.pages_per_task)]
+        results = await asyncio.gather(*(self._run(split_pdf_pages, fpath, start, end) for start, end in ranges))
+        return [split for range_splits in results for split in range_splits]
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, they are restarted on next use"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# process wide splitting pool, shut down by the app lifespan
+split_pool = SplitPool(max_workers=SPLIT_PROCESS_WORKERS, pages_per_task=PDF_PAGES_PER_TASK)
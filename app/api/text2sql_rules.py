@@ -0,0 +1,360 @@
+"""
+Deterministic rule-based text2sql for common analytical questions.
+Questions matched with high confidence are answered with parameterised SQL templates without calling an LLM.
+"""
+
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.models.model import LogFileType
+
+MAX_RULE_LIMIT = 1000
+
+_WORD_RE = re.compile(r"[a-z_]+|\d{4}-\d{2}-\d{2}|\d+")
+_DATE_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+_INT_RE = re.compile(r"(?<![\d-])(\d+)(?![\d-])")
+# integers right after a limit word are row counts, unless they are a time span, e.g. "last 30 days"
+_LIMIT_RE = re.compile(
+    r"\b(?:latest|top|last|first)\s+(\d+)(?![\d-])(?!\s*(?:seconds?|minutes?|hours?|days?|weeks?|months?|years?)\b)"
+)
+_NEGATION_RE = re.compile(r"\b(?:not|no|without|except|excluding|non)\b|n't\b")
+
+_STOPWORDS = {
+    "a",
+    "all",
+    "an",
+    "any",
+    "are",
+    "been",
+    "by",
+    "can",
+    "could",
+    "do",
+    "does",
+    "each",
+    "for",
+    "from",
+    "get",
+    "give",
+    "has",
+    "have",
+    "how",
+    "i",
+    "in",
+    "is",
+    "it",
+    "list",
+    "me",
+    "of",
+    "on",
+    "per",
+    "please",
+    "return",
+    "show",
+    "tell",
+    "that",
+    "the",
+    "there",
+    "to",
+    "us",
+    "was",
+    "we",
+    "were",
+    "what",
+    "which",
+    "with",
+    "you",
+    "find",
+    "fetch",
+    "display",
+}
+_SUBJECT_WORDS = {"log", "logs", "record", "records", "entry", "entries", "row", "rows", "data", "table", "observed"}
+
+
+class LogTypeRuleSpec(NamedTuple):
+    """Table specific columns & vocabulary used by the sql intent rules"""
+
+    table_name: str
+    columns: List[str]
+    status_column: str
+    subject_words: set
+    status_filter: Optional[str] = None  # filter for rows with a positive status, e.g. detected anomalies
+    status_filter_words: set = set()
+    status_filter_pattern: Optional[re.Pattern] = None  # questions asking for the positive status only
+
+
+LOG_TYPE_RULE_SPECS: Dict[str, LogTypeRuleSpec] = {
+    LogFileType.ANOMALY_DETECTION_LOG.value: LogTypeRuleSpec(
+        table_name=LogFileType.ANOMALY_DETECTION_LOG.value,
+        columns=["ID", "log_fid", "timestamp", "inference_time", "prediction"],
+        status_column="prediction",
+        subject_words={"anomaly", "detection", "detections", "prediction", "predictions"},
+        status_filter="prediction = 1",
+        status_filter_words={"anomalies", "anomalous", "detected"},
+        # "anomaly" names the model in "anomaly detection" or "anomaly predictions", not the positive status
+        status_filter_pattern=re.compile(
+            r"\banomal(?:y|ies|ous)\b(?!\s+(?:detections?|predictions?|models?|scores?)\b)|\bdetected\b"
+        ),
+    ),
+    LogFileType.RTA_WORKER_SWITCH_LOG.value: LogTypeRuleSpec(
+        table_name=LogFileType.RTA_WORKER_SWITCH_LOG.value,
+        columns=["ID", "log_fid", "timestamp", "goal_type", "rta_status"],
+        status_column="rta_status",
+        subject_words={"rta", "worker", "switch", "status", "statuses"},
+    ),
+}
+
+
+class SQLIntentMatch(NamedTuple):
+    """A question matched to a parameterised SQL template"""
+
+    intent: str
+    query: str
+    params: Tuple
+    confidence: float
+
+
+class SQLIntentRule(NamedTuple):
+    """
+    patterns: regexes that must all match the lower-cased question
+    vocabulary: words the rule accounts for, used to score how much of the question the rule explains
+    build: func(question, spec, top_k) -> (query, params)
+    """
+
+    intent: str
+    patterns: List[re.Pattern]
+    vocabulary: set
+    build: Callable[[str, LogTypeRuleSpec, int], Tuple[str, Tuple]]
+    log_types: Optional[set] = None  # None for all log types
+
+
+def _limit(question: str, default: int) -> int:
+    """Row count following a limit word as in "top 3" or "latest 10", default if there is none"""
+    match = _LIMIT_RE.search(question.lower())
+    limit = int(match.group(1)) if match else default
+    return max(1, min(limit, MAX_RULE_LIMIT))
+
+
+def _status_requested(question: str, spec: LogTypeRuleSpec) -> bool:
+    """Whether the question asks for rows with the positive status only, e.g. anomalies"""
+    return spec.status_filter_pattern is not None and spec.status_filter_pattern.search(question.lower()) is not None
+
+
+def _status_where(question: str, spec: LogTypeRuleSpec) -> List[str]:
+    return [spec.status_filter] if spec.status_filter and _status_requested(question, spec) else []
+
+
+def _where_clause(conditions: List[str]) -> str:
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _build_latest_records(question: str, spec: LogTypeRuleSpec, top_k: int) -> Tuple[str, Tuple]:
+    where = _where_clause(_status_where(question, spec))
+    query = f"SELECT {', '.join(spec.columns)} FROM {spec.table_name}{where} ORDER BY timestamp DESC LIMIT %s"
+    return query, (_limit(question, top_k),)
+
+
+def _build_count_today(question: str, spec: LogTypeRuleSpec, top_k: int) -> Tuple[str, Tuple]:
+    where = _where_clause(["DATE(timestamp) = CURRENT_DATE"] + _status_where(question, spec))
+    return f"SELECT COUNT(*) AS count FROM {spec.table_name}{where}", ()
+
+
+def _build_top_inference_times(question: str, spec: LogTypeRuleSpec, top_k: int) -> Tuple[str, Tuple]:
+    query = f"SELECT ID, timestamp, inference_time FROM {spec.table_name} ORDER BY inference_time DESC LIMIT %s"
+    return query, (_limit(question, top_k),)
+
+
+def _build_status_distribution(question: str, spec: LogTypeRuleSpec, top_k: int) -> Tuple[str, Tuple]:
+    conditions = ["DATE(timestamp) = CURRENT_DATE"] if re.search(r"\btoday\b", question.lower()) else []
+    query = (
+        f"SELECT {spec.status_column}, COUNT(*) AS count FROM {spec.table_name}{_where_clause(conditions)} "
+        f"GROUP BY {spec.status_column} ORDER BY count DESC"
+    )
+    return query, ()
+
+
+def _build_most_common_goal_type(question: str, spec: LogTypeRuleSpec, top_k: int) -> Tuple[str, Tuple]:
+    query = (
+        f"SELECT goal_type, COUNT(*) AS count FROM {spec.table_name} GROUP BY goal_type ORDER BY count DESC LIMIT %s"
+    )
+    return query, (_limit(question, 1),)
+
+
+def _build_records_on_date(question: str, spec: LogTypeRuleSpec, top_k: int) -> Tuple[str, Tuple]:
+    date = _DATE_RE.search(question).group(1)
+    where = _where_clause(["DATE(timestamp) = %s"] + _status_where(question, spec))
+    query = f"SELECT {', '.join(spec.columns)} FROM {spec.table_name}{where} ORDER BY timestamp DESC LIMIT %s"
+    return query, (date, _limit(question, top_k))
+
+
+SQL_INTENT_RULES: List[SQLIntentRule] = [
+    SQLIntentRule(
+        intent="top_inference_times",
+        patterns=[
+            re.compile(r"\b(top|longest|highest|slowest|largest|max(imum)?)\b"),
+            re.compile(r"\binference\s+times?\b"),
+        ],
+        vocabulary={
+            "top",
+            "longest",
+            "highest",
+            "slowest",
+            "largest",
+            "max",
+            "maximum",
+            "inference",
+            "time",
+            "times",
+            "recorded",
+        },
+        build=_build_top_inference_times,
+        log_types={LogFileType.ANOMALY_DETECTION_LOG.value},
+    ),
+    SQLIntentRule(
+        intent="count_today",
+        patterns=[re.compile(r"\b(how many|count|number of|total)\b"), re.compile(r"\btoday\b")],
+        vocabulary={"how", "many", "count", "number", "total", "today", "detected", "anomalies"},
+        build=_build_count_today,
+    ),
+    SQLIntentRule(
+        intent="status_distribution",
+        patterns=[
+            re.compile(r"\b(group|grouped|distribution|breakdown|split|count|counts)\b"),
+            re.compile(r"\b(status|statuses|prediction|predictions)\b"),
+        ],
+        vocabulary={
+            "group",
+            "grouped",
+            "distribution",
+            "breakdown",
+            "split",
+            "count",
+            "counts",
+            "different",
+            "status",
+            "statuses",
+            "prediction",
+            "predictions",
+            "today",
+            "by",
+        },
+        build=_build_status_distribution,
+    ),
+    SQLIntentRule(
+        intent="most_common_goal_type",
+        patterns=[
+            re.compile(r"\b(most common|most frequent|most used|most observed)\b"),
+            re.compile(r"\bgoal[\s_]types?\b"),
+        ],
+        vocabulary={"most", "common", "frequent", "used", "goal", "type", "types", "goal_type"},
+        build=_build_most_common_goal_type,
+        log_types={LogFileType.RTA_WORKER_SWITCH_LOG.value},
+    ),
+    SQLIntentRule(
+        intent="records_on_date",
+        patterns=[_DATE_RE],
+        vocabulary={
+            "date",
+            "on",
+            "specific",
+            "detected",
+            "anomalies",
+            "at",
+            "day",
+            "e",
+            "g",
+            "eg",
+            "latest",
+            "recent",
+            "most",
+            "last",
+            "newest",
+        },
+        build=_build_records_on_date,
+    ),
+    SQLIntentRule(
+        intent="latest_records",
+        patterns=[re.compile(r"\b(latest|recent|most recent|last|newest)\b")],
+        vocabulary={"latest", "recent", "most", "last", "newest", "detected", "anomalies"},
+        build=_build_latest_records,
+    ),
+]
+
+
+def _content_words(question: str) -> List[str]:
+    """Lower-cased words of the question without stopwords, numbers & dates"""
+    return [word for word in _WORD_RE.findall(question.lower()) if word not in _STOPWORDS and not word[0].isdigit()]
+
+
+def _literals(question: str) -> Optional[List[str]]:
+    """
+    Dates & limits of the question, the values a template has to bind to express it.
+    None if the question has an integer that is not a limit, e.g. a status value no template can bind.
+    """
+    lowered = _DATE_RE.sub(" ", question.lower())
+    limits = _LIMIT_RE.findall(lowered)
+    if len(_INT_RE.findall(lowered)) != len(limits):
+        return None
+    return _DATE_RE.findall(question) + limits
+
+
+def _all_literals_bound(literals: Optional[List[str]], params: Tuple) -> bool:
+    """Whether every literal of the question is one of the template params, each param binding one literal"""
+    if literals is None:
+        return False
+    unbound = [str(param) for param in params]
+    for literal in literals:
+        value = literal if _DATE_RE.fullmatch(literal) else str(int(literal))
+        if value not in unbound:
+            return False
+        unbound.remove(value)
+    return True
+
+
+def _rule_confidence(
+    question: str, content_words: List[str], rule: SQLIntentRule, spec: LogTypeRuleSpec, query: str, params: Tuple
+) -> float:
+    """
+    Fraction of the content words explained by the rule & table vocabulary. Status words only count as explained
+    if the query filters on the status. A question whose numbers or dates are not all bound as template params,
+    that asks for the positive status without the query filtering on it or that is negated gets no confidence:
+    the template would silently drop or invert a condition of the question.
+    """
+    if _NEGATION_RE.search(question.lower()):
+        return 0.0
+    status_filtered = spec.status_filter is not None and spec.status_filter in query
+    if _status_requested(question, spec) and not status_filtered:
+        return 0.0
+    if not _all_literals_bound(_literals(question), params):
+        return 0.0
+    known_words = rule.vocabulary | spec.subject_words | _SUBJECT_WORDS
+    known_words = known_words | spec.status_filter_words if status_filtered else known_words - spec.status_filter_words
+    if not content_words:
+        return 0.0
+    return sum(word in known_words for word in content_words) / len(content_words)
+
+
+def match_sql_intent(question: str, log_type: str, top_k: int = 5) -> Optional[SQLIntentMatch]:
+    """
+    Match a question to the best sql intent rule for log_type.
+    Confidence is the fraction of the question's content words explained by the rule & table vocabulary,
+    so questions with extra conditions the templates cannot express get a low confidence.
+    Numbers, dates & status conditions the template does not bind and negations drop the confidence to 0.
+    Returns None if no rule matches.
+    """
+    spec = LOG_TYPE_RULE_SPECS.get(log_type)
+    if spec is None:
+        return None
+    lowered = question.lower()
+    content_words = _content_words(question)
+    best_match = None
+    for rule in SQL_INTENT_RULES:
+        if rule.log_types is not None and log_type not in rule.log_types:
+            continue
+        if not all(pattern.search(lowered) for pattern in rule.patterns):
+            continue
+        query, params = rule.build(question, spec, top_k)
+        confidence = _rule_confidence(question, content_words, rule, spec, query, params)
+        if best_match is None or confidence > best_match.confidence:
+            best_match = SQLIntentMatch(rule.intent, query, params, confidence)
+    return best_match
@@ -54,6 +54,67 @@ LOG_STORAGE_DIR = os.getenv("LOG_STORAGE_DIR", os.path.join(ROOT_STORAGE_DIR, "l
 Path(ROOT_STORAGE_DIR).mkdir(parents=True, exist_ok=True)
 Path(FILE_STORAGE_DIR).mkdir(parents=True, exist_ok=True)
 Path(LOG_STORAGE_DIR).mkdir(parents=True, exist_ok=True)
+# uploads are streamed to FILE_STORAGE_DIR in chunks of UPLOAD_CHUNK_SIZE bytes
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# document splitting worker processes of /upsert/files, 0 splits in threads of the server process
+SPLIT_PROCESS_WORKERS = int(os.getenv("SPLIT_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+# vector store collection shared by /upsert/files & /qa, warmed up on startup
+VECTOR_STORE_COLLECTION_NAME = os.getenv("VECTOR_STORE_COLLECTION_NAME", "structured_knowledge")
+VECTOR_STORE_WARMUP = _to_bool(os.getenv("VECTOR_STORE_WARMUP"), default=True)
+
+# query embedding cache of /qa retrieval, set the capacity to 0 to disable & the path to "" for memory only
+QUERY_EMBEDDING_CACHE_CAPACITY = int(os.getenv("QUERY_EMBEDDING_CACHE_CAPACITY", "2048"))
+QUERY_EMBEDDING_CACHE_PATH = os.getenv(
+    "QUERY_EMBEDDING_CACHE_PATH",
+    os.path.join(ROOT_STORAGE_DIR, "query_embedding_cache.sqlite3"),
+)
+# content addressed chunk embeddings reused by /upsert/files, set the path to "" to disable
+CHUNK_EMBEDDING_CACHE_PATH = os.getenv(
+    "CHUNK_EMBEDDING_CACHE_PATH",
+    os.path.join(ROOT_STORAGE_DIR, "chunk_embedding_cache.sqlite3"),
+)
+# bm25 index of the chunk texts for hybrid /qa retrieval, set the path to "" to disable
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(ROOT_STORAGE_DIR, "lexical_index.sqlite3"))
+LEXICAL_INDEX_MMAP_SIZE = int(os.getenv("LEXICAL_INDEX_MMAP_SIZE", str(256 << 20)))
+# candidates of each retriever fused with reciprocal rank fusion by /qa
+QA_HYBRID_FETCH_K = int(os.getenv("QA_HYBRID_FETCH_K", "20"))
+QA_RRF_K = int(os.getenv("QA_RRF_K", "60"))
+# optional rerank stage of /qa: "none", "lexical" (query term overlap) or "cross-encoder" (QA_RERANK_MODEL on cpu)
+# scoring QA_RERANK_FETCH_K candidates & keeping the chunks scoring at least QA_RERANK_THRESHOLD (0-1)
+# within QA_CONTEXT_TOKEN_BUDGET tokens
+QA_RERANKER = os.getenv("QA_RERANKER", "none").lower()
+QA_RERANK_MODEL = os.getenv("QA_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+QA_RERANK_FETCH_K = int(os.getenv("QA_RERANK_FETCH_K", "20"))
+QA_RERANK_THRESHOLD = float(os.getenv("QA_RERANK_THRESHOLD", "0.2"))
+QA_CONTEXT_TOKEN_BUDGET = int(os.getenv("QA_CONTEXT_TOKEN_BUDGET", "3000"))
+# /qa context assembly merging adjacent chunks & dropping blocks within QA_NEAR_DUPLICATE_MAX_DISTANCE simhash bits
+QA_CONTEXT_ASSEMBLY = _to_bool(os.getenv("QA_CONTEXT_ASSEMBLY"), default=True)
+QA_NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("QA_NEAR_DUPLICATE_MAX_DISTANCE", "6"))
+# /qa answer cache invalidated by every change of the collection, set the capacity to 0 to disable,
+# the ttl to 0 to keep answers until evicted & the path to "" for memory only
+QA_ANSWER_CACHE_CAPACITY = int(os.getenv("QA_ANSWER_CACHE_CAPACITY", "1024"))
+QA_ANSWER_CACHE_TTL = float(os.getenv("QA_ANSWER_CACHE_TTL", "3600"))
+QA_ANSWER_CACHE_PATH = os.getenv("QA_ANSWER_CACHE_PATH", os.path.join(ROOT_STORAGE_DIR, "qa_answer_cache.sqlite3"))
+QA_ANSWER_CACHE_DISK_CAPACITY = int(os.getenv("QA_ANSWER_CACHE_DISK_CAPACITY", "10000"))
+# batched, concurrent chunk embedding of /upsert/files
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_RETRY_BACKOFF = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "1.0"))
+# local HuggingFace embedding models, 0 threads keeps the torch default
+LOCAL_EMBEDDING_NUM_THREADS = int(os.getenv("LOCAL_EMBEDDING_NUM_THREADS", "0"))
+LOCAL_EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_MAX_BATCH_SIZE", "64"))
+LOCAL_EMBEDDING_MAX_WAIT_MS = float(os.getenv("LOCAL_EMBEDDING_MAX_WAIT_MS", "5"))
+
+# background ingestion jobs of /upsert, queued on disk & processed by JOB_WORKERS concurrent workers,
+# a running job is requeued when its worker process did not renew its lease for JOB_LEASE_SECONDS
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(ROOT_STORAGE_DIR, "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
 
 # logging conf
 log_cfg = LogConfig()
@@ -74,6 +135,43 @@ MYSQL_USER = os.getenv("MYSQL_USER", "user")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "pass")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "default")
 MYSQL_CONNECT_TIMEOUT = int(os.getenv("MYSQL_CONNECT_TIMEOUT", "10"))
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "8"))
+
+# shared http connection pool for LLM clients
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "120"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+
+# rule-based sql templates answering common /sql/qa questions without an LLM call
+SQL_RULES_ENABLED = _to_bool(os.getenv("SQL_RULES_ENABLED"), default=True)
+SQL_RULES_MIN_CONFIDENCE = float(os.getenv("SQL_RULES_MIN_CONFIDENCE", "0.8"))
+
+# schema-aware text2sql prompts built from cached live table profiles
+TEXT2SQL_PROMPT_TOKEN_BUDGET = int(os.getenv("TEXT2SQL_PROMPT_TOKEN_BUDGET", "700"))
+TEXT2SQL_SCHEMA_REFRESH_INTERVAL = float(os.getenv("TEXT2SQL_SCHEMA_REFRESH_INTERVAL", "600"))
+TEXT2SQL_SCHEMA_MAX_DISTINCT_VALUES = int(os.getenv("TEXT2SQL_SCHEMA_MAX_DISTINCT_VALUES", "8"))
+
+# EXPLAIN-validated repair loop of LLM generated sql
+SQL_REPAIR_MAX_RETRIES = int(os.getenv("SQL_REPAIR_MAX_RETRIES", "2"))
+SQL_REPAIR_LATENCY_BUDGET = float(os.getenv("SQL_REPAIR_LATENCY_BUDGET", "20"))
+
+# concurrent sql generation & execution for /sql/qa/batch
+SQL_QA_BATCH_CONCURRENCY = int(os.getenv("SQL_QA_BATCH_CONCURRENCY", "8"))
+SQL_QA_BATCH_MAX_ITEMS = int(os.getenv("SQL_QA_BATCH_MAX_ITEMS", "100"))
+
+# row batch size of the server-sent events stream of /sql/qa/stream
+SQL_QA_STREAM_BATCH_SIZE = int(os.getenv("SQL_QA_STREAM_BATCH_SIZE", "500"))
+
+# semantic cache of question -> sql for /sql/qa
+SQL_SEMANTIC_CACHE_ENABLED = _to_bool(os.getenv("SQL_SEMANTIC_CACHE_ENABLED"), default=False)
+SQL_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SQL_SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SQL_SEMANTIC_CACHE_CAPACITY = int(os.getenv("SQL_SEMANTIC_CACHE_CAPACITY", "1000"))
+SQL_SEMANTIC_CACHE_PATH = os.getenv(
+    "SQL_SEMANTIC_CACHE_PATH",
+    os.path.join(ROOT_STORAGE_DIR, "sql_semantic_cache.sqlite3"),
+)
+SQL_SEMANTIC_CACHE_EMBEDDING_MODEL = os.getenv("SQL_SEMANTIC_CACHE_EMBEDDING_MODEL", "text-embedding-ada-002")
 
 # SQL execution safety
 ALLOW_UNSAFE_SQL_SCRIPTS = _to_bool(os.getenv("ALLOW_UNSAFE_SQL_SCRIPTS"), default=False)
@@ -81,3 +179,6 @@ ALLOW_UNSAFE_SQL_SCRIPTS = _to_bool(os.getenv("ALLOW_UNSAFE_SQL_SCRIPTS"), defau
 # mysql table info
 MYSQL_LOG_ID_TB_NAME = "log_fid"
 MYSQL_GENERAL_ID_TB_NAME = "general_fid"
+# dictionary tables for low-cardinality log columns
+MYSQL_LOG_FID_DICT_TB_NAME = "log_fid_dict"
+MYSQL_GOAL_TYPE_DICT_TB_NAME = "goal_type_dict"
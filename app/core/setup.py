@@ -2,10 +2,12 @@
 Setup connections
 """
 
+import queue
+import threading
 from typing import Callable
 import pymysql
 from pymysql.cursors import DictCursor
-from app.models.model import LogFileType, LogText2SQLConfig
+from app.models.model import LogFileType, LogText2SQLConfig, LogTableStorage
 from app.core.config import (
     MYSQL_HOST,
     MYSQL_PORT,
@@ -13,6 +15,9 @@ from app.core.config import (
     MYSQL_PASSWORD,
     MYSQL_DATABASE,
     MYSQL_CONNECT_TIMEOUT,
+    MYSQL_POOL_SIZE,
+    MYSQL_LOG_FID_DICT_TB_NAME,
+    MYSQL_GOAL_TYPE_DICT_TB_NAME,
 )
 from contextlib import contextmanager
 
@@ -41,55 +46,110 @@ def mysql_conn() -> Callable:
         conn.close()
 
 
+class MySQLConnectionPool:
+    """
+    Thread-safe pool of reusable mysql connections.
+    At most size connections are checked out at once, idle connections are pinged before reuse
+    and connections that raised inside the context are closed instead of being returned to the pool.
+    """
+
+    def __init__(self, size: int, connect: Callable = get_mysql_connection) -> None:
+        self._connect = connect
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self) -> Callable:
+        """Yield a pooled mysql connection obj"""
+        self._slots.acquire()
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+                conn.ping(reconnect=True)
+            except queue.Empty:
+                conn = self._connect()
+            yield conn
+            # end the open transaction so the next user does not read a stale snapshot
+            conn.rollback()
+            self._idle.put_nowait(conn)
+            conn = None
+        finally:
+            if conn is not None:
+                conn.close()
+            self._slots.release()
+
+    def close(self) -> None:
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+mysql_pool = MySQLConnectionPool(MYSQL_POOL_SIZE)
+# same interface as mysql_conn
+pooled_mysql_conn = mysql_pool.connection
+
+
 ######################################################################
 #### Configuration and helpful templates for the text2sql agent. #####
 ############# Should be based on the log file type ###################
 ######################################################################
 
 
+# shared instructions of all text2sql prompts, formatted with table_name & top_k
+TEXT2SQL_INSTRUCTIONS = """You are a mariadb MySQL expert.
+Given an input question, create a syntactically correct MySQL query to run with pymysql. The database contains only one table, called '{table_name}'.
+Unless the user specifies in the question a specific number of examples to obtain, query for at most {top_k} results using the LIMIT clause as per MySQL.
+Order the results to return the most informative data in the database.
+Never query for all columns from a table. You must query only the columns that are needed to answer the question.
+Pay attention to use only the column names you can see in the table below. Be careful to not query for columns that do not exist.
+Pay attention to use CURRENT_DATE function to get the current date, if the question involves "today"."""
+
+
+def _static_sql_prompt_template(table_description: str, column_descriptions: dict, example_questions: list) -> str:
+    """
+    Prompt template used when the live table schema can not be introspected.
+    Formatted with table_name, top_k & table_info
+    """
+    fields = "\n".join(f"- {column} # {description}" for column, description in column_descriptions.items())
+    examples = "\n".join(f"{i}. {question}" for i, question in enumerate(example_questions, start=1))
+    return (
+        f"{TEXT2SQL_INSTRUCTIONS}\n\nOnly use the following table:\n{{table_info}}\n\n"
+        f"{table_description} The fields are:\n{fields}\n\n"
+        f"Here are some examples of questions that you may get:\n{examples}"
+    )
+
+
 class ANOMALY_DETECTION_LOG_TEXT2SQL_CFG(LogText2SQLConfig):
     """
     anomaly_detection_log text to sql config
     """
 
     table_name = "anomaly_detection_log"
-    table_schema = str(["ID", "log_fid", "timestamp", "inference_time", "prediction"])
-    table_examples = """[
-        (1, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 176.04, 0),
-        (2, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 90.99, 0),
-        (3, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 53.99, 0),
-        (4, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 44.56, 0),
-        (5, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 49.74, 0)]
-    """
-    table_info = table_schema + "\nExamples of entries:\n" + table_examples
+    table_description = "The table describes anomaly detection logs in a drone."
+    column_descriptions = {
+        "ID": "PRIMARY KEY that autoincrements",
+        "log_fid": "log file id which is the md5 hash of the log file",
+        "timestamp": "timestamp of the log",
+        "inference_time": "inference time of the anomaly detection model",
+        "prediction": "prediction status of the anomaly detection model",
+    }
+    example_questions = [
+        "What are the recent anomaly predictions?",
+        "How many anomalies were detected today?",
+        "What are the top 5 longest inference times recorded?",
+        "Are there any anomalies detected on a specific date, e.g., 2023-01-15?",
+        "What is the average inference time for anomalies detected this month?",
+    ]
+    table_schema = str(list(column_descriptions))
+    table_info = table_schema
     top_k = 5
 
     # Definition of the running logic of the tool
-    sql_prompt_template = """You are a mariadb MySQL expert.
-    Given an input question, create a syntactically correct MySQL query to run with pymysql. The database contains only one table, called '{table_name}'.
-    Unless the user specifies in the question a specific number of examples to obtain, query for at most {top_k} results using the LIMIT clause as per MySQL.
-    Order the results to return the most informative data in the database.
-    Never query for all columns from a table. You must query only the columns that are needed to answer the question.
-    Pay attention to use only the column names you can see in the table below. Be careful to not query for columns that do not exist.
-    Pay attention to use CURRENT_DATE function to get the current date, if the question involves "today".
-
-    Only use the following table:
-    {table_info}
-
-    The table describes anomaly detection logs in a drone. The fields are:
-    - ID INT NOT NULL AUTO_INCREMENT, # PRIMARY KEY that autoincrements
-    - log_fid VARCHAR(32) NOT NULL # log file id which is the md5 hash of the log file
-    - timestamp DATE NOT NULL # timestamp of the log
-    - inference_time FLOAT NOT NULL # inference time of the anomaly detection model
-    - prediction INT NOT NULL # prediction status of the anomaly detection model
-
-    Here are some examples of questions that you may get:
-    1. What are the recent anomaly predictions?
-    2. How many anomalies were detected today?
-    3. What are the top 5 longest inference times recorded?
-    4. Are there any anomalies detected on a specific date, e.g., 2023-01-15?
-    5. What is the average inference time for anomalies detected this month?
-    """
+    sql_prompt_template = _static_sql_prompt_template(table_description, column_descriptions, example_questions)
 
 
 class RTA_WORKER_SWITCH_LOG_TEXT2SQL_CFG(LogText2SQLConfig):
@@ -98,45 +158,45 @@ class RTA_WORKER_SWITCH_LOG_TEXT2SQL_CFG(LogText2SQLConfig):
     """
 
     table_name = "rta_worker_switch_log"
-    table_schema = str(["ID", "log_fid", "timestamp", "goal_type", "rta_status"])
-    table_examples = """[
-        (1, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 'WORKER', 0),
-        (2, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 'WORKER', 0),
-        (3, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 'WORKER', 0),
-        (4, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 'WORKER', 0),
-        (5, '1bd5f7de3578d0ecc13de276ea4a16d7', 2024-08-21, 'WORKER', 0)]
-    """
-    table_info = table_schema + "\nExamples of entries:\n" + table_examples
+    table_description = "The table describes rta worker switch logs in a drone."
+    column_descriptions = {
+        "ID": "PRIMARY KEY that autoincrements",
+        "log_fid": "log file id which is the md5 hash of the log file",
+        "timestamp": "timestamp of the log",
+        "goal_type": "the goal type of the rta switch worker",
+        "rta_status": "the rta status of the worker, int from 0 to 3",
+    }
+    example_questions = [
+        "What are the recent rta status?",
+        "Group the different observed rta status today.",
+        "What is the most common goal type?",
+        "Are there any rta status observed on a specific date, e.g., 2023-01-15?",
+    ]
+    table_schema = str(list(column_descriptions))
+    table_info = table_schema
     top_k = 5
 
     # Definition of the running logic of the tool
-    sql_prompt_template = """You are a mariadb MySQL expert.
-    Given an input question, create a syntactically correct MySQL query to run with pymysql. The database contains only one table, called '{table_name}'.
-    Unless the user specifies in the question a specific number of examples to obtain, query for at most {top_k} results using the LIMIT clause as per MySQL.
-    Order the results to return the most informative data in the database.
-    Never query for all columns from a table. You must query only the columns that are needed to answer the question.
-    Pay attention to use only the column names you can see in the table below. Be careful to not query for columns that do not exist.
-    Pay attention to use CURRENT_DATE function to get the current date, if the question involves "today".
-
-    Only use the following table:
-    {table_info}
-
-    The table describes rta worker switch logs in a drone. The fields are:
-    - ID INT NOT NULL AUTO_INCREMENT, # PRIMARY KEY that autoincrements
-    - log_fid VARCHAR(32) NOT NULL # log file id which is the md5 hash of the log file
-    - timestamp DATE NOT NULL # timestamp of the log
-    - goal_type VARCHAR(32) NOT NULL # the goal type of the rta switch worker
-    - rta_status INT NOT NULL # the rta status of the worker, int from 0 to 3
-
-    Here are some examples of questions that you may get:
-    1. What are the recent rta status?
-    2. Group the different observed rta status today.
-    3. What is the most common goal type?
-    4. Are there any rta status observed on a specific date, e.g., 2023-01-15?
-    """
+    sql_prompt_template = _static_sql_prompt_template(table_description, column_descriptions, example_questions)
 
 
 TEXT2SQL_CFG_DICT = {
     LogFileType.ANOMALY_DETECTION_LOG.value: ANOMALY_DETECTION_LOG_TEXT2SQL_CFG,
     LogFileType.RTA_WORKER_SWITCH_LOG.value: RTA_WORKER_SWITCH_LOG_TEXT2SQL_CFG,
 }
+
+
+# log tables are views over data tables with dictionary-encoded low-cardinality columns
+LOG_TABLE_STORAGE_DICT = {
+    LogFileType.ANOMALY_DETECTION_LOG.value: LogTableStorage(
+        data_table_name="anomaly_detection_log_data",
+        encoded_columns={"log_fid": MYSQL_LOG_FID_DICT_TB_NAME},
+    ),
+    LogFileType.RTA_WORKER_SWITCH_LOG.value: LogTableStorage(
+        data_table_name="rta_worker_switch_log_data",
+        encoded_columns={
+            "log_fid": MYSQL_LOG_FID_DICT_TB_NAME,
+            "goal_type": MYSQL_GOAL_TYPE_DICT_TB_NAME,
+        },
+    ),
+}
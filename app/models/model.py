@@ -3,9 +3,10 @@ API data models
 """
 
 from enum import Enum
-from pydantic import BaseModel
+from datetime import datetime
+from pydantic import BaseModel, Field
 from abc import ABC, abstractmethod
-from typing import List, Any, Optional
+from typing import List, Any, Optional, Dict
 
 
 class SQLQueryParams(BaseModel):
@@ -19,9 +20,14 @@ class SQLQueryParams(BaseModel):
 
 
 class QARequest(BaseModel):
-    """Request body for retrieval QA."""
+    """Request body for retrieval QA. The optional filters restrict the searched chunks by their metadata."""
 
     query: str
+    k: int = Field(default=6, ge=1, le=50)
+    sources: Optional[List[str]] = Field(default=None, min_length=1)
+    file_types: Optional[List[str]] = Field(default=None, min_length=1)
+    ingested_after: Optional[datetime] = None
+    ingested_before: Optional[datetime] = None
 
 
 class SummarizerMode(str, Enum):
@@ -51,6 +57,17 @@ class EmbeddingModel(str, Enum):
     HUGGINGFACE_TEXT_EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
 
 
+class JobStatus(str, Enum):
+    """
+    Background ingestion job states
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
 class LLMModel(str, Enum):
     """
     LLM Model Types
@@ -84,6 +101,32 @@ class SQLQARequest(BaseModel):
     model: LLMModel = LLMModel.GPT_4o_Mini
 
 
+class SQLQABatchRequest(BaseModel):
+    """Request body for batched text-to-SQL QA."""
+
+    items: List[SQLQARequest] = Field(..., min_length=1)
+    max_concurrency: Optional[int] = Field(default=None, ge=1)
+
+
+class HNSWParams(BaseModel):
+    """HNSW index params of a vector store collection, unset params keep their current value"""
+
+    M: Optional[int] = Field(default=None, ge=2)
+    ef_construction: Optional[int] = Field(default=None, ge=1)
+    ef_search: Optional[int] = Field(default=None, ge=1)
+
+
+class LogTableStorage(BaseModel):
+    """
+    Physical storage of a log table.
+    The log table name is a view over data_table_name, where each column in
+    encoded_columns is stored as an integer id into the mapped dictionary table.
+    """
+
+    data_table_name: str
+    encoded_columns: Dict[str, str] = {}
+
+
 class LogText2SQLConfig(ABC):
     """
     log text to sql config
@@ -98,7 +141,15 @@ class LogText2SQLConfig(ABC):
         pass
 
     @abstractmethod
-    def table_examples(self):
+    def table_description(self):
+        pass
+
+    @abstractmethod
+    def column_descriptions(self):
+        pass
+
+    @abstractmethod
+    def example_questions(self):
         pass
 
     @abstractmethod
@@ -0,0 +1,39 @@
+"""
+Background ingestion job status api
+"""
+
+import logging
+from typing import Dict
+
+from fastapi import APIRouter, Query, status, HTTPException
+
+from app.api.jobs import job_queue
+
+
+router = APIRouter()
+logger = logging.getLogger("jobs_route")
+
+
+@router.get(
+    "",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="List the most recent ingestion jobs",
+)
+async def list_jobs(limit: int = Query(50, ge=1, le=500)):
+    """Returns the most recent ingestion jobs, newest first"""
+    return {"status": "success", "jobs": job_queue.list(limit)}
+
+
+@router.get(
+    "/{job_id}",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="Stage, progress, throughput & errors of an ingestion job",
+)
+async def get_job(job_id: str):
+    """Returns the stage, progress, throughput, result & error of an ingestion job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"job {job_id} not found")
+    return job
@@ -2,18 +2,39 @@
 Question Answer api endpoint
 """
 
+import time
+import asyncio
 import logging
-from typing import Dict
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from fastapi import APIRouter, status, HTTPException
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from fastapi.responses import StreamingResponse
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import Runnable
 
+from app.api.langchain_custom.answer_cache import CACHE_HIT, CACHE_MISS, answer_cache, answer_cache_key
+from app.api.langchain_custom.context_assembly import CONTEXT_SEPARATOR, assemble_context
+from app.api.langchain_custom.hybrid_retrieval import hybrid_search
 from app.api.langchain_custom.llms import load_llm
-from app.core.config import VECTOR_STORE_DIR
+from app.api.langchain_custom.rerank import get_reranker, rerank_documents, select_context
+from app.api.langchain_custom.tokens import count_tokens
+from app.api.langchain_custom.vector_store import metadata_where, vector_store_manager
 from app.models.model import QARequest, LLMModel
+from app.utils.common import sse_event
+from app.core.config import (
+    VECTOR_STORE_COLLECTION_NAME,
+    QA_HYBRID_FETCH_K,
+    QA_RRF_K,
+    QA_RERANKER,
+    QA_RERANK_MODEL,
+    QA_RERANK_FETCH_K,
+    QA_RERANK_THRESHOLD,
+    QA_CONTEXT_TOKEN_BUDGET,
+    QA_CONTEXT_ASSEMBLY,
+    QA_NEAR_DUPLICATE_MAX_DISTANCE,
+)
 
 
 router = APIRouter()
@@ -23,6 +44,211 @@ RAG_PROMPT = ChatPromptTemplate.from_template(
 )
 
 
+def retrieve_docs(question: str, k: int = 6, where: Optional[Dict] = None) -> List[Document]:
+    """
+    Hybrid search for the k chunks of the question matching the where clause, fusing similarity search
+    in the resident vector store with bm25 matches of the lexical index. Similarity search only if it is disabled
+    """
+    vector_store = vector_store_manager.get_vector_store()
+    lexical_index = vector_store_manager.get_lexical_index()
+    if lexical_index is None:
+        return vector_store.similarity_search(question, k=k, filter=where)
+    return hybrid_search(
+        vector_store, lexical_index, question, k=k, fetch_k=max(k, QA_HYBRID_FETCH_K), rrf_k=QA_RRF_K, where=where
+    )
+
+
+def rerank_docs(question: str, docs: List[Document], k: int) -> List[Tuple[Document, Optional[float]]]:
+    """
+    Rerank the retrieved chunks in one batch & keep at most k above the score threshold within the token budget.
+    Without a reranker the first k chunks are kept unscored
+    """
+    reranker = get_reranker(QA_RERANKER, QA_RERANK_MODEL)
+    if reranker is None:
+        return [(doc, None) for doc in docs[:k]]
+    return select_context(
+        rerank_documents(reranker, question, docs),
+        threshold=QA_RERANK_THRESHOLD,
+        max_chunks=k,
+        token_budget=QA_CONTEXT_TOKEN_BUDGET,
+    )
+
+
+def format_docs(docs) -> str:
+    return CONTEXT_SEPARATOR.join(doc.page_content for doc in docs)
+
+
+def build_context(docs: List[Document]) -> Tuple[str, Dict]:
+    """
+    Prompt context of the kept chunks & its stats. Adjacent chunks are merged, near-duplicates dropped
+    and the context trimmed to the token budget unless context assembly is disabled
+    """
+    if not QA_CONTEXT_ASSEMBLY:
+        context = format_docs(docs)
+        return context, {"tokens": count_tokens(context)}
+    assembled = assemble_context(docs, QA_CONTEXT_TOKEN_BUDGET, QA_NEAR_DUPLICATE_MAX_DISTANCE)
+    stats = {
+        "raw_tokens": assembled.raw_tokens,
+        "tokens": assembled.tokens,
+        "blocks": len(assembled.documents),
+        "merged": assembled.merged,
+        "duplicates": assembled.duplicates,
+        "trimmed": assembled.trimmed,
+    }
+    return assembled.text, stats
+
+
+@lru_cache(maxsize=None)
+def get_rag_chain(model: LLMModel) -> Runnable:
+    """Return the answer generation chain of model taking {"context", "question"}, built once & reused"""
+    return RAG_PROMPT | load_llm(model) | StrOutputParser()
+
+
+def _rounded(timings: Dict[str, Optional[float]]) -> Dict[str, Optional[float]]:
+    return {name: value if value is None else round(value, 4) for name, value in timings.items()}
+
+
+async def prepare_context(request_data: QARequest) -> Tuple[str, Dict, Dict[str, float]]:
+    """Retrieve, rerank & assemble the context of the kept chunks. Returns the context, its stats & stage timings"""
+    where = metadata_where(
+        request_data.sources,
+        request_data.file_types,
+        request_data.ingested_after,
+        request_data.ingested_before,
+    )
+    # the reranker picks the chunks of a wider candidate set
+    reranked = get_reranker(QA_RERANKER, QA_RERANK_MODEL) is not None
+    n_candidates = max(request_data.k, QA_RERANK_FETCH_K) if reranked else request_data.k
+
+    retrieval_start = time.perf_counter()
+    candidates = await asyncio.to_thread(retrieve_docs, request_data.query, n_candidates, where)
+    rerank_start = time.perf_counter()
+    scored_docs = await asyncio.to_thread(rerank_docs, request_data.query, candidates, request_data.k)
+    assembly_start = time.perf_counter()
+    context, context_stats = await asyncio.to_thread(build_context, [doc for doc, _ in scored_docs])
+    timings = {
+        "retrieval_s": rerank_start - retrieval_start,
+        "rerank_s": assembly_start - rerank_start,
+        "assembly_s": time.perf_counter() - assembly_start,
+    }
+    context_info = {
+        "candidates": len(candidates),
+        "chunks": len(scored_docs),
+        **context_stats,
+        "scores": [round(score, 4) for _, score in scored_docs if score is not None],
+    }
+    return context, context_info, timings
+
+
+async def answer_question(request_data: QARequest, model: LLMModel) -> Dict:
+    """Retrieve, rerank, assemble the context of the kept chunks & answer, timing each stage"""
+    context, context_info, timings = await prepare_context(request_data)
+    generation_start = time.perf_counter()
+    answer = await get_rag_chain(model).ainvoke({"context": context, "question": request_data.query})
+    timings["generation_s"] = time.perf_counter() - generation_start
+    return {"answer": answer, "context": context_info, "timings": _rounded(timings)}
+
+
+def retrieval_params(request_data: QARequest) -> Dict:
+    """Request params & pipeline settings an answer depends on, besides the query, model & collection"""
+    return {
+        **request_data.model_dump(mode="json", exclude={"query"}),
+        "reranker": QA_RERANKER,
+        "rerank_model": QA_RERANK_MODEL,
+        "rerank_fetch_k": QA_RERANK_FETCH_K,
+        "rerank_threshold": QA_RERANK_THRESHOLD,
+        "context_token_budget": QA_CONTEXT_TOKEN_BUDGET,
+        "context_assembly": QA_CONTEXT_ASSEMBLY,
+        "near_duplicate_max_distance": QA_NEAR_DUPLICATE_MAX_DISTANCE,
+        "hybrid_fetch_k": QA_HYBRID_FETCH_K,
+        "rrf_k": QA_RRF_K,
+    }
+
+
+async def cached_answer_question(request_data: QARequest, model: LLMModel) -> Tuple[Dict, str]:
+    """
+    answer_question through the answer cache keyed by the current collection version.
+    Returns the answer & the cache status, "disabled" without a cache
+    """
+    if not answer_cache.enabled:
+        return await answer_question(request_data, model), "disabled"
+    collection = VECTOR_STORE_COLLECTION_NAME
+    version = await asyncio.to_thread(answer_cache.collection_version, collection)
+    key = answer_cache_key(request_data.query, model.value, retrieval_params(request_data), collection, version)
+    return await answer_cache.get_or_compute(key, collection, version, lambda: answer_question(request_data, model))
+
+
+async def _qa_event_stream(request_data: QARequest, model: LLMModel) -> AsyncIterator[str]:
+    """
+    Server-sent events of a /qa request: retrieval -> token (one event per generated chunk) -> done,
+    or an error event on failure. A cached answer is sent as a single token event.
+    The streamed answer is cached once the generation completes.
+    """
+    started = time.perf_counter()
+    cache_status, cache_key = "disabled", None
+    try:
+        if answer_cache.enabled:
+            collection = VECTOR_STORE_COLLECTION_NAME
+            version = await asyncio.to_thread(answer_cache.collection_version, collection)
+            params = retrieval_params(request_data)
+            cache_key = answer_cache_key(request_data.query, model.value, params, collection, version)
+            cached = await answer_cache.get(cache_key, collection, version)
+            if cached is not None:
+                cache_time = time.perf_counter() - started
+                yield sse_event(
+                    "retrieval",
+                    {
+                        "query": request_data.query,
+                        "context": cached["context"],
+                        "timings": _rounded({"cache_s": cache_time}),
+                        "cache": CACHE_HIT,
+                    },
+                )
+                yield sse_event("token", {"text": cached["answer"]})
+                timings = {"first_token_s": cache_time, "total_s": time.perf_counter() - started}
+                yield sse_event("done", {"status": "success", "n_tokens": 1, "timings": _rounded(timings)})
+                return
+            cache_status = CACHE_MISS
+
+        context, context_info, timings = await prepare_context(request_data)
+        yield sse_event(
+            "retrieval",
+            {"query": request_data.query, "context": context_info, "timings": _rounded(timings), "cache": cache_status},
+        )
+
+        generation_start = time.perf_counter()
+        first_token_time, tokens = None, []
+        async for text in get_rag_chain(model).astream({"context": context, "question": request_data.query}):
+            if not text:
+                continue
+            if first_token_time is None:
+                first_token_time = time.perf_counter() - started
+            tokens.append(text)
+            yield sse_event("token", {"text": text})
+        timings["generation_s"] = time.perf_counter() - generation_start
+
+        if cache_key is not None:
+            result = {"answer": "".join(tokens), "context": context_info, "timings": _rounded(timings)}
+            await answer_cache.put(cache_key, collection, version, result)
+        yield sse_event(
+            "done",
+            {
+                "status": "success",
+                "n_tokens": len(tokens),
+                "timings": _rounded(
+                    {
+                        "first_token_s": first_token_time,
+                        "generation_s": timings["generation_s"],
+                        "total_s": time.perf_counter() - started,
+                    }
+                ),
+            },
+        )
+    except Exception as excep:
+        logger.exception("failed to stream RAG QA: %s", excep)
+        yield sse_event("error", {"status": "failed", "detail": "failed to conduct query search in server"})
+
+
 @router.post(
     "",
     response_model=Dict,
@@ -34,27 +260,12 @@ async def question_answer(request_data: QARequest, model: LLMModel = LLMModel.GP
     status_code = status.HTTP_200_OK
     response_data = {}
     try:
-        vectorstore = Chroma(
-            persist_directory=VECTOR_STORE_DIR,
-            embedding_function=OpenAIEmbeddings(),
-        )
-        retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 6})
-
-        def format_docs(docs):
-            return "\n\n".join(doc.page_content for doc in docs)
-
-        rag_chain = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough()}
-            | RAG_PROMPT
-            | load_llm(model)
-            | StrOutputParser()
-        )
-
-        answer = rag_chain.invoke(request_data.query)
+        result, cache_status = await cached_answer_question(request_data, model)
         response_data = {
             "status": "success",
             "query": request_data.query,
-            "answer": answer,
+            **result,
+            "cache": cache_status,
         }
     except Exception as excep:
         logger.exception("failed to run RAG QA: %s", excep)
@@ -62,3 +273,47 @@ async def question_answer(request_data: QARequest, model: LLMModel = LLMModel.GP
         detail = response_data.get("detail", "failed to conduct query search in server")
         raise HTTPException(status_code=status_code, detail=detail) from excep
     return response_data
+
+
+@router.get(
+    "/cache/stats",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="Hit/miss metrics of the query embedding & answer caches",
+)
+async def qa_cache_stats():
+    """
+    Returns the hit/miss metrics of the query embedding cache used by /qa retrieval, per embedding model,
+    and of the answer cache
+    """
+    return {
+        "status": "success",
+        "query_embedding_cache": vector_store_manager.query_cache_stats(),
+        "answer_cache": answer_cache.stats(),
+    }
+
+
+@router.post(
+    "/stream",
+    status_code=status.HTTP_200_OK,
+    summary="Answer query with chatbot & stream the retrieval stats and answer tokens as server-sent events",
+)
+async def question_answer_stream(request_data: QARequest, model: LLMModel = LLMModel.GPT_4o_Mini):
+    """
+    Streaming variant of /qa. Emits server-sent events as the answer is generated:
+        retrieval: the context stats & retrieval, rerank & assembly timings, before generation starts
+        token: the next chunk of the answer
+        done: token count & first token, generation & total timings
+        error: the request failed, the stream ends
+
+    Example request body:
+        {
+            "query": "What happened in the uploaded logs?",
+            "k": 6
+        }
+    """
+    return StreamingResponse(
+        _qa_event_stream(request_data, model),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -2,20 +2,284 @@
 SQL Question Answer api endpoint
 """
 
+import time
+import asyncio
 import logging
-from typing import Dict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 from fastapi import APIRouter, status, HTTPException
+from fastapi.responses import StreamingResponse
 
-from app.api.langchain_custom.text2sql import text_to_sql
-from app.api.mysql import run_sql_script, sep_query_and_params
-from app.models.model import SQLQueryParams, SQLQARequest
-from app.core.setup import mysql_conn, TEXT2SQL_CFG_DICT
-from app.core.config import ALLOW_UNSAFE_SQL_SCRIPTS
+from app.api.langchain_custom.text2sql import TEXT2SQL_OUTPUT_INSTRUCTION, atext_to_sql, text_to_sql
+from app.api.langchain_custom.text2sql_prompt import Text2SQLPrompt, get_text2sql_prompt_builder
+from app.api.langchain_custom.tokens import count_tokens
+from app.api.langchain_custom.sql_semantic_cache import SemanticCacheLookup, get_sql_semantic_cache
+from app.api.mysql import (
+    RowBatchReader,
+    explain_sql_script,
+    run_sql_script,
+    sep_query_and_params,
+    stream_sql_script,
+)
+from app.api.text2sql_rules import SQLIntentMatch, match_sql_intent
+from app.models.model import SQLQueryParams, SQLQARequest, SQLQABatchRequest
+from app.core.setup import mysql_conn, pooled_mysql_conn, TEXT2SQL_CFG_DICT
+from app.utils.common import sse_event
+from app.core.config import (
+    ALLOW_UNSAFE_SQL_SCRIPTS,
+    SQL_QA_BATCH_CONCURRENCY,
+    SQL_QA_BATCH_MAX_ITEMS,
+    SQL_QA_STREAM_BATCH_SIZE,
+    SQL_REPAIR_MAX_RETRIES,
+    SQL_REPAIR_LATENCY_BUDGET,
+    SQL_RULES_ENABLED,
+    SQL_RULES_MIN_CONFIDENCE,
+    SQL_SEMANTIC_CACHE_ENABLED,
+)
 
 router = APIRouter()
 logger = logging.getLogger("sql_qa_route")
 
 
+def _match_sql_intent(question: str, log_type: str, top_k: int) -> Optional[SQLIntentMatch]:
+    """Match the question to a rule-based sql template if it is confident enough to skip the LLM"""
+    if not SQL_RULES_ENABLED:
+        return None
+    intent_match = match_sql_intent(question, log_type, top_k=top_k)
+    if intent_match is None or intent_match.confidence < SQL_RULES_MIN_CONFIDENCE:
+        return None
+    return intent_match
+
+
+def _lookup_semantic_cache(log_type: str, question: str, model: str) -> Optional[SemanticCacheLookup]:
+    """Look up question in the semantic sql cache. Cache failures never fail the request"""
+    if not SQL_SEMANTIC_CACHE_ENABLED:
+        return None
+    try:
+        return get_sql_semantic_cache().lookup(log_type, question, model)
+    except Exception as excep:
+        logger.warning("semantic sql cache lookup failed: %s", excep)
+        return None
+
+
+def _store_semantic_cache(
+    log_type: str, question: str, model: str, query: str, cache_lookup: SemanticCacheLookup
+) -> None:
+    """Store a successfully executed query generated by the llm model in the semantic sql cache"""
+    try:
+        get_sql_semantic_cache().store(log_type, question, query, model=model, vector=cache_lookup.vector)
+    except Exception as excep:
+        logger.warning("semantic sql cache store failed: %s", excep)
+
+
+def _plan_sql_without_llm(request_data: SQLQARequest) -> Tuple[Optional[dict], Optional[SemanticCacheLookup]]:
+    """
+    Resolve the SQL of a question with the rule-based templates or the semantic cache.
+    Returns the sql plan, or None if the LLM must generate the SQL, and the semantic cache lookup.
+    """
+    log_type = request_data.log_type.value
+    text2sql_cfg_obj = TEXT2SQL_CFG_DICT[log_type]
+    intent_match = _match_sql_intent(request_data.question, log_type, text2sql_cfg_obj.top_k)
+    if intent_match is not None:
+        return {
+            "sql_path": "rules",
+            "query": intent_match.query,
+            "exec_query": intent_match.query,
+            "params": intent_match.params,
+            "extra": {
+                "params": intent_match.params,
+                "intent": intent_match.intent,
+                "intent_confidence": intent_match.confidence,
+            },
+        }, None
+
+    cache_lookup = _lookup_semantic_cache(log_type, request_data.question, request_data.model.value)
+    if cache_lookup is not None and cache_lookup.entry is not None:
+        sql_plan = _plan_from_llm_query(cache_lookup.entry["query"], sql_path="semantic_cache")
+        sql_plan["extra"] = {"cache_similarity": cache_lookup.similarity}
+        return sql_plan, cache_lookup
+    return None, cache_lookup
+
+
+def _plan_from_llm_query(llm_sql_query: str, sql_path: str = "llm") -> dict:
+    """SQL plan for a generated query, with literals separated into bound params"""
+    exec_query, params = sep_query_and_params(llm_sql_query.replace('"', ""))
+    return {"sql_path": sql_path, "query": llm_sql_query, "exec_query": exec_query, "params": params, "extra": {}}
+
+
+def _build_text2sql_prompt(request_data: SQLQARequest) -> Optional[Text2SQLPrompt]:
+    """Schema-aware text2sql system prompt of the request. None falls back to the static prompt template"""
+    text2sql_cfg_obj = TEXT2SQL_CFG_DICT[request_data.log_type.value]
+    try:
+        return get_text2sql_prompt_builder().build(text2sql_cfg_obj, text2sql_cfg_obj.top_k, request_data.model.value)
+    except Exception as excep:
+        logger.warning("text2sql prompt builder failed, using the static prompt template: %s", excep)
+        return None
+
+
+def _prompt_stats(request_data: SQLQARequest, text2sql_prompt: Optional[Text2SQLPrompt]) -> dict:
+    """Token count & sections of the prompt sent to the LLM"""
+    if text2sql_prompt is None:
+        return {}
+    n_input_tokens = count_tokens(f"{TEXT2SQL_OUTPUT_INSTRUCTION}\n{request_data.question}", request_data.model.value)
+    return {
+        "prompt_tokens": text2sql_prompt.n_tokens + n_input_tokens,
+        "prompt_sections": text2sql_prompt.sections,
+        "prompt_live_schema": text2sql_prompt.live_schema,
+    }
+
+
+class _SQLRepairLoop:
+    """
+    Bookkeeping of the repair loop of LLM generated SQL.
+    Each generated query is dry run with EXPLAIN, failed queries & their errors are fed back to the LLM
+    for at most SQL_REPAIR_MAX_RETRIES retries while within SQL_REPAIR_LATENCY_BUDGET seconds.
+    """
+
+    def __init__(self, conn_factory: Callable) -> None:
+        self.conn_factory = conn_factory
+        self.started = time.perf_counter()
+        self.attempts: List[dict] = []
+        self.failed_attempts: List[Tuple[str, str]] = []
+        self.sql_plan: Optional[dict] = None
+
+    def check(self, llm_sql_query: str, llm_time: float) -> bool:
+        """Validate a generated query. Returns True once the loop is done"""
+        sql_plan = _plan_from_llm_query(llm_sql_query)
+        explain_start = time.perf_counter()
+        explain_resp = explain_sql_script(self.conn_factory, sql_plan["exec_query"], sql_plan["params"])
+        error = None if explain_resp["status"] == "success" else explain_resp["message"]
+        self.attempts.append(
+            {
+                "llm_s": llm_time,
+                "explain_s": time.perf_counter() - explain_start,
+                "query": llm_sql_query,
+                "error": error,
+            }
+        )
+        self.sql_plan = sql_plan
+        if error is None:
+            return True
+        self.failed_attempts.append((llm_sql_query, error))
+        out_of_retries = len(self.attempts) > SQL_REPAIR_MAX_RETRIES
+        out_of_time = time.perf_counter() - self.started >= SQL_REPAIR_LATENCY_BUDGET
+        return out_of_retries or out_of_time
+
+    def result(self) -> dict:
+        """SQL plan of the last attempt with attempt count & timings. Raises if no attempt passed EXPLAIN"""
+        timings = {
+            "llm_s": sum(attempt["llm_s"] for attempt in self.attempts),
+            "explain_s": sum(attempt["explain_s"] for attempt in self.attempts),
+            "repair_total_s": time.perf_counter() - self.started,
+        }
+        last_error = self.attempts[-1]["error"]
+        if last_error is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{last_error} (generated SQL failed after {len(self.attempts)} attempt(s))",
+            )
+        self.sql_plan["extra"] = {
+            "attempts": len(self.attempts),
+            "repaired_errors": [error for _, error in self.failed_attempts],
+            "timings": {name: round(value, 4) for name, value in timings.items()},
+        }
+        return self.sql_plan
+
+
+def _generate_sql_plan(request_data: SQLQARequest) -> Tuple[dict, Optional[SemanticCacheLookup]]:
+    """Blocking sql planning: rules & semantic cache first, else LLM generation with the EXPLAIN repair loop"""
+    sql_plan, cache_lookup = _plan_sql_without_llm(request_data)
+    if sql_plan is not None:
+        return sql_plan, cache_lookup
+
+    text2sql_cfg_obj = TEXT2SQL_CFG_DICT[request_data.log_type.value]
+    text2sql_prompt = _build_text2sql_prompt(request_data)
+    repair_loop, done = _SQLRepairLoop(mysql_conn), False
+    while not done:
+        llm_start = time.perf_counter()
+        llm_sql_query = text_to_sql(
+            question=request_data.question,
+            text2sql_cfg_obj=text2sql_cfg_obj,
+            llm_config={"model": request_data.model.value, "temperature": 0},
+            top_k=text2sql_cfg_obj.top_k,
+            system_prompt=text2sql_prompt.system_prompt if text2sql_prompt else None,
+            failed_attempts=repair_loop.failed_attempts or None,
+        )
+        done = repair_loop.check(llm_sql_query, time.perf_counter() - llm_start)
+    sql_plan = repair_loop.result()
+    sql_plan["extra"] |= _prompt_stats(request_data, text2sql_prompt)
+    return sql_plan, cache_lookup
+
+
+async def _agenerate_sql_plan(request_data: SQLQARequest) -> Tuple[dict, Optional[SemanticCacheLookup]]:
+    """
+    Async sql planning: rules & semantic cache first, else LLM generation with the EXPLAIN repair loop.
+    Blocking database & embedding calls run in worker threads over pooled connections.
+    """
+    sql_plan, cache_lookup = await asyncio.to_thread(_plan_sql_without_llm, request_data)
+    if sql_plan is not None:
+        return sql_plan, cache_lookup
+
+    text2sql_cfg_obj = TEXT2SQL_CFG_DICT[request_data.log_type.value]
+    text2sql_prompt = await asyncio.to_thread(_build_text2sql_prompt, request_data)
+    repair_loop, done = _SQLRepairLoop(pooled_mysql_conn), False
+    while not done:
+        llm_start = time.perf_counter()
+        llm_sql_query = await atext_to_sql(
+            question=request_data.question,
+            text2sql_cfg_obj=text2sql_cfg_obj,
+            llm_config={"model": request_data.model.value, "temperature": 0},
+            top_k=text2sql_cfg_obj.top_k,
+            system_prompt=text2sql_prompt.system_prompt if text2sql_prompt else None,
+            failed_attempts=repair_loop.failed_attempts or None,
+        )
+        done = await asyncio.to_thread(repair_loop.check, llm_sql_query, time.perf_counter() - llm_start)
+    sql_plan = repair_loop.result()
+    sql_plan["extra"] |= _prompt_stats(request_data, text2sql_prompt)
+    return sql_plan, cache_lookup
+
+
+def _execute_sql_plan(
+    request_data: SQLQARequest,
+    sql_plan: dict,
+    cache_lookup: Optional[SemanticCacheLookup],
+    conn_factory: Callable,
+) -> dict:
+    """Run the planned read-only SQL and build the /sql/qa response"""
+    execute_start = time.perf_counter()
+    sql_resp = run_sql_script(
+        conn_factory,
+        sql_plan["exec_query"],
+        sql_plan["params"],
+        commit=False,
+        allow_write=False,
+    )
+    execute_time = time.perf_counter() - execute_start
+    if sql_resp.get("status") != "success":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=sql_resp.get("message", "Failed to execute generated SQL query."),
+        )
+
+    if sql_plan["sql_path"] == "llm" and cache_lookup is not None:
+        _store_semantic_cache(
+            request_data.log_type.value,
+            request_data.question,
+            request_data.model.value,
+            sql_plan["query"],
+            cache_lookup,
+        )
+
+    response_data = {
+        "status": "success",
+        "question": request_data.question,
+        "query": sql_plan["query"],
+        "sql_path": sql_plan["sql_path"],
+        "response": sql_resp,
+    } | sql_plan["extra"]
+    response_data["timings"] = response_data.get("timings", {}) | {"execute_s": round(execute_time, 4)}
+    return response_data
+
+
 @router.post(
     "/script",
     response_model=Dict,
@@ -96,34 +360,9 @@ async def sql_question_answer(request_data: SQLQARequest):
     status_code = status.HTTP_200_OK
     response_data = {}
     try:
-        text2sql_cfg_obj = TEXT2SQL_CFG_DICT[request_data.log_type.value]
-        llm_sql_query = text_to_sql(
-            question=request_data.question,
-            text2sql_cfg_obj=text2sql_cfg_obj,
-            llm_config={"model": request_data.model.value, "temperature": 0},
-            top_k=text2sql_cfg_obj.top_k,
-        )
-
-        query, params = sep_query_and_params(llm_sql_query.replace('"', ""))
-        sql_resp = run_sql_script(
-            mysql_conn,
-            query,
-            params,
-            commit=False,
-            allow_write=False,
-        )
-        if sql_resp.get("status") != "success":
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=sql_resp.get("message", "Failed to execute generated SQL query."),
-            )
-
-        response_data = {
-            "status": "success",
-            "question": request_data.question,
-            "query": llm_sql_query,
-            "response": sql_resp,
-        }
+        # planning embeds the question, queries the database & calls the llm, keep it off the event loop
+        sql_plan, cache_lookup = await asyncio.to_thread(_generate_sql_plan, request_data)
+        response_data = await asyncio.to_thread(_execute_sql_plan, request_data, sql_plan, cache_lookup, mysql_conn)
     except HTTPException:
         raise
     except Exception as excep:
@@ -132,3 +371,168 @@ async def sql_question_answer(request_data: SQLQARequest):
         detail = response_data.get("detail", "failed to conduct query in the MySQL server")
         raise HTTPException(status_code=status_code, detail=detail) from excep
     return response_data
+
+
+async def _sql_qa_event_stream(request_data: SQLQARequest) -> AsyncIterator[str]:
+    """
+    Server-sent events of a /sql/qa request as each stage completes:
+    sql -> execution_started -> rows (one event per batch) -> summary, or an error event on failure.
+    """
+    started = time.perf_counter()
+    try:
+        sql_plan, cache_lookup = await _agenerate_sql_plan(request_data)
+        plan_time = time.perf_counter() - started
+        yield sse_event(
+            "sql",
+            {
+                "question": request_data.question,
+                "query": sql_plan["query"],
+                "sql_path": sql_plan["sql_path"],
+            }
+            | sql_plan["extra"],
+        )
+
+        yield sse_event("execution_started", {"elapsed_s": round(time.perf_counter() - started, 4)})
+        execute_start = time.perf_counter()
+        first_rows_time, n_rows, n_batches = None, 0, 0
+        reader = RowBatchReader(
+            stream_sql_script(mysql_conn, sql_plan["exec_query"], sql_plan["params"], SQL_QA_STREAM_BATCH_SIZE)
+        )
+        try:
+            while True:
+                rows = await asyncio.to_thread(reader.read)
+                if rows is None:
+                    break
+                if first_rows_time is None:
+                    first_rows_time = time.perf_counter() - execute_start
+                yield sse_event("rows", {"batch": n_batches, "rows": rows})
+                n_rows += len(rows)
+                n_batches += 1
+        finally:
+            # a read may still run in a worker thread after a client disconnect: close the reader once it finished,
+            # in the executor without awaiting since a cancelled stream can not await
+            asyncio.get_running_loop().run_in_executor(None, reader.close)
+        execute_time = time.perf_counter() - execute_start
+
+        if sql_plan["sql_path"] == "llm" and cache_lookup is not None:
+            await asyncio.to_thread(
+                _store_semantic_cache,
+                request_data.log_type.value,
+                request_data.question,
+                request_data.model.value,
+                sql_plan["query"],
+                cache_lookup,
+            )
+        timings = {
+            "plan_s": plan_time,
+            "first_rows_s": first_rows_time,
+            "execute_s": execute_time,
+            "total_s": time.perf_counter() - started,
+        }
+        yield sse_event(
+            "summary",
+            {
+                "status": "success",
+                "n_rows": n_rows,
+                "n_batches": n_batches,
+                "timings": {name: value if value is None else round(value, 4) for name, value in timings.items()},
+            },
+        )
+    except HTTPException as excep:
+        yield sse_event("error", {"status": "failed", "detail": excep.detail})
+    except Exception as excep:
+        logger.exception("Unexpected error while streaming text-to-SQL: %s", excep)
+        yield sse_event("error", {"status": "failed", "detail": str(excep)})
+
+
+@router.post(
+    "/qa/stream",
+    status_code=status.HTTP_200_OK,
+    summary="Convert query into sql command & stream the stages and result rows as server-sent events",
+)
+async def sql_question_answer_stream(request_data: SQLQARequest):
+    """
+    Streaming variant of /sql/qa. Emits server-sent events as each stage completes:
+        sql: the generated query, its sql_path & generation stats
+        execution_started: the query is running
+        rows: a batch of result rows read from a server-side cursor
+        summary: row count & timings
+        error: the request failed, the stream ends
+
+    Example request body:
+        {
+            "log_type": "anomaly_detection_log",
+            "question": "What are the latest 5 records?",
+            "model": "gpt-4o-mini"
+        }
+    """
+    return StreamingResponse(
+        _sql_qa_event_stream(request_data),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post(
+    "/qa/batch",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="Convert a batch of queries into sql commands concurrently & interact with SQL database",
+)
+async def sql_question_answer_batch(request_data: SQLQABatchRequest):
+    """
+    Converts a batch of queries into sql commands & interacts with the SQL database.
+    SQL is generated concurrently with at most max_concurrency (capped at SQL_QA_BATCH_CONCURRENCY) in-flight items
+    and executed over pooled connections.
+    Each item reports its own result or error, a failed item does not abort the batch.
+
+    Example request body:
+        {
+            "items": [
+                {"log_type": "anomaly_detection_log", "question": "What are the latest 5 records?"},
+                {"log_type": "rta_worker_switch_log", "question": "What is the most common goal type?"}
+            ],
+            "max_concurrency": 4
+        }
+    """
+    if len(request_data.items) > SQL_QA_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch can contain at most {SQL_QA_BATCH_MAX_ITEMS} items.",
+        )
+    # clients may lower the concurrency but not exceed the pool sized SQL_QA_BATCH_CONCURRENCY
+    max_concurrency = min(request_data.max_concurrency or SQL_QA_BATCH_CONCURRENCY, SQL_QA_BATCH_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _run_item(index: int, item: SQLQARequest) -> dict:
+        async with semaphore:
+            try:
+                sql_plan, cache_lookup = await _agenerate_sql_plan(item)
+                result = await asyncio.to_thread(_execute_sql_plan, item, sql_plan, cache_lookup, pooled_mysql_conn)
+            except HTTPException as excep:
+                result = {"status": "failed", "question": item.question, "detail": excep.detail}
+            except Exception as excep:
+                logger.exception("Unexpected error while running batch text-to-SQL item %d: %s", index, excep)
+                result = {"status": "failed", "question": item.question, "detail": str(excep)}
+            return {"index": index} | result
+
+    results = await asyncio.gather(*(_run_item(i, item) for i, item in enumerate(request_data.items)))
+    n_failed = sum(result["status"] != "success" for result in results)
+    return {
+        "status": "success" if n_failed < len(results) else "failed",
+        "detail": f"{len(results) - n_failed} of {len(results)} item(s) succeeded.",
+        "results": results,
+    }
+
+
+@router.get(
+    "/cache/stats",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="Hit/miss metrics of the semantic question to SQL cache",
+)
+async def sql_cache_stats():
+    """Returns the hit/miss metrics and size of the semantic question to SQL cache used by /sql/qa"""
+    if not SQL_SEMANTIC_CACHE_ENABLED:
+        return {"status": "success", "enabled": False}
+    return {"status": "success", "enabled": True, "stats": get_sql_semantic_cache().stats()}
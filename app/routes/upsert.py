@@ -5,47 +5,190 @@ Upsert file api
 import os
 import os.path as osp
 import json
+import time
 import uuid
+import asyncio
 import logging
+from collections import Counter
 from typing import List, Dict
 from datetime import datetime
 
 from fastapi import APIRouter, File, Form, UploadFile, status, HTTPException
-from langchain_community.document_loaders import (
-    PyMuPDFLoader,
-    TextLoader,
-)
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain_text_splitters import (
-    HTMLHeaderTextSplitter,
-    LatexTextSplitter,
-    MarkdownHeaderTextSplitter,
-    RecursiveCharacterTextSplitter,
-    RecursiveJsonSplitter,
-)
+from fastapi.responses import JSONResponse
 
+from app.api.langchain_custom.answer_cache import answer_cache
+from app.api.langchain_custom.embedding_cache import aembed_documents_cached
+from app.api.langchain_custom.embedding_pipeline import EmbeddingPipeline
+from app.api.langchain_custom.vector_store import (
+    diff_source_chunks,
+    source_has_version,
+    stable_chunk_ids,
+    sync_source_chunks,
+    vector_store_manager,
+)
+from app.api.jobs import NULL_JOB, JobContext, job_queue
+from app.api.split_pool import split_pool
 from app.api.mysql import entries_exist, insert_bulk_data_into_sql, insert_data_into_sql
 from app.api.log_format.log_parser import gen_log_obj_list
+from app.api.log_format.log_encoder import log_dict_encoder
 from app.models.model import LogFileType, EmbeddingModel
-from app.utils.common import get_file_md5
+from app.utils.common import spool_file_md5
 from app.utils.chunking import CODE_EXT_MAPPING
-from app.core.setup import mysql_conn
+from app.core.setup import mysql_conn, LOG_TABLE_STORAGE_DICT
 from app.core.config import (
     FILE_STORAGE_DIR,
-    VECTOR_STORE_DIR,
     MYSQL_LOG_ID_TB_NAME,
     MYSQL_GENERAL_ID_TB_NAME,
+    UPLOAD_CHUNK_SIZE,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_RETRY_BACKOFF,
 )
 
 
 SUPPORTED_FILES_EXT = {".txt", ".pdf", ".html", ".json"}
 MAX_LOG_FILE_ID_LEN = 32
+LOG_UPSERT_JOB = "log_upsert"
+FILE_UPSERT_JOB = "file_upsert"
 router = APIRouter()
 logger = logging.getLogger("upsert_route")
 
 
+def _remove_file(fpath: str) -> None:
+    try:
+        os.remove(fpath)
+    except FileNotFoundError:
+        pass
+
+
+async def _persist_uploads(files: List[UploadFile]) -> List[Dict]:
+    """
+    Stream the uploaded files into FILE_STORAGE_DIR under unique names in UPLOAD_CHUNK_SIZE chunks,
+    hashing them on the way. Returns [{"filename", "path", "md5", "size"}]
+    """
+    uploads = []
+    for file in files:
+        fsave_path = osp.join(FILE_STORAGE_DIR, str(uuid.uuid4()) + osp.splitext(file.filename)[-1])
+        fmd5, size = await asyncio.to_thread(spool_file_md5, file.file, fsave_path, UPLOAD_CHUNK_SIZE)
+        uploads.append({"filename": file.filename, "path": fsave_path, "md5": fmd5, "size": size})
+    return uploads
+
+
+def _job_accepted(job_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"status": "queued", "job_id": job_id, "detail": f"poll /jobs/{job_id} for the progress"},
+    )
+
+
+def _store_log_file(logfile_type: str, log_file_id: str, upload: Dict, job: JobContext) -> int:
+    """Parse a log file upload & insert its entries into the sql table. Returns the number of entries, 0 if skipped"""
+    f_name, fmd5 = upload["filename"], upload["md5"]
+    # check if file alr exists in the db using md5sum
+    if entries_exist(
+        mysql_conn,
+        MYSQL_LOG_ID_TB_NAME,
+        {"file_md5": fmd5},
+    ):
+        logger.info("%s already stored and indexed in db. Skipping", f_name)
+        return 0
+
+    job.update(stage="parsing")
+    # decode txt file contents, the log parser needs the whole text
+    with open(upload["path"], "rb") as f_read:
+        f_content = f_read.read()
+    enc = json.detect_encoding(f_content)
+    file_content_str = f_content.decode(enc)
+    # get log object list from file contents using the appropriate logfile_type format
+    log_obj_list = gen_log_obj_list(file_content_str, logfile_id=log_file_id, logfile_type=logfile_type)
+    if not log_obj_list:
+        logger.warning("%s contains no valid log lines for %s", f_name, logfile_type)
+        return 0
+    # store low-cardinality text columns as dictionary ids
+    log_tb_storage = LOG_TABLE_STORAGE_DICT[logfile_type]
+    encoded_log_obj_list = log_dict_encoder.encode_log_obj_list(
+        mysql_conn, log_obj_list, log_tb_storage.encoded_columns
+    )
+
+    job.update(stage="inserting")
+    log_fid_obj = {
+        "log_fid": log_file_id,
+        "file_md5": fmd5,
+        "inserted_date": datetime.now().strftime("%Y-%m-%d"),
+        "logfile_type": logfile_type,
+        "size": upload["size"] / 1024,
+    }  # size in KB
+    with mysql_conn() as conn:  # atomic transaction for both log_fid and log_obj_list insertions
+        try:
+            insertion_status = insert_data_into_sql(
+                mysql_conn=mysql_conn,
+                tb_name=MYSQL_LOG_ID_TB_NAME,
+                data_dict=log_fid_obj,
+                commit=False,
+                conn=conn,
+            )
+            if insertion_status["status"] == "failed":
+                raise ValueError(insertion_status["message"])
+
+            insertion_status = insert_bulk_data_into_sql(
+                mysql_conn=mysql_conn,
+                tb_name=log_tb_storage.data_table_name,
+                data_dicts=encoded_log_obj_list,
+                commit=False,
+                conn=conn,
+            )
+            if insertion_status["status"] == "failed":
+                raise ValueError(insertion_status["message"])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(log_obj_list)
+
+
+async def ingest_log_files(
+    logfile_type: str, log_file_id: str, uploads: List[Dict], job: JobContext = NULL_JOB
+) -> Dict:
+    """
+    Extract info from the persisted log file uploads and store them in a sql database.
+    The uploads are removed once their entries are stored.
+    """
+    response_data = {}
+    logged_files = []
+    total_upserted_entries = 0
+    job.update(stage="parsing", done=0, total=len(uploads))
+    try:
+        for i, upload in enumerate(uploads):
+            n_entries = await asyncio.to_thread(_store_log_file, logfile_type, log_file_id, upload, job)
+            _remove_file(upload["path"])
+            if n_entries:
+                total_upserted_entries += n_entries
+                logged_files.append(upload["filename"])
+            job.update(done=i + 1, entries=total_upserted_entries)
+    finally:
+        # the uploads after a failed one are never parsed
+        for upload in uploads:
+            _remove_file(upload["path"])
+
+    if len(logged_files) > 0:
+        response_data["status"] = "success"
+        response_data["detail"] = (
+            f"uploaded and upserted {total_upserted_entries} entries "
+            + f"from {len(uploads)} file(s) into the sql table."
+        )
+        if len(logged_files) != len(uploads):
+            response_data["detail"] += (
+                f"files {set(upload['filename'] for upload in uploads) - set(logged_files)} were not uploaded"
+            )
+        response_data["content"] = logged_files
+    else:
+        response_data["status"] = "failed"
+        response_data["detail"] = "uploaded file(s) could not be uploaded or already exist in system"
+    return response_data
+
+
 @router.post(
     "/logs",
     response_model=Dict,
@@ -56,17 +199,14 @@ async def log_upsert(
     log_type: LogFileType,
     log_file_id: str = Form(...),
     files: List[UploadFile] = File(...),
+    background: bool = False,
 ):
     """
     Extract info from log file(s) and store them in a sql database.
-    log_file_id should be unique string identifier for log files
+    log_file_id should be unique string identifier for log files.
+    With background=true the files are queued as a job and its id is returned immediately with status 202.
     """
-    status_code = status.HTTP_200_OK
-    logfile_type = log_type.value
     log_file_id = log_file_id.strip()
-    response_data = {}
-    logged_files = []
-    total_upserted_entries = 0
     if not log_file_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="log_file_id cannot be empty.")
     if len(log_file_id) > MAX_LOG_FILE_ID_LEN:
@@ -75,85 +215,181 @@ async def log_upsert(
             detail=f"log_file_id must be at most {MAX_LOG_FILE_ID_LEN} characters.",
         )
     try:
-        for file in files:
-            f_content = await file.read()
-            f_name = file.filename
-
-            # check if file alr exists in the db using md5sum
-            fmd5 = get_file_md5(f_content)
-            if entries_exist(
-                mysql_conn,
-                MYSQL_LOG_ID_TB_NAME,
-                {"file_md5": fmd5},
-            ):
-                logger.info("%s already stored and indexed in db. Skipping", f_name)
-                continue
+        uploads = await _persist_uploads(files)
+        if background:
+            return _job_accepted(
+                job_queue.submit(
+                    LOG_UPSERT_JOB, {"logfile_type": log_type.value, "log_file_id": log_file_id, "uploads": uploads}
+                )
+            )
+        return await ingest_log_files(log_type.value, log_file_id, uploads)
+    except Exception as excep:
+        logger.exception("failed to upsert log files: %s", excep)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(excep) or "failed to upload files to server"
+        ) from excep
 
-            # decode txt file contents
-            enc = json.detect_encoding(f_content)
-            file_content_str = f_content.decode(enc)
-            # get log object list from file contents using the appropriate logfile_type format
-            log_obj_list = gen_log_obj_list(file_content_str, logfile_id=log_file_id, logfile_type=logfile_type)
-            if not log_obj_list:
-                logger.warning("%s contains no valid log lines for %s", f_name, logfile_type)
-                continue
 
-            log_fid_obj = {
-                "log_fid": log_file_id,
-                "file_md5": fmd5,
-                "inserted_date": datetime.now().strftime("%Y-%m-%d"),
-                "logfile_type": logfile_type,
-                "size": len(f_content) / 1024,
-            }  # size in KB
-            with mysql_conn() as conn:  # atomic transaction for both log_fid and log_obj_list insertions
-                try:
-                    insertion_status = insert_data_into_sql(
-                        mysql_conn=mysql_conn,
-                        tb_name=MYSQL_LOG_ID_TB_NAME,
-                        data_dict=log_fid_obj,
-                        commit=False,
-                        conn=conn,
+def _register_file(upload: Dict, f_ext: str) -> None:
+    """Insert the entry of an ingested file upload into the general fid table unless it was registered before"""
+    if entries_exist(mysql_conn, MYSQL_GENERAL_ID_TB_NAME, {"file_md5": upload["md5"]}):
+        return
+    fid_obj = {
+        "file_md5": upload["md5"],
+        "inserted_date": datetime.now().strftime("%Y-%m-%d"),
+        "file_type": f_ext,
+        "size": upload["size"] / 1024,
+    }  # size in KB
+    insertion_status = insert_data_into_sql(
+        mysql_conn,
+        tb_name=MYSQL_GENERAL_ID_TB_NAME,
+        data_dict=fid_obj,
+    )
+    if insertion_status["status"] == "failed":
+        raise ValueError(insertion_status["message"])
+
+
+async def ingest_files(embedding_model: str, uploads: List[Dict], job: JobContext = NULL_JOB) -> Dict:
+    """
+    Extract text from the persisted file uploads & save emb in a vector db.
+    Uploads of files whose name is already stored with the same content are removed, files are keyed by name.
+    A file is registered in the general fid table only once its chunks are indexed,
+    a file that fails is logged, removed & left unregistered so that it can be uploaded again.
+    """
+    response_data = {}
+    emb_files = []
+    failed_files = []
+    n_chunks = n_embedded_chunks = n_added_chunks = n_deleted_chunks = 0
+
+    # resident embedding client & collection, chunk vectors are reused from the content addressed store
+    # and chunk texts are indexed for bm25 search alongside the collection
+    emb = vector_store_manager.get_embeddings(embedding_model)
+    vector_store = vector_store_manager.get_vector_store(embedding_model=embedding_model)
+    chunk_embedding_store = vector_store_manager.get_chunk_embedding_store()
+    lexical_index = vector_store_manager.get_lexical_index()
+    embedding_pipeline = EmbeddingPipeline(
+        emb,
+        embedding_model,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        batch_tokens=EMBEDDING_BATCH_TOKENS,
+        max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+        max_retries=EMBEDDING_MAX_RETRIES,
+        backoff=EMBEDDING_RETRY_BACKOFF,
+    )
+
+    job.update(stage="checking", done=0, total=len(uploads))
+    new_uploads = []
+    for upload in uploads:
+        # files are keyed by name, an earlier version of a stored file replaces the current one
+        if await asyncio.to_thread(source_has_version, vector_store, upload["filename"], upload["md5"]):
+            logger.info("%s already stored and indexed in db. Skipping", upload["filename"])
+            _remove_file(upload["path"])
+            continue
+        new_uploads.append((upload, osp.splitext(upload["filename"])[-1].lower()))
+    n_done = len(uploads) - len(new_uploads)
+
+    # extract & split all files concurrently in the splitting processes, embed & index them in upload order
+    job.update(stage="splitting", done=n_done)
+    split_tasks = [asyncio.create_task(split_pool.split(upload["path"], f_ext)) for upload, f_ext in new_uploads]
+    try:
+        for (upload, f_ext), split_task in zip(new_uploads, split_tasks):
+            f_name, fmd5 = upload["filename"], upload["md5"]
+            try:
+                splits = await split_task
+
+                # Add Metadata for "Answer-Sufficient" Context
+                # We tag each split with the source filename and a stable content derived ID for parent retrieval
+                chunk_ids = stable_chunk_ids(f_name, [split.page_content for split in splits])
+                ingested_at = int(time.time())
+                for j, (split, chunk_id) in enumerate(zip(splits, chunk_ids)):
+                    split.metadata.update(
+                        {"source": f_name,
+                         "file_type": f_ext,
+                         "file_md5": fmd5,
+                         "chunk_id": chunk_id,
+                         "chunk_index": j,
+                         "ingested_at": ingested_at,
+                         "language": CODE_EXT_MAPPING.get(f_ext, "text")}
                     )
-                    if insertion_status["status"] == "failed":
-                        raise ValueError(insertion_status["message"])
-
-                    insertion_status = insert_bulk_data_into_sql(
-                        mysql_conn=mysql_conn,
-                        tb_name=logfile_type,
-                        data_dicts=log_obj_list,
-                        commit=False,
-                        conn=conn,
+
+                # Re-index incrementally against the chunks stored for the same source,
+                # embedding only new chunks that were not embedded before in concurrent batches
+                job.update(stage="embedding")
+                diff = await asyncio.to_thread(diff_source_chunks, vector_store, f_name, chunk_ids)
+                splits_by_id = dict(zip(chunk_ids, splits))
+                new_splits = [splits_by_id[chunk_id] for chunk_id in diff.new_ids]
+                vectors, n_embedded = await aembed_documents_cached(
+                    embedding_pipeline.aembed_documents,
+                    embedding_model,
+                    [split.page_content for split in new_splits],
+                    chunk_embedding_store,
+                )
+                job.update(stage="indexing")
+                await asyncio.to_thread(
+                    sync_source_chunks,
+                    vector_store,
+                    diff,
+                    new_splits,
+                    vectors,
+                    [splits_by_id[chunk_id] for chunk_id in diff.kept_ids],
+                )
+                if lexical_index is not None:
+                    await asyncio.to_thread(
+                        lexical_index.sync_source,
+                        vector_store._collection.name,
+                        f_name,
+                        chunk_ids,
+                        [split.page_content for split in splits],
                     )
-                    if insertion_status["status"] == "failed":
-                        raise ValueError(insertion_status["message"])
-                    conn.commit()
-                except Exception:
-                    conn.rollback()
-                    raise
-
-            total_upserted_entries += len(log_obj_list)
-            logged_files.append(f_name)
-        if len(logged_files) > 0:
-            response_data["status"] = "success"
-            response_data["detail"] = (
-                f"uploaded and upserted {total_upserted_entries} entries "
-                + f"from {len(files)} file(s) into the sql table."
+                await asyncio.to_thread(_register_file, upload, f_ext)
+            except Exception as excep:
+                logger.exception("failed to ingest %s: %s", f_name, excep)
+                _remove_file(upload["path"])
+                failed_files.append(f_name)
+                n_done += 1
+                job.update(done=n_done, failed_files=len(failed_files))
+                continue
+            n_chunks += len(splits)
+            n_embedded_chunks += n_embedded
+            n_added_chunks += len(diff.new_ids)
+            n_deleted_chunks += len(diff.stale_ids)
+            n_done += 1
+            emb_files.append(f_name)
+            job.update(
+                done=n_done,
+                chunks=n_chunks,
+                embedded_chunks=n_embedded_chunks,
+                embedded_tokens=embedding_pipeline.stats()["tokens"],
             )
-            if len(logged_files) != len(files):
-                response_data["detail"] += (
-                    f"files {set(f.filename for f in files) - set(logged_files)} were not uploaded"
-                )
-            response_data["content"] = logged_files
-        else:
-            response_data["status"] = "failed"
-            response_data["detail"] = "uploaded file(s) could not be uploaded or already exist in system"
-    except HTTPException:
-        raise
-    except Exception as excep:
-        logger.exception("failed to upsert log files: %s", excep)
-        status_code = status.HTTP_400_BAD_REQUEST if status_code == status.HTTP_200_OK else status_code
-        detail = response_data.get("detail") or str(excep) or "failed to upload files to server"
-        raise HTTPException(status_code=status_code, detail=detail) from excep
+    finally:
+        for split_task in split_tasks:
+            split_task.cancel()
+        await asyncio.gather(*split_tasks, return_exceptions=True)
+
+    if len(emb_files) > 0:
+        # cached /qa answers of the previous collection version are no longer served
+        await asyncio.to_thread(answer_cache.bump_collection_version, vector_store._collection.name)
+        response_data["status"] = "success"
+        response_data["detail"] = f"uploaded and embedded {len(emb_files)} file(s)."
+        if len(emb_files) != len(uploads):
+            response_data["detail"] += (
+                f"files {set(upload['filename'] for upload in uploads) - set(emb_files)} were not uploaded"
+            )
+        response_data["content"] = emb_files
+        response_data["chunks"] = {
+            "total": n_chunks,
+            "embedded": n_embedded_chunks,
+            "cached": n_chunks - n_embedded_chunks,
+            "added": n_added_chunks,
+            "unchanged": n_chunks - n_added_chunks,
+            "deleted": n_deleted_chunks,
+        }
+        response_data["embedding"] = embedding_pipeline.stats()
+    else:
+        response_data["status"] = "failed"
+        response_data["detail"] = "uploaded file(s) could not be uploaded or already exist in system"
+    if failed_files:
+        response_data["failed"] = failed_files
     return response_data
 
 
@@ -166,146 +402,48 @@ async def log_upsert(
 async def file_upsert(
     embedding_model: EmbeddingModel = EmbeddingModel.OPENAI_TEXT_EMBEDDING_MODEL,
     files: List[UploadFile] = File(...),
+    background: bool = False,
 ):
     """
-    Extract text from file(s) & save emb in a vector db
+    Extract text from file(s) & save emb in a vector db.
+    Files are keyed by their file name: a file replaces the chunks stored for a previous file of the same name,
+    also when it is an earlier version, so an upload with duplicate file names is rejected.
+    With background=true the files are queued as a job and its id is returned immediately with status 202.
     """
-    status_code = status.HTTP_200_OK
-    response_data = {}
-    emb_files = []
+    duplicate_names = [name for name, count in Counter(file.filename for file in files).items() if count > 1]
+    if duplicate_names:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"file names must be unique within an upload, {duplicate_names} are duplicated",
+        )
+    for file in files:
+        file_ext = os.path.splitext(file.filename)[1].lower()
+        if file_ext not in SUPPORTED_FILES_EXT:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Only files with extensions {SUPPORTED_FILES_EXT} supported. {file.filename} is invalid",
+            )
+    try:
+        uploads = await _persist_uploads(files)
+        if background:
+            return _job_accepted(
+                job_queue.submit(FILE_UPSERT_JOB, {"embedding_model": embedding_model.value, "uploads": uploads})
+            )
+        return await ingest_files(embedding_model.value, uploads)
+    except Exception as excep:
+        logger.exception("failed to upsert files: %s", excep)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="failed to upload files to server"
+        ) from excep
 
-    # Initialize Embedding Model once outside the loop
-    if embedding_model == EmbeddingModel.HUGGINGFACE_TEXT_EMBEDDING_MODEL:
-        emb = HuggingFaceEmbeddings(model_name=embedding_model.value)
-    else:
-        emb = OpenAIEmbeddings(model=embedding_model.value)
 
-    try:
-        for file in files:
-            file_ext = os.path.splitext(file.filename)[1].lower()
-            if file_ext not in SUPPORTED_FILES_EXT:
-                response_data["detail"] = (
-                    f"Only files with extensions {SUPPORTED_FILES_EXT} supported. {file.filename} is invalid"
-                )
-                raise ValueError(response_data["detail"])
+async def _log_upsert_job(payload: Dict, job: JobContext) -> Dict:
+    return await ingest_log_files(payload["logfile_type"], payload["log_file_id"], payload["uploads"], job)
 
-            f_content = await file.read()
-            f_name = file.filename
-            fmd5 = get_file_md5(f_content)
-            if entries_exist(mysql_conn, MYSQL_GENERAL_ID_TB_NAME, {"file_md5": fmd5}):
-                logger.info("%s already stored and indexed in db. Skipping", f_name)
-                continue
 
-            # insert log file entry into log_fid table if it didn't exist
-            fid_obj = {
-                "file_md5": fmd5,
-                "inserted_date": datetime.now().strftime("%Y-%m-%d"),
-                "file_type": file_ext,
-                "size": len(f_content) / 1024,
-            }  # size in KB
-            insertion_status = insert_data_into_sql(
-                mysql_conn,
-                tb_name=MYSQL_GENERAL_ID_TB_NAME,
-                data_dict=fid_obj,
-            )
-            if insertion_status["status"] == "failed":
-                raise ValueError(insertion_status["message"])
+async def _file_upsert_job(payload: Dict, job: JobContext) -> Dict:
+    return await ingest_files(payload["embedding_model"], payload["uploads"], job)
 
-            doc_id = str(uuid.uuid4())
-            fsave_path = osp.join(FILE_STORAGE_DIR, doc_id + osp.splitext(f_name)[-1])
-            with open(fsave_path, "wb") as f_write:
-                f_write.write(f_content)
-
-            # Load the data
-            f_ext = osp.splitext(file.filename)[-1].lower()
-            # Determine the best splitting strategy
-            splits = []
-
-            # 1. SPECIALIZED CODE SPLITTING
-            if f_ext in CODE_EXT_MAPPING:
-                lang = CODE_EXT_MAPPING[f_ext]
-                # .from_language automatically selects separators like 'def ', 'class ', etc.
-                splitter = RecursiveCharacterTextSplitter.from_language(language=lang, chunk_size=1200, chunk_overlap=150)
-                splits = splitter.create_documents([f_content.decode("utf-8")])
-
-            # 2. LATEX SUPPORT
-            elif f_ext == ".tex":
-                # Specifically looks for \section, \begin{itemize}, etc.
-                splitter = LatexTextSplitter(chunk_size=1000, chunk_overlap=100)
-                splits = splitter.create_documents([f_content.decode("utf-8")])
-
-            # 3. MARKDOWN (Structure-Aware)
-            elif f_ext == ".md":
-                headers_to_split_on = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3")]
-                md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-                # This returns documents with header info in metadata
-                splits = md_splitter.split_text(f_content.decode("utf-8"))
-
-            # 4. JSON (Structure-Aware Hierarchical Preservation)
-            elif f_ext == ".json":
-                import json
-
-                with open(fsave_path, "r") as f:
-                    data = json.load(f)
-                json_splitter = RecursiveJsonSplitter(max_chunk_size=1000)
-                splits = json_splitter.create_documents(texts=[data])
-
-            # 5. PDF
-            elif f_ext == ".pdf":
-                loader = PyMuPDFLoader(fsave_path)
-                docs = loader.load()
-                # PDFs are tricky; use recursive but with specific separators
-                splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1200, chunk_overlap=200, separators=["\n\n", "\n", ". ", " ", ""]
-                )
-                splits = splitter.split_documents(docs)
-
-            # 6. HTML (Structure-Aware)
-            elif f_ext == ".html":
-                # Split by HTML headers to keep sections together
-                headers_to_split_on = [("h1", "Header 1"), ("h2", "Header 2"), ("h3", "Header 3")]
-                html_splitter = HTMLHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-                splits = html_splitter.split_text_from_file(fsave_path)
-
-            else:
-                # Fallback: Semantic Chunking (Optional: requires langchain_experimental)
-                # This splits by topic boundaries rather than character count
-                loader = TextLoader(fsave_path)
-                docs = loader.load()
-                # splitter = SemanticChunker(emb, breakpoint_threshold_type="percentile")
-                splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-                splits = splitter.split_documents(docs)
-
-            # Add Metadata for "Answer-Sufficient" Context
-            # We tag each split with the source filename and a unique ID for parent retrieval
-            for i, split in enumerate(splits):
-                split.metadata.update(
-                    {"source": file.filename,
-                     "file_type": f_ext,
-                     "chunk_id": f"{fmd5}_{i}",
-                     "language": CODE_EXT_MAPPING.get(f_ext, "text")}
-                )
 
-            # Index in Vector Store
-            Chroma.from_documents(
-                documents=splits,
-                embedding=emb,
-                persist_directory=VECTOR_STORE_DIR,
-                collection_name="structured_knowledge",
-            )
-            emb_files.append(file.filename)
-        if len(emb_files) > 0:
-            response_data["status"] = "success"
-            response_data["detail"] = f"uploaded and embedded {len(emb_files)} file(s)."
-            if len(emb_files) != len(files):
-                response_data["detail"] += f"files {set(f.filename for f in files) - set(emb_files)} were not uploaded"
-            response_data["content"] = emb_files
-        else:
-            response_data["status"] = "failed"
-            response_data["detail"] = "uploaded file(s) could not be uploaded or already exist in system"
-    except Exception as excep:
-        logger.exception("failed to upsert files: %s", excep)
-        status_code = status.HTTP_400_BAD_REQUEST if status_code == status.HTTP_200_OK else status_code
-        detail = response_data.get("detail", "failed to upload files to server")
-        raise HTTPException(status_code=status_code, detail=detail) from excep
-    return response_data
+job_queue.register(LOG_UPSERT_JOB, _log_upsert_job)
+job_queue.register(FILE_UPSERT_JOB, _file_upsert_job)
@@ -0,0 +1,115 @@
+"""
+Vector store maintenance api: collection stats, de-duplication, compaction & hnsw tuning.
+Compaction & changes of M or ef_construction rebuild the collection, run them while no upsert is writing to it.
+"""
+
+import asyncio
+import logging
+from typing import Dict
+
+from fastapi import APIRouter, status, HTTPException
+
+from app.api.langchain_custom.answer_cache import answer_cache
+from app.api.langchain_custom.vector_store import vector_store_manager
+from app.api.langchain_custom.vector_store_admin import (
+    collection_stats,
+    dedupe_collection,
+    disk_usage,
+    rebuild_collection,
+    set_hnsw_params,
+)
+from app.models.model import HNSWParams
+
+
+router = APIRouter()
+logger = logging.getLogger("vector_store_route")
+
+
+def _get_collection(name: str):
+    try:
+        return vector_store_manager.client.get_collection(name)
+    except Exception as excep:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"collection {name} not found") from excep
+
+
+@router.get(
+    "/collections",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="Size, hnsw params & duplicate-chunk ratio of all collections",
+)
+async def list_collections():
+    """Returns the size, hnsw params & duplicate-chunk ratio of all collections and the on-disk footprint"""
+    client = vector_store_manager.client
+    collections = await asyncio.to_thread(client.list_collections)
+    stats = [await asyncio.to_thread(collection_stats, client, collection.name) for collection in collections]
+    disk_bytes = await asyncio.to_thread(disk_usage, vector_store_manager.persist_directory)
+    return {"status": "success", "disk_bytes": disk_bytes, "collections": stats}
+
+
+@router.get(
+    "/collections/{name}",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="Size, hnsw params & duplicate-chunk ratio of a collection",
+)
+async def get_collection_stats(name: str):
+    """Returns the size, hnsw params & duplicate-chunk ratio of a collection and the on-disk footprint"""
+    _get_collection(name)
+    stats = await asyncio.to_thread(
+        collection_stats, vector_store_manager.client, name, vector_store_manager.persist_directory
+    )
+    return {"status": "success", **stats}
+
+
+@router.post(
+    "/collections/{name}/dedupe",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="Delete chunks with identical embeddings",
+)
+async def dedupe(name: str):
+    """Deletes all but the first of the chunks of a collection with identical embeddings"""
+    collection = _get_collection(name)
+    deleted = await asyncio.to_thread(dedupe_collection, collection)
+    await asyncio.to_thread(answer_cache.bump_collection_version, name)
+    return {"status": "success", "collection": name, "deleted": deleted}
+
+
+@router.post(
+    "/collections/{name}/compact",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="Rebuild the index of a collection",
+)
+async def compact(name: str, dedupe: bool = False):
+    """Rebuilds the index of a collection without deleted records, optionally dropping identical embeddings"""
+    _get_collection(name)
+    try:
+        result = await asyncio.to_thread(rebuild_collection, vector_store_manager.client, name, None, dedupe)
+    finally:
+        vector_store_manager.forget_collection(name)
+        await asyncio.to_thread(answer_cache.bump_collection_version, name)
+    return {"status": "success", **result}
+
+
+@router.put(
+    "/collections/{name}/hnsw",
+    response_model=Dict,
+    status_code=status.HTTP_200_OK,
+    summary="Set the hnsw params of a collection",
+)
+async def update_hnsw_params(name: str, params: HNSWParams):
+    """
+    Sets M, ef_construction & ef_search of a collection.
+    ef_search is changed in place, M & ef_construction rebuild the collection
+    """
+    _get_collection(name)
+    try:
+        result = await asyncio.to_thread(
+            set_hnsw_params, vector_store_manager.client, name, params.M, params.ef_construction, params.ef_search
+        )
+    finally:
+        vector_store_manager.forget_collection(name)
+        await asyncio.to_thread(answer_cache.bump_collection_version, name)
+    return {"status": "success", **result}
@@ -1,8 +1,10 @@
 """FastAPI server entrypoint."""
 
 import argparse
+import asyncio
 import logging
 import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import uvicorn
@@ -13,7 +15,12 @@ from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
 import app.core.config as cfg
-from app.routes import qa, sql, summarize, upsert
+from app.api.jobs import job_queue
+from app.api.split_pool import split_pool
+from app.api.langchain_custom.answer_cache import answer_cache
+from app.api.langchain_custom.local_embeddings import local_embedding_registry
+from app.api.langchain_custom.vector_store import vector_store_manager
+from app.routes import jobs, qa, sql, summarize, upsert, vector_store
 
 logger = logging.getLogger("log_analyzer_server")
 STATIC_DIR = Path(__file__).resolve().parent / "static"
@@ -32,6 +39,21 @@ def _patch_binary_upload_schema(node):
             _patch_binary_upload_schema(value)
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Open application lifetime clients on startup and release them on shutdown."""
+    _ = vector_store_manager.client
+    if cfg.VECTOR_STORE_WARMUP:
+        await asyncio.to_thread(vector_store_manager.warm_up)
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    vector_store_manager.close()
+    answer_cache.close()
+    local_embedding_registry.close()
+    split_pool.shutdown()
+
+
 def create_application() -> FastAPI:
     """Create and configure the FastAPI app."""
     app = FastAPI(
@@ -39,6 +61,7 @@ def create_application() -> FastAPI:
         description=cfg.PROJECT_DESCRIPTION,
         debug=cfg.DEBUG,
         version=cfg.VERSION,
+        lifespan=lifespan,
     )
     app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
     app.add_middleware(
@@ -52,6 +75,8 @@ def create_application() -> FastAPI:
     app.include_router(qa.router, prefix="/qa", tags=["qa"])
     app.include_router(sql.router, prefix="/sql", tags=["sql"])
     app.include_router(summarize.router, prefix="/summarize", tags=["summarize"])
+    app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+    app.include_router(vector_store.router, prefix="/vector_store", tags=["vector_store"])
 
     def custom_openapi():
         if app.openapi_schema:
@@ -22,27 +22,69 @@ CREATE TABLE IF NOT EXISTS `log_fid` (
     PRIMARY KEY (file_md5)
 );
 
--- create anomaly detection log table
-CREATE TABLE IF NOT EXISTS `anomaly_detection_log` (
+-- dictionary tables for low-cardinality text columns repeated on every log row
+-- values use a binary collation so that dictionary lookups are exact
+CREATE TABLE IF NOT EXISTS `log_fid_dict` (
+    id INT NOT NULL AUTO_INCREMENT,
+    value VARCHAR(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+
+    PRIMARY KEY (id),
+    UNIQUE KEY uq_log_fid_dict_value (value)
+);
+
+CREATE TABLE IF NOT EXISTS `goal_type_dict` (
+    id SMALLINT NOT NULL AUTO_INCREMENT,
+    value VARCHAR(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+
+    PRIMARY KEY (id),
+    UNIQUE KEY uq_goal_type_dict_value (value)
+);
+
+-- create anomaly detection log data table
+CREATE TABLE IF NOT EXISTS `anomaly_detection_log_data` (
     ID INT NOT NULL AUTO_INCREMENT,
 
-    log_fid VARCHAR(32) NOT NULL,
+    log_fid_id INT NOT NULL,
     timestamp DATETIME(6) NOT NULL,
     inference_time FLOAT NOT NULL,
     prediction INT NOT NULL,
 
-    PRIMARY KEY (ID)
+    PRIMARY KEY (ID),
+    FOREIGN KEY (log_fid_id) REFERENCES log_fid_dict (id)
 );
 
-
--- create rta worker switch log table
-CREATE TABLE IF NOT EXISTS `rta_worker_switch_log` (
+-- create rta worker switch log data table
+CREATE TABLE IF NOT EXISTS `rta_worker_switch_log_data` (
     ID INT NOT NULL AUTO_INCREMENT,
 
-    log_fid VARCHAR(32) NOT NULL,
+    log_fid_id INT NOT NULL,
     timestamp DATETIME(6) NOT NULL,
-    goal_type VARCHAR(32) NOT NULL,
+    goal_type_id SMALLINT NOT NULL,
     rta_status INT NOT NULL,
 
-    PRIMARY KEY (ID)
+    PRIMARY KEY (ID),
+    FOREIGN KEY (log_fid_id) REFERENCES log_fid_dict (id),
+    FOREIGN KEY (goal_type_id) REFERENCES goal_type_dict (id)
 );
+
+-- decoded log views queried by text2sql and /sql/script
+CREATE OR REPLACE VIEW `anomaly_detection_log` AS
+SELECT
+    d.ID AS ID,
+    f.value AS log_fid,
+    d.timestamp AS timestamp,
+    d.inference_time AS inference_time,
+    d.prediction AS prediction
+FROM anomaly_detection_log_data d
+JOIN log_fid_dict f ON f.id = d.log_fid_id;
+
+CREATE OR REPLACE VIEW `rta_worker_switch_log` AS
+SELECT
+    d.ID AS ID,
+    f.value AS log_fid,
+    d.timestamp AS timestamp,
+    g.value AS goal_type,
+    d.rta_status AS rta_status
+FROM rta_worker_switch_log_data d
+JOIN log_fid_dict f ON f.id = d.log_fid_id
+JOIN goal_type_dict g ON g.id = d.goal_type_id;
@@ -0,0 +1,91 @@
+-- Migrates databases created before dictionary encoding of log columns.
+-- The original log tables are renamed, their rows copied into the dictionary-encoded
+-- data tables and the original names are replaced by decoded views.
+-- Run once with: mariadb -u root -p $MYSQL_DATABASE < 001_dictionary_encode_log_columns.sql
+
+CREATE TABLE IF NOT EXISTS `log_fid_dict` (
+    id INT NOT NULL AUTO_INCREMENT,
+    value VARCHAR(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+
+    PRIMARY KEY (id),
+    UNIQUE KEY uq_log_fid_dict_value (value)
+);
+
+CREATE TABLE IF NOT EXISTS `goal_type_dict` (
+    id SMALLINT NOT NULL AUTO_INCREMENT,
+    value VARCHAR(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+
+    PRIMARY KEY (id),
+    UNIQUE KEY uq_goal_type_dict_value (value)
+);
+
+CREATE TABLE IF NOT EXISTS `anomaly_detection_log_data` (
+    ID INT NOT NULL AUTO_INCREMENT,
+
+    log_fid_id INT NOT NULL,
+    timestamp DATETIME(6) NOT NULL,
+    inference_time FLOAT NOT NULL,
+    prediction INT NOT NULL,
+
+    PRIMARY KEY (ID),
+    FOREIGN KEY (log_fid_id) REFERENCES log_fid_dict (id)
+);
+
+CREATE TABLE IF NOT EXISTS `rta_worker_switch_log_data` (
+    ID INT NOT NULL AUTO_INCREMENT,
+
+    log_fid_id INT NOT NULL,
+    timestamp DATETIME(6) NOT NULL,
+    goal_type_id SMALLINT NOT NULL,
+    rta_status INT NOT NULL,
+
+    PRIMARY KEY (ID),
+    FOREIGN KEY (log_fid_id) REFERENCES log_fid_dict (id),
+    FOREIGN KEY (goal_type_id) REFERENCES goal_type_dict (id)
+);
+
+RENAME TABLE `anomaly_detection_log` TO `anomaly_detection_log_legacy`,
+             `rta_worker_switch_log` TO `rta_worker_switch_log_legacy`;
+
+INSERT IGNORE INTO log_fid_dict (value)
+SELECT DISTINCT log_fid FROM anomaly_detection_log_legacy
+UNION
+SELECT DISTINCT log_fid FROM rta_worker_switch_log_legacy;
+
+INSERT IGNORE INTO goal_type_dict (value)
+SELECT DISTINCT goal_type FROM rta_worker_switch_log_legacy;
+
+INSERT INTO anomaly_detection_log_data (ID, log_fid_id, timestamp, inference_time, prediction)
+SELECT l.ID, f.id, l.timestamp, l.inference_time, l.prediction
+FROM anomaly_detection_log_legacy l
+JOIN log_fid_dict f ON f.value = l.log_fid;
+
+INSERT INTO rta_worker_switch_log_data (ID, log_fid_id, timestamp, goal_type_id, rta_status)
+SELECT l.ID, f.id, l.timestamp, g.id, l.rta_status
+FROM rta_worker_switch_log_legacy l
+JOIN log_fid_dict f ON f.value = l.log_fid
+JOIN goal_type_dict g ON g.value = l.goal_type;
+
+CREATE OR REPLACE VIEW `anomaly_detection_log` AS
+SELECT
+    d.ID AS ID,
+    f.value AS log_fid,
+    d.timestamp AS timestamp,
+    d.inference_time AS inference_time,
+    d.prediction AS prediction
+FROM anomaly_detection_log_data d
+JOIN log_fid_dict f ON f.id = d.log_fid_id;
+
+CREATE OR REPLACE VIEW `rta_worker_switch_log` AS
+SELECT
+    d.ID AS ID,
+    f.value AS log_fid,
+    d.timestamp AS timestamp,
+    g.value AS goal_type,
+    d.rta_status AS rta_status
+FROM rta_worker_switch_log_data d
+JOIN log_fid_dict f ON f.id = d.log_fid_id
+JOIN goal_type_dict g ON g.id = d.goal_type_id;
+
+-- drop the legacy tables once the migrated views have been verified
+-- DROP TABLE anomaly_detection_log_legacy, rta_worker_switch_log_legacy;
@@ -1,3 +1,5 @@
+import time
+
 import requests
 import streamlit as st
 
@@ -33,6 +35,22 @@ def post_api(endpoint, param_dict):
     return response.json()
 
 
+def wait_for_job(job_id, poll_interval=1.0):
+    """
+    Poll a background ingestion job, showing its stage & progress, until it finishes
+    """
+    progress_bar = st.progress(0.0, text="queued")
+    while True:
+        response = requests.get(f"{API_URL}/jobs/{job_id}", timeout=30)
+        response.raise_for_status()
+        job = response.json()
+        fraction = job["progress"]["fraction"] or 0.0
+        progress_bar.progress(fraction, text=f"{job['stage']} ({job['progress']['done']}/{job['progress']['total']})")
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(poll_interval)
+
+
 # Mapping option to functionality
 if option == "Question Answering":
     model = st.selectbox("Select model:", [model.value for model in LLMModel])
@@ -104,10 +122,10 @@ elif option == "Upsert Logs":
         files = [("files", (log.name, log.read(), "text/plain")) for log in uploaded_logs]
         try:
             result = post_api(
-                f"upsert/logs?log_type={log_type}",
+                f"upsert/logs?log_type={log_type}&background=true",
                 {"files": files, "data": {"log_file_id": log_file_id}},
             )
-            st.write(result)
+            st.write(wait_for_job(result["job_id"]))
         except requests.RequestException as excep:
             st.error(str(excep))
 
@@ -116,7 +134,7 @@ elif option == "Upsert Files":
     if st.button("Upsert Files"):
         files = [("files", (file.name, file.read(), "text/plain")) for file in uploaded_files]
         try:
-            result = post_api("upsert/files", {"files": files})
-            st.write(result)
+            result = post_api("upsert/files?background=true", {"files": files})
+            st.write(wait_for_job(result["job_id"]))
         except requests.RequestException as excep:
             st.error(str(excep))
@@ -1,4 +1,16 @@
-from langchain_text_splitters import Language
+import json
+from typing import List, Optional
+
+from langchain_core.documents import Document
+from langchain_community.document_loaders import TextLoader
+from langchain_text_splitters import (
+    HTMLHeaderTextSplitter,
+    Language,
+    LatexTextSplitter,
+    MarkdownHeaderTextSplitter,
+    RecursiveCharacterTextSplitter,
+    RecursiveJsonSplitter,
+)
 
 
 CODE_EXT_MAPPING = {
@@ -14,3 +26,93 @@ CODE_EXT_MAPPING = {
     ".rb": Language.RUBY,
     ".sol": Language.SOL,  # Solidity
 }
+
+PDF_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+
+def read_text(fpath: str) -> str:
+    """Utf-8 text of the file at fpath"""
+    with open(fpath, "rb") as f_read:
+        return f_read.read().decode("utf-8")
+
+
+def count_pdf_pages(fpath: str) -> int:
+    """Number of pages of the pdf at fpath"""
+    import pymupdf
+
+    with pymupdf.open(fpath) as doc:
+        return doc.page_count
+
+
+def split_pdf_pages(fpath: str, start: int = 0, end: Optional[int] = None) -> List[Document]:
+    """
+    Extract the text of pages [start, end) of the pdf at fpath, one document per page like PyMuPDFLoader,
+    and split them. Pages are split independently, so splitting page ranges separately gives the same chunks.
+    """
+    import pymupdf
+
+    with pymupdf.open(fpath) as doc:
+        end = doc.page_count if end is None else min(end, doc.page_count)
+        doc_metadata = {key.lower(): value for key, value in (doc.metadata or {}).items() if value}
+        doc_metadata.update({"source": fpath, "file_path": fpath, "total_pages": doc.page_count})
+        docs = [
+            Document(page_content=doc[page].get_text().strip(), metadata={**doc_metadata, "page": page})
+            for page in range(start, end)
+        ]
+    # PDFs are tricky; use recursive but with specific separators
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=200, separators=PDF_SEPARATORS)
+    return splitter.split_documents(docs)
+
+
+def split_file(fsave_path: str, f_ext: str) -> List[Document]:
+    """Load the stored file & split it with the best splitting strategy of its extension"""
+    # Determine the best splitting strategy
+    splits = []
+
+    # 1. SPECIALIZED CODE SPLITTING
+    if f_ext in CODE_EXT_MAPPING:
+        lang = CODE_EXT_MAPPING[f_ext]
+        # .from_language automatically selects separators like 'def ', 'class ', etc.
+        splitter = RecursiveCharacterTextSplitter.from_language(language=lang, chunk_size=1200, chunk_overlap=150)
+        splits = splitter.create_documents([read_text(fsave_path)])
+
+    # 2. LATEX SUPPORT
+    elif f_ext == ".tex":
+        # Specifically looks for \section, \begin{itemize}, etc.
+        splitter = LatexTextSplitter(chunk_size=1000, chunk_overlap=100)
+        splits = splitter.create_documents([read_text(fsave_path)])
+
+    # 3. MARKDOWN (Structure-Aware)
+    elif f_ext == ".md":
+        headers_to_split_on = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3")]
+        md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
+        # This returns documents with header info in metadata
+        splits = md_splitter.split_text(read_text(fsave_path))
+
+    # 4. JSON (Structure-Aware Hierarchical Preservation)
+    elif f_ext == ".json":
+        with open(fsave_path, "r") as f:
+            data = json.load(f)
+        json_splitter = RecursiveJsonSplitter(max_chunk_size=1000)
+        splits = json_splitter.create_documents(texts=[data])
+
+    # 5. PDF
+    elif f_ext == ".pdf":
+        splits = split_pdf_pages(fsave_path)
+
+    # 6. HTML (Structure-Aware)
+    elif f_ext == ".html":
+        # Split by HTML headers to keep sections together
+        headers_to_split_on = [("h1", "Header 1"), ("h2", "Header 2"), ("h3", "Header 3")]
+        html_splitter = HTMLHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
+        splits = html_splitter.split_text_from_file(fsave_path)
+
+    else:
+        # Fallback: Semantic Chunking (Optional: requires langchain_experimental)
+        # This splits by topic boundaries rather than character count
+        loader = TextLoader(fsave_path)
+        docs = loader.load()
+        # splitter = SemanticChunker(emb, breakpoint_threshold_type="percentile")
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
+        splits = splitter.split_documents(docs)
+    return splits
@@ -3,11 +3,14 @@ Common utils
 """
 
 import os
+import json
 import time
 import hashlib
 import logging
 import functools
-from typing import Callable, Union
+from typing import BinaryIO, Callable, Tuple, Union
+
+from fastapi.encoders import jsonable_encoder
 
 logger = logging.getLogger("timeit_decorator")
 
@@ -74,6 +77,28 @@ def get_file_md5(file: Union[str, bytes], byte_chunk: int = 8192) -> str:
     return hash_md5.hexdigest()
 
 
+def spool_file_md5(src: BinaryIO, dest_path: str, byte_chunk: int = 1 << 20) -> Tuple[str, int]:
+    """
+    Copies the file object src to dest_path byte_chunk bytes at a time while calculating its MD5 hash,
+    so that at most byte_chunk bytes of the file are held in memory.
+    Returns: The MD5 hash (str) and the size in bytes (int) of the file.
+    """
+    hash_md5 = hashlib.md5()
+    size = 0
+    src.seek(0)
+    with open(dest_path, "wb") as f_write:
+        for chunk in iter(lambda: src.read(byte_chunk), b""):
+            hash_md5.update(chunk)
+            f_write.write(chunk)
+            size += len(chunk)
+    return hash_md5.hexdigest(), size
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
 def parse_num_str(string: str):
     """
     Parses a string to possibly extract a number.
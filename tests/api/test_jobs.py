@@ -0,0 +1,117 @@
+"""
+Test the on-disk background job queue
+"""
+
+import time
+import asyncio
+import sqlite3
+
+from app.api.jobs import JobContext, JobQueue, JobStore
+from app.models.model import JobStatus
+
+
+async def _ingest(payload, job):
+    job.update(stage="parsing", done=0, total=len(payload["items"]))
+    for i, _ in enumerate(payload["items"]):
+        job.update(stage="inserting", done=i + 1, entries=(i + 1) * 10)
+    return {"status": "success", "n_items": len(payload["items"])}
+
+
+async def _fail(payload, job):
+    job.update(stage="parsing")
+    raise ValueError("bad log file")
+
+
+async def _wait_until_finished(queue: JobQueue, job_id: str, timeout: float = 5.0) -> dict:
+    for _ in range(int(timeout / 0.01)):
+        job = queue.get(job_id)
+        if job["status"] in (JobStatus.SUCCEEDED.value, JobStatus.FAILED.value):
+            return job
+        await asyncio.sleep(0.01)
+    raise TimeoutError(f"job {job_id} did not finish")
+
+
+def test_job_queue_runs_jobs_and_reports_progress(tmp_path):
+    async def _run():
+        queue = JobQueue(str(tmp_path / "jobs.sqlite3"), n_workers=2, poll_interval=0.05)
+        queue.register("ingest", _ingest)
+        queue.register("fail", _fail)
+        await queue.start()
+        try:
+            ok_id = queue.submit("ingest", {"items": [1, 2, 3]})
+            failed_id = queue.submit("fail", {})
+            return await _wait_until_finished(queue, ok_id), await _wait_until_finished(queue, failed_id)
+        finally:
+            await queue.stop()
+
+    ok_job, failed_job = asyncio.run(_run())
+
+    assert ok_job["status"] == "succeeded" and ok_job["stage"] == "done"
+    assert ok_job["progress"] == {"done": 3, "total": 3, "fraction": 1.0}
+    assert ok_job["metrics"] == {"entries": 30}
+    assert "entries_per_s" in ok_job["throughput"]
+    assert ok_job["result"] == {"status": "success", "n_items": 3}
+    assert failed_job["status"] == "failed"
+    assert failed_job["error"] == "bad log file"
+
+
+def test_job_store_requeues_jobs_with_expired_lease(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create("ingest", {"items": []})
+    job = store.claim_next("host:1", lease=60)
+    assert job["id"] == job_id and job["owner"] == "host:1"
+    # a live lease is neither claimed by nor requeued for another worker process
+    assert store.claim_next("host:2", lease=60) is None
+    assert store.requeue_expired() == 0
+    assert store.renew_lease(job_id, "host:1", lease=60)
+    assert not store.renew_lease(job_id, "host:2", lease=60)
+
+    store.update(job_id, lease_expires=time.time() - 1)
+    job = store.claim_next("host:2", lease=60)
+    assert job["id"] == job_id and job["owner"] == "host:2"
+    assert not store.renew_lease(job_id, "host:1", lease=60)
+
+    assert store.release("host:1") == 0
+    assert store.release("host:2") == 1
+    job = store.get(job_id)
+    assert job["status"] == JobStatus.QUEUED.value and job["started_at"] is None and job["owner"] is None
+    store.close()
+
+
+def test_job_store_adds_lease_columns_to_existing_table(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, stage TEXT, "
+        "payload TEXT NOT NULL, done INTEGER NOT NULL DEFAULT 0, total INTEGER, metrics TEXT NOT NULL DEFAULT '{}', "
+        "result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+    )
+    conn.execute(
+        "INSERT INTO jobs (id, kind, status, payload, created_at, started_at) VALUES ('a', 'ingest', ?, '{}', 1, 2)",
+        (JobStatus.RUNNING.value,),
+    )
+    conn.commit()
+    conn.close()
+
+    store = JobStore(path)
+    # a job claimed before leases were recorded is requeued
+    assert store.requeue_expired() == 1
+    assert store.claim_next("host:1", lease=60)["id"] == "a"
+    store.close()
+
+
+def test_job_context_updates_from_threads(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create("ingest", {"items": []})
+
+    async def _run():
+        job = JobContext(store, job_id, asyncio.get_running_loop())
+        job.update(stage="parsing", done=0, total=2)
+        await asyncio.to_thread(job.update, stage="inserting", done=1, entries=10)
+        job.update(done=2, entries=20)
+        await job.flush()
+
+    asyncio.run(_run())
+    job = store.get(job_id)
+    assert (job["stage"], job["done"], job["total"], job["metrics"]) == ("inserting", 2, 2, {"entries": 20})
+    store.close()
@@ -0,0 +1,113 @@
+"""
+Test the /qa answer cache: keys, collection versions, eviction, the disk tier & request coalescing
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.api.langchain_custom.answer_cache import (
+    CACHE_COALESCED,
+    CACHE_HIT,
+    CACHE_MISS,
+    AnswerCache,
+    answer_cache_key,
+)
+
+
+def _counting_compute(calls: list, answer: str = "42", delay: float = 0.0):
+    async def _compute():
+        calls.append(answer)
+        await asyncio.sleep(delay)
+        return {"answer": answer}
+
+    return _compute
+
+
+def test_answer_cache_key():
+    key = answer_cache_key("What is E-1023?", "gpt-4o-mini", {"k": 6}, "knowledge", 1)
+
+    assert key == answer_cache_key("  what is  e-1023? ", "gpt-4o-mini", {"k": 6}, "knowledge", 1)
+    assert key != answer_cache_key("What is E-1023?", "gpt-4o", {"k": 6}, "knowledge", 1)
+    assert key != answer_cache_key("What is E-1023?", "gpt-4o-mini", {"k": 3}, "knowledge", 1)
+    assert key != answer_cache_key("What is E-1023?", "gpt-4o-mini", {"k": 6}, "knowledge", 2)
+
+
+def test_answer_cache_lru_and_ttl():
+    cache = AnswerCache(capacity=2, ttl=0.05)
+    calls = []
+
+    async def _run():
+        for key in ("a", "b", "a", "c"):
+            await cache.get_or_compute(key, "knowledge", 0, _counting_compute(calls, key))
+        # b was the least recently used
+        assert (await cache.get_or_compute("a", "knowledge", 0, _counting_compute(calls)))[1] == CACHE_HIT
+        assert (await cache.get_or_compute("b", "knowledge", 0, _counting_compute(calls)))[1] == CACHE_MISS
+        time.sleep(0.06)
+        assert (await cache.get_or_compute("b", "knowledge", 0, _counting_compute(calls)))[1] == CACHE_MISS
+
+    asyncio.run(_run())
+    assert len(calls) == 5
+
+
+def test_answer_cache_coalesces_concurrent_requests():
+    cache = AnswerCache(capacity=8, ttl=60)
+    calls = []
+
+    async def _run():
+        return await asyncio.gather(
+            *[cache.get_or_compute("key", "knowledge", 0, _counting_compute(calls, delay=0.05)) for _ in range(10)]
+        )
+
+    results = asyncio.run(_run())
+    assert len(calls) == 1
+    assert all(value == {"answer": "42"} for value, _ in results)
+    assert sorted(status for _, status in results) == [CACHE_COALESCED] * 9 + [CACHE_MISS]
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_answer_cache_errors_are_not_cached():
+    cache = AnswerCache(capacity=8, ttl=60)
+
+    async def _failing():
+        raise RuntimeError("llm unavailable")
+
+    async def _run():
+        results = await asyncio.gather(
+            *[cache.get_or_compute("key", "knowledge", 0, _failing) for _ in range(3)], return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        return await cache.get_or_compute("key", "knowledge", 0, _counting_compute([]))
+
+    assert asyncio.run(_run()) == ({"answer": "42"}, CACHE_MISS)
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_answer_cache_collection_versions(tmp_path, on_disk):
+    path = str(tmp_path / "answers.sqlite3") if on_disk else None
+    cache = AnswerCache(capacity=8, ttl=60, path=path)
+    calls = []
+
+    async def _ask():
+        version = cache.collection_version("knowledge")
+        key = answer_cache_key("question", "gpt-4o-mini", {}, "knowledge", version)
+        return await cache.get_or_compute(key, "knowledge", version, _counting_compute(calls))
+
+    assert asyncio.run(_ask())[1] == CACHE_MISS
+    assert asyncio.run(_ask())[1] == CACHE_HIT
+    assert cache.bump_collection_version("knowledge") == 1
+    assert asyncio.run(_ask())[1] == CACHE_MISS
+    assert len(calls) == 2
+    cache.close()
+
+    if on_disk:
+        # answers & versions survive a restart
+        restarted = AnswerCache(capacity=8, ttl=60, path=path)
+        assert restarted.collection_version("knowledge") == 1
+        version = restarted.collection_version("knowledge")
+        key = answer_cache_key("question", "gpt-4o-mini", {}, "knowledge", version)
+        value, status = asyncio.run(restarted.get_or_compute(key, "knowledge", version, _counting_compute(calls)))
+        assert (value, status) == ({"answer": "42"}, CACHE_HIT)
+        assert restarted.stats()["disk_hits"] == 1
+        restarted.close()
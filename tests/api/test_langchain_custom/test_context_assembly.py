@@ -0,0 +1,80 @@
+"""
+Test the assembly of the /qa prompt context
+"""
+
+import random
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.api.langchain_custom.context_assembly import (
+    assemble_context,
+    hamming_distance,
+    join_overlapping,
+    simhash,
+)
+from app.api.langchain_custom.tokens import count_tokens
+
+_BOILERPLATE = "Copyright 2024 robotics fleet operations. All rights reserved. Confidential, do not distribute. " * 4
+
+
+def _split_text():
+    rng = random.Random(0)
+    words = "rta worker switched goal type patrol status error node charging dock".split()
+    text = " ".join(rng.choice(words) + ("." if rng.random() < 0.1 else "") for _ in range(1500))
+    chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150).split_text(text)
+    docs = [
+        Document(page_content=chunk, metadata={"source": "a.txt", "chunk_index": i}) for i, chunk in enumerate(chunks)
+    ]
+    return text, docs
+
+
+def test_simhash_near_duplicates():
+    assert hamming_distance(simhash(_BOILERPLATE), simhash(_BOILERPLATE + " Page 2")) <= 6
+    assert hamming_distance(simhash(_BOILERPLATE), simhash(_split_text()[0])) > 10
+
+
+def test_join_overlapping():
+    assert join_overlapping("the rta worker switched to patrol", "switched to patrol mode") == (
+        "the rta worker switched to patrol mode"
+    )
+    assert join_overlapping("first page", "second page") == "first page\nsecond page"
+
+
+def test_assemble_context_merges_adjacent_chunks_and_drops_duplicates():
+    text, docs = _split_text()
+    selected = [
+        docs[3],
+        docs[1],
+        Document(page_content=_BOILERPLATE, metadata={"source": "b.txt", "chunk_index": 0}),
+        docs[2],
+        Document(page_content=_BOILERPLATE + " Page 2", metadata={"source": "c.txt", "chunk_index": 5}),
+        docs[6],
+    ]
+    assembled = assemble_context(selected, token_budget=10_000)
+
+    assert assembled.merged == 2
+    assert assembled.duplicates == 1
+    assert assembled.trimmed == 0
+    # chunks 1-3 are merged into the original text at the rank of chunk 3
+    assert assembled.documents[0].metadata["chunk_indexes"] == [1, 2, 3]
+    assert assembled.documents[0].page_content in text
+    assert [doc.metadata["source"] for doc in assembled.documents] == ["a.txt", "b.txt", "a.txt"]
+    assert assembled.tokens < assembled.raw_tokens
+    assert assembled.tokens == count_tokens(assembled.text)
+
+
+def test_assemble_context_trims_to_token_budget():
+    _, docs = _split_text()
+    selected = [docs[0], docs[4], docs[8]]
+    budget = count_tokens(docs[0].page_content) + 100
+    assembled = assemble_context(selected, token_budget=budget)
+
+    assert assembled.tokens <= budget
+    assert assembled.trimmed == 2
+    assert assembled.documents[0].page_content == docs[0].page_content
+    assert docs[4].page_content.startswith(assembled.documents[1].page_content)
+
+    assembled = assemble_context(selected, token_budget=10)
+    assert len(assembled.documents) == 1
+    assert assembled.tokens <= 10
@@ -0,0 +1,87 @@
+"""
+Test query embedding caches
+"""
+
+from typing import List
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app.api.langchain_custom.embedding_cache import (
+    CachedQueryEmbeddings,
+    SQLiteEmbeddingStore,
+    embed_documents_cached,
+)
+
+
+class _CountingEmbeddings(Embeddings):
+    """Deterministic embeddings counting the embedded texts"""
+
+    def __init__(self):
+        self.embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def test_cached_query_embeddings_memory_tier():
+    embeddings = _CountingEmbeddings()
+    cached = CachedQueryEmbeddings(embeddings, "test-model", capacity=2)
+
+    vector = cached.embed_query("What happened today?")
+    assert cached.embed_query("  what happened   TODAY? ") == vector
+    cached.embed_query("second query")
+    cached.embed_query("third query")  # evicts the first query
+    cached.embed_query("What happened today?")
+
+    assert len(embeddings.embedded) == 4
+    stats = cached.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 4
+    assert stats["memory_size"] == 2
+
+
+def test_cached_query_embeddings_disk_tier_survives_restart(tmp_path):
+    db_path = str(tmp_path / "query_embedding_cache.sqlite3")
+    embeddings = _CountingEmbeddings()
+    cached = CachedQueryEmbeddings(embeddings, "test-model", store=SQLiteEmbeddingStore(db_path))
+    vector = cached.embed_query("What happened today?")
+
+    restarted = CachedQueryEmbeddings(embeddings, "test-model", store=SQLiteEmbeddingStore(db_path))
+    assert restarted.embed_query("What happened today?") == pytest.approx(vector)
+    assert restarted.stats()["disk_hits"] == 1
+    # other models do not share vectors
+    other_model = CachedQueryEmbeddings(embeddings, "other-model", store=SQLiteEmbeddingStore(db_path))
+    other_model.embed_query("What happened today?")
+    assert len(embeddings.embedded) == 2
+
+
+def test_sqlite_embedding_store_bulk_lookup(tmp_path):
+    store = SQLiteEmbeddingStore(str(tmp_path / "embeddings.sqlite3"))
+    store.put_many("test-model", {f"key_{i}": [float(i), 1.0] for i in range(1200)})
+
+    found = store.get_many("test-model", [f"key_{i}" for i in range(0, 1300, 2)])
+    assert len(found) == 600
+    assert found["key_10"] == [10.0, 1.0]
+    assert len(store) == 1200
+
+
+def test_embed_documents_cached_only_embeds_new_chunks(tmp_path):
+    store = SQLiteEmbeddingStore(str(tmp_path / "chunk_embedding_cache.sqlite3"))
+    embeddings = _CountingEmbeddings()
+    chunks = [f"chunk {i}" for i in range(300)]
+
+    vectors, n_embedded = embed_documents_cached(embeddings, "test-model", chunks + ["chunk 0"], store)
+    assert n_embedded == 300
+    assert vectors[0] == vectors[-1]
+
+    edited_chunks = chunks[:150] + ["edited chunk 150"] + chunks[151:]
+    embeddings.embedded.clear()
+    edited_vectors, n_embedded = embed_documents_cached(embeddings, "test-model", edited_chunks, store)
+    assert n_embedded == 1
+    assert embeddings.embedded == ["edited chunk 150"]
+    assert edited_vectors[0] == pytest.approx(vectors[0])
@@ -0,0 +1,80 @@
+"""
+Test the batched, concurrent embedding pipeline
+"""
+
+import asyncio
+
+import httpx
+import openai
+
+from app.api.langchain_custom.embedding_pipeline import EmbeddingPipeline, make_batches
+
+
+def _rate_limit_error() -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    return openai.RateLimitError("rate limited", response=httpx.Response(429, request=request), body=None)
+
+
+class _FakeEmbeddings:
+    """Embeds a text as [len(text)], failing the first n_failures calls with a rate limit error"""
+
+    def __init__(self, n_failures: int = 0, delay: float = 0.0):
+        self.n_failures = n_failures
+        self.delay = delay
+        self.batches = []
+        self.in_flight = self.max_in_flight = 0
+
+    async def aembed_documents(self, texts):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # later batches finish first to check the reassembly order
+            await asyncio.sleep(self.delay / (len(self.batches) + 1))
+            self.batches.append(list(texts))
+            if self.n_failures > 0:
+                self.n_failures -= 1
+                raise _rate_limit_error()
+            return [[float(len(text))] for text in texts]
+        finally:
+            self.in_flight -= 1
+
+
+def test_make_batches():
+    assert make_batches([1] * 5, batch_size=2, batch_tokens=100) == [(0, 2), (2, 4), (4, 5)]
+    assert make_batches([40, 40, 40, 200, 10], batch_size=10, batch_tokens=100) == [(0, 2), (2, 3), (3, 4), (4, 5)]
+    assert make_batches([], batch_size=2, batch_tokens=100) == []
+
+
+def test_pipeline_embeds_concurrently_in_order():
+    texts = ["x" * i for i in range(1, 11)]
+    embeddings = _FakeEmbeddings(delay=0.05)
+    pipeline = EmbeddingPipeline(embeddings, batch_size=3, max_concurrency=2)
+
+    vectors = asyncio.run(pipeline.aembed_documents(texts))
+
+    assert vectors == [[float(i)] for i in range(1, 11)]
+    assert len(embeddings.batches) == 4
+    assert embeddings.max_in_flight == 2
+    stats = pipeline.stats()
+    assert stats["chunks"] == 10 and stats["batches"] == 4 and stats["retries"] == 0
+    assert stats["chunks_per_s"] > 0 and stats["tokens_per_s"] > 0
+
+
+def test_pipeline_retries_rate_limits():
+    embeddings = _FakeEmbeddings(n_failures=2)
+    pipeline = EmbeddingPipeline(embeddings, batch_size=10, max_retries=2, backoff=0.001)
+
+    vectors = asyncio.run(pipeline.aembed_documents(["a", "bb"]))
+
+    assert vectors == [[1.0], [2.0]]
+    assert pipeline.stats()["retries"] == 2
+
+
+def test_pipeline_gives_up_after_max_retries():
+    pipeline = EmbeddingPipeline(_FakeEmbeddings(n_failures=3), max_retries=1, backoff=0.001)
+    try:
+        asyncio.run(pipeline.aembed_documents(["a"]))
+    except openai.RateLimitError:
+        pass
+    else:
+        raise AssertionError("expected the rate limit error to be raised")
@@ -0,0 +1,111 @@
+"""
+Test the bm25 lexical index & hybrid retrieval with reciprocal rank fusion
+"""
+
+import hashlib
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.api.langchain_custom.hybrid_retrieval import hybrid_search, reciprocal_rank_fusion
+from app.api.langchain_custom.lexical_index import LexicalIndex, fts_query
+from app.api.langchain_custom.vector_store import (
+    VectorStoreManager,
+    add_embedded_documents,
+    metadata_where,
+    stable_chunk_ids,
+)
+
+_TEXTS = [f"node-{i:02d} reported goal_type patrol with status ok" for i in range(30)] + [
+    "rta worker failed with error E-1023 on node-07"
+]
+
+
+class _HashEmbeddings(Embeddings):
+    """Deterministic embeddings unrelated to the text meaning"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [byte / 255 for byte in hashlib.md5(text.encode("utf-8")).digest()[:8]]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], rrf_k=60)
+
+    assert [doc_id for doc_id, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == 1 / 61 + 1 / 62
+
+
+def test_fts_query_escapes_syntax():
+    assert fts_query('E-1023 "node" AND') == '"E-1023" OR """node""" OR "AND"'
+    assert fts_query("  ") is None
+
+
+def test_lexical_index_sync_source(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    ids = stable_chunk_ids("a.txt", _TEXTS)
+    index.add("knowledge", ids, _TEXTS, ["a.txt"] * len(ids))
+
+    assert index.search("knowledge", "what does E-1023 mean?", 3)[0][0] == ids[-1]
+    assert index.search("other", "E-1023", 3) == []
+    assert index.search("knowledge", 'unbalanced "quote (', 3) == []
+
+    assert index.sync_source("knowledge", "a.txt", ids[:10], _TEXTS[:10]) == len(ids) - 10
+    assert index.count("knowledge") == 10
+    assert index.search("knowledge", "E-1023", 3) == []
+    index.close()
+
+
+def test_hybrid_search_finds_exact_tokens(tmp_path):
+    manager = VectorStoreManager(
+        str(tmp_path / "vector_store"),
+        load_embeddings=lambda _: _HashEmbeddings(),
+        lexical_index_path=str(tmp_path / "lexical.sqlite3"),
+    )
+    vector_store = manager.get_vector_store("knowledge")
+    ids = stable_chunk_ids("a.txt", _TEXTS)
+    documents = [Document(page_content=text, metadata={"source": "a.txt"}) for text in _TEXTS]
+    add_embedded_documents(vector_store, documents, _HashEmbeddings().embed_documents(_TEXTS), ids)
+
+    # the lexical index is reconciled with the collection on warm up
+    manager.warm_up("knowledge")
+    lexical_index = manager.get_lexical_index()
+    assert lexical_index.count("knowledge") == len(_TEXTS)
+
+    docs = hybrid_search(vector_store, lexical_index, "E-1023", k=3, fetch_k=5)
+    assert len(docs) == 3
+    assert "rta worker failed with error E-1023 on node-07" in [doc.page_content for doc in docs]
+
+    # chunks deleted from the collection only are skipped
+    vector_store._collection.delete(ids=[ids[-1]])
+    docs = hybrid_search(vector_store, lexical_index, "E-1023", k=3, fetch_k=5)
+    assert all("E-1023" not in doc.page_content for doc in docs)
+    manager.close()
+
+
+def test_hybrid_search_applies_metadata_filters(tmp_path):
+    manager = VectorStoreManager(
+        str(tmp_path / "vector_store"),
+        load_embeddings=lambda _: _HashEmbeddings(),
+        lexical_index_path=str(tmp_path / "lexical.sqlite3"),
+    )
+    vector_store = manager.get_vector_store("knowledge")
+    lexical_index = manager.get_lexical_index()
+    for source, file_type, ingested_at in (("a.txt", ".txt", 100), ("b.pdf", ".pdf", 200)):
+        ids = stable_chunk_ids(source, _TEXTS)
+        metadata = {"source": source, "file_type": file_type, "ingested_at": ingested_at}
+        documents = [Document(page_content=text, metadata=metadata) for text in _TEXTS]
+        add_embedded_documents(vector_store, documents, _HashEmbeddings().embed_documents(_TEXTS), ids)
+        lexical_index.sync_source("knowledge", source, ids, _TEXTS)
+
+    docs = hybrid_search(vector_store, lexical_index, "E-1023", k=10, where=metadata_where(sources=["b.pdf"]))
+    assert len(docs) == 10
+    assert {doc.metadata["source"] for doc in docs} == {"b.pdf"}
+    assert "rta worker failed with error E-1023 on node-07" in [doc.page_content for doc in docs]
+
+    docs = hybrid_search(vector_store, lexical_index, "E-1023", k=10, where={"ingested_at": {"$lte": 150}})
+    assert {doc.metadata["file_type"] for doc in docs} == {".txt"}
+    manager.close()
@@ -0,0 +1,75 @@
+"""
+Test the local embedding model registry & micro-batching
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.api.langchain_custom.local_embeddings import LocalEmbeddingRegistry, MicroBatchingEmbeddings
+
+
+class _FakeModel:
+    """Embeds a text as [len(text)] & records the size of each forward pass"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.passes = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.passes.append(len(texts))
+        if self.fail:
+            raise RuntimeError("out of memory")
+        return [[float(len(text))] for text in texts]
+
+
+def test_micro_batching_coalesces_concurrent_calls():
+    model = _FakeModel()
+    embeddings = MicroBatchingEmbeddings(model, max_batch_size=64, max_wait_ms=50)
+    texts = ["x" * i for i in range(1, 17)]
+    try:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            vectors = list(executor.map(embeddings.embed_query, texts))
+    finally:
+        embeddings.close()
+
+    assert vectors == [[float(i)] for i in range(1, 17)]
+    assert sum(model.passes) == 16
+    assert len(model.passes) < 16
+    assert embeddings.stats()["requests"] == 16
+
+
+def test_micro_batching_async_and_errors():
+    embeddings = MicroBatchingEmbeddings(_FakeModel(), max_wait_ms=1)
+
+    async def _embed():
+        return await asyncio.gather(embeddings.aembed_documents(["a", "bb"]), embeddings.aembed_query("ccc"))
+
+    assert asyncio.run(_embed()) == [[[1.0], [2.0]], [3.0]]
+    assert embeddings.embed_documents([]) == []
+    embeddings.close()
+
+    failing = MicroBatchingEmbeddings(_FakeModel(fail=True), max_wait_ms=1)
+    with pytest.raises(RuntimeError, match="out of memory"):
+        failing.embed_documents(["a"])
+    failing.close()
+
+
+def test_registry_loads_each_model_once():
+    loaded = []
+
+    def _load_model(model_name):
+        loaded.append(model_name)
+        return _FakeModel()
+
+    registry = LocalEmbeddingRegistry(max_wait_ms=1, load_model=_load_model)
+    first = registry.get("all-MiniLM-L6-v2")
+    assert registry.get("all-MiniLM-L6-v2") is first
+    assert first.embed_query("abcd") == [4.0]
+    assert loaded == ["all-MiniLM-L6-v2"]
+    assert registry.stats()["all-MiniLM-L6-v2"]["forward_passes"] == 1
+    registry.close()
@@ -0,0 +1,69 @@
+"""
+Test the offline /qa pipeline benchmark
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from app.api.langchain_custom.qa_benchmark import (
+    DEFAULT_DATASET,
+    STAGES,
+    HashingEmbeddings,
+    compare_results,
+    load_dataset,
+    main,
+    retrieval_metrics,
+    run_benchmark,
+)
+
+
+def test_hashing_embeddings_are_deterministic():
+    embeddings = HashingEmbeddings(dim=64)
+    vector = embeddings.embed_query("Error E-1023 on node-03")
+    assert vector == HashingEmbeddings(dim=64).embed_documents(["Error E-1023 on node-03"])[0]
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+    related, unrelated = embeddings.embed_documents(["node-03 raised error E-1023", "nightly database backups"])
+    assert np.dot(vector, related) > np.dot(vector, unrelated)
+
+
+def test_retrieval_metrics():
+    assert retrieval_metrics(["a", "b", "c"], ["b"], k=2) == {"recall": 1.0, "reciprocal_rank": 0.5}
+    assert retrieval_metrics(["a", "b", "c"], ["b", "c"], k=2) == {"recall": 0.5, "reciprocal_rank": 0.5}
+    assert retrieval_metrics(["a"], ["z"], k=1) == {"recall": 0.0, "reciprocal_rank": 0.0}
+
+
+def test_load_dataset_rejects_unknown_chunks(tmp_path):
+    path = tmp_path / "dataset.json"
+    dataset = {"chunks": [{"id": "a", "text": "x"}], "questions": [{"question": "q", "expected": ["b"]}]}
+    path.write_text(json.dumps(dataset))
+    with pytest.raises(ValueError, match="not in the dataset"):
+        load_dataset(str(path))
+
+
+@pytest.mark.parametrize("retrieval", ["hybrid", "vector"])
+def test_run_benchmark(retrieval):
+    dataset = load_dataset(str(DEFAULT_DATASET))
+    result = run_benchmark(dataset, k=3, retrieval=retrieval, repeat=2)
+
+    assert result["config"]["questions"] == len(dataset["questions"])
+    assert result["metrics"]["recall@3"] >= 0.8
+    assert 0.8 <= result["metrics"]["mrr"] <= 1.0
+    assert set(result["latency_ms"]) == {*STAGES, "total"}
+    assert set(result["latency_ms"]["search"]) == {"p50", "p95", "p99", "mean"}
+    assert len(result["questions"]) == len(dataset["questions"])
+    assert all(len(item["retrieved"]) <= 3 for item in result["questions"])
+    # retrieval is deterministic across runs
+    assert run_benchmark(dataset, k=3, retrieval=retrieval)["questions"] == result["questions"]
+
+
+def test_main_writes_results_and_baseline_delta(tmp_path):
+    baseline_path, output_path = tmp_path / "baseline.json", tmp_path / "results.json"
+    main(["-k", "3", "-o", str(baseline_path)])
+    main(["-k", "3", "--retrieval", "vector", "-o", str(output_path), "--baseline", str(baseline_path)])
+
+    baseline, result = json.loads(baseline_path.read_text()), json.loads(output_path.read_text())
+    assert result["baseline_delta"] == compare_results(result, baseline)
+    assert set(result["baseline_delta"]["metrics"]) == {"recall@3", "mrr"}
+    assert set(result["baseline_delta"]["latency_ms"]["generate"]) == {"p50", "p95", "p99"}
@@ -0,0 +1,85 @@
+"""
+Test reranking of retrieved chunks & selection of the /qa context
+"""
+
+from langchain_core.documents import Document
+
+from app.api.langchain_custom.rerank import (
+    CrossEncoderReranker,
+    LexicalOverlapReranker,
+    get_reranker,
+    rerank_documents,
+    select_context,
+)
+from app.api.langchain_custom.tokens import count_tokens
+
+
+def test_lexical_overlap_reranker():
+    scores = LexicalOverlapReranker().score(
+        "What is error E-1023 on node-07?",
+        ["rta worker error E-1023 on node-07", "error E-1023", "goal_type patrol finished"],
+    )
+    assert scores == [1.0, 2 / 3, 0.0]
+    assert LexicalOverlapReranker().score("what is it", ["anything"]) == [0.0]
+
+
+def test_get_reranker():
+    assert isinstance(get_reranker("lexical"), LexicalOverlapReranker)
+    assert isinstance(get_reranker("cross-encoder", "some/model"), CrossEncoderReranker)
+    assert get_reranker("none") is None
+
+
+def test_cross_encoder_reranker_scores_in_unit_range(tmp_path):
+    """A cross-encoder declaring an identity activation, like ms-marco-MiniLM, is still squashed into [0, 1]"""
+    import torch
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "error", "e", "-", "1023", "goal", "finished"]
+    (tmp_path / "vocab.txt").write_text("\n".join(vocab))
+    config = BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=8,
+        num_hidden_layers=1,
+        num_attention_heads=1,
+        intermediate_size=16,
+        num_labels=1,
+    )
+    config.sentence_transformers = {"activation_fn": "torch.nn.modules.linear.Identity"}
+    model = BertForSequenceClassification(config)
+    with torch.no_grad():
+        model.classifier.bias.fill_(8.0)  # raw logits far outside [0, 1]
+    model.save_pretrained(tmp_path)
+    BertTokenizerFast(str(tmp_path / "vocab.txt")).save_pretrained(tmp_path)
+
+    scores = CrossEncoderReranker(str(tmp_path)).score("error E-1023", ["error E-1023", "goal finished"])
+    assert len(scores) == 2
+    assert all(0.0 <= score <= 1.0 for score in scores)
+    assert CrossEncoderReranker(str(tmp_path)).score("error E-1023", []) == []
+
+
+def test_select_context_threshold_and_token_budget():
+    docs = [Document(page_content=" ".join(["word"] * n_words)) for n_words in (50, 10, 200, 5)]
+    scored_docs = list(zip(docs, [0.9, 0.1, 0.8, 0.5]))
+
+    selected = select_context(scored_docs, threshold=0.3, max_chunks=10, token_budget=10_000)
+    assert [score for _, score in selected] == [0.9, 0.8, 0.5]
+
+    budget = count_tokens(docs[0].page_content) + count_tokens(docs[3].page_content)
+    selected = select_context(scored_docs, threshold=0.3, max_chunks=10, token_budget=budget)
+    assert [score for _, score in selected] == [0.9, 0.5]
+
+    selected = select_context(scored_docs, threshold=0.3, max_chunks=2, token_budget=10_000)
+    assert [score for _, score in selected] == [0.9, 0.8]
+
+    # the best chunk is kept even below the threshold
+    selected = select_context(scored_docs, threshold=0.95, max_chunks=10, token_budget=1)
+    assert [score for _, score in selected] == [0.9]
+
+
+def test_rerank_documents_scores_in_order():
+    docs = [Document(page_content="goal_type patrol"), Document(page_content="error E-1023")]
+    scored_docs = rerank_documents(LexicalOverlapReranker(), "error E-1023", docs)
+    assert [(doc.page_content, score) for doc, score in scored_docs] == [
+        ("goal_type patrol", 0.0),
+        ("error E-1023", 1.0),
+    ]
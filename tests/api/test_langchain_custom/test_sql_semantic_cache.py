@@ -0,0 +1,117 @@
+"""
+Test semantic question -> sql cache
+"""
+
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from app.api.langchain_custom.sql_semantic_cache import SemanticSQLCache
+
+_VOCAB = ["latest", "recent", "anomalies", "anomaly", "records", "count", "today", "goal", "type", "5", "10"]
+
+
+class _BagOfWordsEmbeddings(Embeddings):
+    """Deterministic embeddings where questions sharing words are similar"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        words = text.lower().split()
+        return [float(words.count(token)) for token in _VOCAB] + [0.1]
+
+
+def _gen_cache(**kwargs) -> SemanticSQLCache:
+    return SemanticSQLCache(_BagOfWordsEmbeddings(), threshold=0.7, **kwargs)
+
+
+def test_semantic_cache_hit_and_miss():
+    cache = _gen_cache()
+    query = "SELECT * FROM anomaly_detection_log ORDER BY timestamp DESC LIMIT 5"
+    assert cache.lookup("anomaly_detection_log", "latest 5 anomalies").entry is None
+    cache.store("anomaly_detection_log", "latest 5 anomalies", query)
+
+    lookup = cache.lookup("anomaly_detection_log", "show the latest 5 anomalies records")
+    assert lookup.entry["query"] == query
+    assert lookup.similarity >= 0.7
+    # other log types & other numbers do not share the stored query
+    assert cache.lookup("rta_worker_switch_log", "latest 5 anomalies").entry is None
+    assert cache.lookup("anomaly_detection_log", "latest 10 anomalies").entry is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["size"] == 1
+
+
+def test_semantic_cache_guards_dates_status_and_negations():
+    cache = _gen_cache()
+    cache.store("anomaly_detection_log", "anomalies detected today", "SELECT 1")
+
+    assert cache.lookup("anomaly_detection_log", "show anomalies detected today").entry["query"] == "SELECT 1"
+    for question in (
+        "anomalies detected yesterday",
+        "anomalies detected this month",
+        "anomalies failed today",
+        "anomalies not detected today",
+        "anomalies that weren't detected today",
+    ):
+        assert cache.lookup("anomaly_detection_log", question).entry is None, question
+
+
+def test_semantic_cache_is_keyed_by_llm_model():
+    cache = _gen_cache()
+    cache.store("anomaly_detection_log", "latest 5 anomalies", "SELECT 1", model="gpt-4o-mini")
+
+    assert cache.lookup("anomaly_detection_log", "latest 5 anomalies", "gpt-4o-mini").entry["query"] == "SELECT 1"
+    assert cache.lookup("anomaly_detection_log", "latest 5 anomalies", "gpt-4o").entry is None
+    assert cache.lookup("anomaly_detection_log", "latest 5 anomalies").entry is None
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache = _gen_cache(capacity=2)
+    cache.store("anomaly_detection_log", "latest anomalies", "SELECT 1")
+    cache.store("anomaly_detection_log", "count anomalies today", "SELECT 2")
+    cache.lookup("anomaly_detection_log", "latest anomalies")
+    cache.store("rta_worker_switch_log", "goal type count", "SELECT 3")
+
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup("anomaly_detection_log", "count anomalies today").entry is None
+    assert cache.lookup("anomaly_detection_log", "latest anomalies").entry["query"] == "SELECT 1"
+
+
+def test_semantic_cache_persists_across_instances(tmp_path):
+    persist_path = str(tmp_path / "sql_semantic_cache.sqlite3")
+    cache = _gen_cache(persist_path=persist_path)
+    cache.store("anomaly_detection_log", "latest 5 anomalies", "SELECT 1")
+
+    cache.store("anomaly_detection_log", "latest 5 anomalies", "SELECT 2", model="gpt-4o")
+
+    reloaded_cache = _gen_cache(persist_path=persist_path)
+    assert len(reloaded_cache) == 2
+    assert reloaded_cache.lookup("anomaly_detection_log", "latest 5 anomalies records").entry["query"] == "SELECT 1"
+    assert reloaded_cache.lookup("anomaly_detection_log", "latest 5 anomalies", "gpt-4o").entry["query"] == "SELECT 2"
+    cache.close()
+    reloaded_cache.close()
+
+
+def test_semantic_cache_persists_entries_incrementally(tmp_path):
+    persist_path = str(tmp_path / "sql_semantic_cache.sqlite3")
+    cache = _gen_cache(capacity=2, persist_path=persist_path)
+    cache.store("anomaly_detection_log", "latest anomalies", "SELECT 1")
+    cache.store("anomaly_detection_log", "count anomalies today", "SELECT 2")
+    cache.lookup("anomaly_detection_log", "latest anomalies")
+    cache.store("rta_worker_switch_log", "goal type count", "SELECT 3")
+    cache.store("rta_worker_switch_log", "goal type count", "SELECT 4")
+
+    reloaded_cache = _gen_cache(capacity=2, persist_path=persist_path)
+    assert len(reloaded_cache) == 2
+    assert reloaded_cache.lookup("anomaly_detection_log", "count anomalies today").entry is None
+    hit = reloaded_cache.lookup("anomaly_detection_log", "latest anomalies").entry
+    assert hit["query"] == "SELECT 1"
+    assert hit["hits"] == 2
+    assert reloaded_cache.lookup("rta_worker_switch_log", "goal type count").entry["query"] == "SELECT 4"
+    cache.close()
+    reloaded_cache.close()
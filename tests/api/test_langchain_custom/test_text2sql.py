@@ -4,7 +4,14 @@ Test text2sql output parsing helpers.
 
 import pytest
 
-from app.api.langchain_custom.text2sql import _extract_sql_query, _message_to_text
+from app.api.langchain_custom.text2sql import (
+    _extract_sql_query,
+    _message_to_text,
+    _runnable_input,
+    clear_text2sql_runnable_cache,
+    get_text2sql_runnable,
+)
+from app.core.setup import ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, RTA_WORKER_SWITCH_LOG_TEXT2SQL_CFG
 
 
 @pytest.mark.parametrize(
@@ -52,3 +59,24 @@ def test_message_to_text_handles_content_blocks():
             self.content = payload["content"]
 
     assert _message_to_text(_Msg(message)) == "SELECT\n ID \nFROM anomaly_detection_log;"
+
+
+def test_get_text2sql_runnable_is_reused(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    clear_text2sql_runnable_cache()
+    runnable = get_text2sql_runnable(ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, "gpt-4o-mini", 0, 5)
+
+    assert get_text2sql_runnable(ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, "gpt-4o-mini", 0, 5) is runnable
+    assert get_text2sql_runnable(ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, "gpt-4o-mini", 0, 10) is not runnable
+    assert get_text2sql_runnable(RTA_WORKER_SWITCH_LOG_TEXT2SQL_CFG, "gpt-4o-mini", 0, 5) is not runnable
+    clear_text2sql_runnable_cache()
+
+
+def test_runnable_input_replays_failed_attempts():
+    runnable_input = _runnable_input("latest logs", None, [("SELECT bad FROM anomaly_detection_log", "Unknown column")])
+
+    assert "system_prompt" not in runnable_input
+    ai_message, human_message = runnable_input["repair_messages"]
+    assert ai_message.content == "SELECT bad FROM anomaly_detection_log"
+    assert "Unknown column" in human_message.content
+    assert _runnable_input("latest logs", "prompt", None) == {"input": "latest logs", "system_prompt": "prompt"}
@@ -0,0 +1,133 @@
+"""
+Test schema-aware, token-budgeted text2sql prompts
+"""
+
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+from app.api.langchain_custom.text2sql_prompt import (
+    PROMPT_SECTIONS,
+    Text2SQLPromptBuilder,
+    introspect_table_profile,
+)
+from app.api.langchain_custom.tokens import count_tokens
+from app.core.setup import ANOMALY_DETECTION_LOG_TEXT2SQL_CFG
+
+_COLUMNS = [
+    {"Field": "ID", "Type": "int(11)"},
+    {"Field": "log_fid", "Type": "varchar(32)"},
+    {"Field": "timestamp", "Type": "datetime(6)"},
+    {"Field": "inference_time", "Type": "float"},
+    {"Field": "prediction", "Type": "int(11)"},
+]
+_ROWS = [
+    {
+        "ID": i,
+        "log_fid": f"{i:032x}",
+        "timestamp": datetime(2024, 8, 21, 0, i),
+        "inference_time": 40.0 + i,
+        "prediction": i % 2,
+    }
+    for i in range(1, 21)
+]
+
+
+class _FakeSchemaCursor:
+    """Cursor answering the introspection queries from in-memory rows"""
+
+    def __init__(self, calls: list):
+        self.calls = calls
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        self.calls.append(query)
+        if query.startswith("SHOW COLUMNS"):
+            self._rows = _COLUMNS
+        elif query.startswith("SELECT MIN"):
+            column = re.search(r"MIN\(`(\w+)`\)", query).group(1)
+            values = [row[column] for row in _ROWS]
+            self._rows = [{"min_val": min(values), "max_val": max(values)}]
+        else:
+            column = re.search(r"DISTINCT `(\w+)`", query).group(1)
+            values = list(dict.fromkeys(row[column] for row in _ROWS))
+            self._rows = [{"val": value} for value in values[: params[0]]]
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0]
+
+
+def _gen_fake_mysql_conn(calls: list):
+    class _FakeConn:
+        def cursor(self):
+            return _FakeSchemaCursor(calls)
+
+    @contextmanager
+    def _mysql_conn():
+        yield _FakeConn()
+
+    return _mysql_conn
+
+
+def _failing_mysql_conn():
+    raise ConnectionError("mysql unavailable")
+
+
+def test_introspect_table_profile():
+    profile = introspect_table_profile(_gen_fake_mysql_conn([]), "anomaly_detection_log", max_distinct_values=8)
+    columns = {column.name: column for column in profile.columns}
+
+    assert profile.live
+    assert columns["prediction"].values == [0, 1]
+    assert columns["ID"].value_range == (1, 20)
+    assert columns["inference_time"].value_range == (41.0, 60.0)
+    assert len(columns["log_fid"].examples) == 2
+
+
+def test_prompt_builder_includes_live_values_and_caches_profile():
+    calls = []
+    builder = Text2SQLPromptBuilder(_gen_fake_mysql_conn(calls), token_budget=10_000)
+    prompt = builder.build(ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, top_k=5)
+
+    assert prompt.live_schema
+    assert prompt.sections == list(PROMPT_SECTIONS)
+    assert "prediction int(11) -- prediction status of the anomaly detection model; values 0, 1" in prompt.system_prompt
+    assert "range 2024-08-21 00:01:00 to 2024-08-21 00:20:00" in prompt.system_prompt
+    assert prompt.n_tokens == count_tokens(prompt.system_prompt)
+
+    n_calls = len(calls)
+    builder.build(ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, top_k=5)
+    assert len(calls) == n_calls
+
+
+def test_prompt_builder_respects_token_budget():
+    builder = Text2SQLPromptBuilder(_gen_fake_mysql_conn([]), token_budget=10_000)
+    full_prompt = builder.build(ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, top_k=5)
+
+    builder.token_budget = full_prompt.n_tokens - 1
+    trimmed_prompt = builder.build(ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, top_k=5)
+    assert trimmed_prompt.n_tokens <= builder.token_budget
+    assert "example_questions" not in trimmed_prompt.sections
+
+    builder.token_budget = 1
+    minimal_prompt = builder.build(ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, top_k=5)
+    assert minimal_prompt.sections == []
+    assert "inference_time float" in minimal_prompt.system_prompt
+
+
+def test_prompt_builder_falls_back_to_static_config():
+    builder = Text2SQLPromptBuilder(_failing_mysql_conn, token_budget=10_000)
+    prompt = builder.build(ANOMALY_DETECTION_LOG_TEXT2SQL_CFG, top_k=5)
+
+    assert not prompt.live_schema
+    for column in ANOMALY_DETECTION_LOG_TEXT2SQL_CFG.column_descriptions:
+        assert column in prompt.system_prompt
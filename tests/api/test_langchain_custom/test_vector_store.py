@@ -0,0 +1,139 @@
+"""
+Test the application lifetime vector store manager
+"""
+
+from datetime import datetime, timezone
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.api.langchain_custom.vector_store import (
+    VectorStoreManager,
+    add_embedded_documents,
+    diff_source_chunks,
+    metadata_where,
+    source_has_version,
+    stable_chunk_ids,
+    sync_source_chunks,
+)
+from app.utils.common import get_file_md5
+
+
+class _CountingEmbeddings(Embeddings):
+    """Deterministic embeddings counting the embedded query texts"""
+
+    def __init__(self):
+        self.n_queries = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.n_queries += 1
+        return [float(len(text)), 1.0]
+
+
+def test_vector_store_manager_shares_clients(tmp_path):
+    loaded_models = []
+
+    def _load_embeddings(embedding_model: str) -> Embeddings:
+        loaded_models.append(embedding_model)
+        return _CountingEmbeddings()
+
+    manager = VectorStoreManager(str(tmp_path), load_embeddings=_load_embeddings)
+    vector_store = manager.get_vector_store("test_collection")
+
+    assert manager.get_vector_store("test_collection") is vector_store
+    assert manager.get_vector_store("other_collection") is not vector_store
+    assert manager.get_vector_store("other_collection")._client is vector_store._client
+    assert len(loaded_models) == 1
+
+
+def test_vector_store_manager_warm_up(tmp_path):
+    embeddings = _CountingEmbeddings()
+    manager = VectorStoreManager(str(tmp_path), load_embeddings=lambda _: embeddings)
+    manager.warm_up("test_collection")
+    assert embeddings.n_queries == 0  # nothing to search in an empty collection
+
+    manager.get_vector_store("test_collection").add_documents([Document(page_content="drone anomaly")])
+    manager.warm_up("test_collection")
+    assert embeddings.n_queries == 1
+
+    manager.close()
+    assert manager.get_vector_store("test_collection")._collection.count() == 1
+
+
+def test_add_embedded_documents_does_not_reembed(tmp_path):
+    embeddings = _CountingEmbeddings()
+    manager = VectorStoreManager(str(tmp_path), load_embeddings=lambda _: embeddings)
+    vector_store = manager.get_vector_store("test_collection")
+    documents = [Document(page_content="drone anomaly", metadata={"source": "a.txt"}), Document(page_content="rta")]
+
+    ids = add_embedded_documents(vector_store, documents, [[13.0, 1.0], [3.0, 1.0]])
+    stored = vector_store.get(ids=ids, include=["embeddings", "metadatas"])
+    assert len(stored["ids"]) == 2
+    assert sorted(vector[0] for vector in stored["embeddings"]) == [3.0, 13.0]
+    assert embeddings.n_queries == 0
+
+
+def test_stable_chunk_ids():
+    ids = stable_chunk_ids("a.txt", ["drone", "rta", "drone"])
+    assert len(set(ids)) == 3
+    assert stable_chunk_ids("a.txt", ["rta", "drone"]) == [ids[1], ids[0]]
+    assert stable_chunk_ids("b.txt", ["drone"])[0] != ids[0]
+
+
+def test_sync_source_chunks_reindexes_incrementally(tmp_path):
+    manager = VectorStoreManager(str(tmp_path), load_embeddings=lambda _: _CountingEmbeddings())
+    vector_store = manager.get_vector_store("test_collection")
+
+    def _sync(source: str, texts: List[str]):
+        ids = stable_chunk_ids(source, texts)
+        file_md5 = get_file_md5("\n".join(texts).encode())
+        documents = {
+            chunk_id: Document(page_content=text, metadata={"source": source, "file_md5": file_md5, "chunk_index": i})
+            for i, (chunk_id, text) in enumerate(zip(ids, texts))
+        }
+        diff = diff_source_chunks(vector_store, source, ids)
+        new_documents = [documents[chunk_id] for chunk_id in diff.new_ids]
+        sync_source_chunks(
+            vector_store,
+            diff,
+            new_documents,
+            [[float(len(doc.page_content)), 1.0] for doc in new_documents],
+            [documents[chunk_id] for chunk_id in diff.kept_ids],
+        )
+        return diff
+
+    first = _sync("a.txt", ["intro", "drone anomaly", "rta switch"])
+    _sync("b.txt", ["intro"])
+    assert len(first.new_ids) == 3 and vector_store._collection.count() == 4
+
+    second = _sync("a.txt", ["new intro", "drone anomaly", "rta switch"])
+    assert len(second.new_ids) == 1 and len(second.kept_ids) == 2 and len(second.stale_ids) == 1
+    assert vector_store._collection.count() == 4
+
+    stored = vector_store.get(where={"source": "a.txt"})
+    assert sorted(stored["documents"]) == ["drone anomaly", "new intro", "rta switch"]
+    assert sorted(metadata["chunk_index"] for metadata in stored["metadatas"]) == [0, 1, 2]
+    # kept chunks carry the md5 of the current version of the source
+    assert source_has_version(vector_store, "a.txt", get_file_md5(b"new intro\ndrone anomaly\nrta switch"))
+    assert not source_has_version(vector_store, "a.txt", get_file_md5(b"intro\ndrone anomaly\nrta switch"))
+    assert not source_has_version(vector_store, "c.txt", get_file_md5(b"new intro\ndrone anomaly\nrta switch"))
+
+
+def test_metadata_where():
+    assert metadata_where() is None
+    assert metadata_where(sources=["a.txt"]) == {"source": {"$in": ["a.txt"]}}
+    assert metadata_where(
+        file_types=["PDF", ".txt"],
+        ingested_after=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        ingested_before=datetime(2024, 1, 2, tzinfo=timezone.utc),
+    ) == {
+        "$and": [
+            {"file_type": {"$in": [".pdf", ".txt"]}},
+            {"ingested_at": {"$gte": 1704067200}},
+            {"ingested_at": {"$lte": 1704153600}},
+        ]
+    }
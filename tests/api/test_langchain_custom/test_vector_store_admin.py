@@ -0,0 +1,91 @@
+"""
+Test vector store maintenance: stats, de-duplication, rebuilds & hnsw tuning
+"""
+
+import chromadb
+import numpy as np
+
+from app.api.langchain_custom.vector_store_admin import (
+    benchmark_hnsw,
+    collection_stats,
+    dedupe_collection,
+    hnsw_params,
+    rebuild_collection,
+    set_hnsw_params,
+)
+
+_N_RECORDS = 200
+
+
+def _client_with_collection(tmp_path, name: str = "knowledge"):
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    collection = client.create_collection(name)
+    embeddings = np.random.default_rng(0).normal(size=(_N_RECORDS, 8)).tolist()
+    collection.add(
+        ids=[f"id{i}" for i in range(_N_RECORDS)],
+        embeddings=embeddings,
+        documents=[f"chunk {i}" for i in range(_N_RECORDS)],
+        metadatas=[{"source": "a.txt", "chunk_index": i} for i in range(_N_RECORDS)],
+    )
+    # an exact copy of the first chunk from another source
+    collection.add(ids=["dup"], embeddings=[embeddings[0]], documents=["chunk 0"], metadatas=[{"source": "b.txt"}])
+    return client, collection
+
+
+def test_collection_stats_and_dedupe(tmp_path):
+    client, collection = _client_with_collection(tmp_path)
+    stats = collection_stats(client, "knowledge", str(tmp_path))
+
+    assert stats["count"] == _N_RECORDS + 1
+    assert stats["dimension"] == 8
+    assert stats["duplicate_embeddings"] == stats["duplicate_documents"] == 1
+    assert stats["disk_bytes"] > 0
+
+    assert dedupe_collection(collection) == 1
+    assert collection.count() == _N_RECORDS
+    assert collection.get(ids=["id0"])["ids"] == ["id0"]
+    assert collection_stats(client, "knowledge")["duplicate_embeddings"] == 0
+
+
+def test_rebuild_collection_keeps_records(tmp_path):
+    client, collection = _client_with_collection(tmp_path)
+    collection.delete(ids=[f"id{i}" for i in range(100, 150)])
+
+    result = rebuild_collection(client, "knowledge", {"M": 32}, dedupe=True)
+    rebuilt = client.get_collection("knowledge")
+
+    assert result["count"] == rebuilt.count() == _N_RECORDS - 50
+    assert result["removed_duplicates"] == 1
+    assert hnsw_params(rebuilt)["M"] == 32
+    assert [collection.name for collection in client.list_collections()] == ["knowledge"]
+    record = rebuilt.get(ids=["id7"], include=["documents", "metadatas"])
+    assert record["documents"] == ["chunk 7"]
+    assert record["metadatas"] == [{"source": "a.txt", "chunk_index": 7}]
+
+
+def test_set_hnsw_params_rebuilds_only_for_index_params(tmp_path):
+    client, _ = _client_with_collection(tmp_path)
+
+    result = set_hnsw_params(client, "knowledge", ef_search=40)
+    assert not result["rebuilt"]
+    assert result["hnsw"]["ef_search"] == 40
+
+    result = set_hnsw_params(client, "knowledge", M=8, ef_construction=50)
+    assert result["rebuilt"]
+    assert hnsw_params(client.get_collection("knowledge")) == {
+        "M": 8,
+        "ef_construction": 50,
+        "ef_search": 40,
+        "space": "l2",
+    }
+
+
+def test_benchmark_hnsw_reports_recall_per_setting(tmp_path):
+    client, _ = _client_with_collection(tmp_path)
+    settings = [{"M": 4, "ef_construction": 8, "ef_search": 2}, {"M": 16, "ef_construction": 100, "ef_search": 100}]
+    results = benchmark_hnsw(client, "knowledge", settings, n_queries=20, k=5)
+
+    assert [(result["M"], result["ef_search"]) for result in results] == [(4, 2), (16, 100)]
+    assert results[1]["recall@5"] >= 0.95
+    assert all(result["p95_ms"] >= result["p50_ms"] > 0 for result in results)
+    assert [collection.name for collection in client.list_collections()] == ["knowledge"]
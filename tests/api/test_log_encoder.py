@@ -0,0 +1,95 @@
+"""
+Test dictionary encoding of log columns
+"""
+
+from contextlib import contextmanager
+
+from app.api.log_format.log_encoder import LogDictionaryEncoder
+
+
+class _FakeDictCursor:
+    """Cursor emulating INSERT IGNORE & SELECT on in-memory dictionary tables"""
+
+    def __init__(self, tables: dict, calls: list):
+        self.tables = tables
+        self.calls = calls
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def executemany(self, query, values):
+        self.calls.append(query)
+        tb_name = query.split()[3]
+        table = self.tables.setdefault(tb_name, {})
+        for (value,) in values:
+            table.setdefault(value, len(table) + 1)
+
+    def execute(self, query, values):
+        self.calls.append(query)
+        tb_name = query.split()[4]
+        table = self.tables.get(tb_name, {})
+        self._rows = [{"id": table[value], "value": value} for value in values if value in table]
+
+    def fetchall(self):
+        return self._rows
+
+
+def _gen_fake_mysql_conn(tables: dict, calls: list):
+    class _FakeConn:
+        def cursor(self):
+            return _FakeDictCursor(tables, calls)
+
+        def commit(self):
+            pass
+
+        def rollback(self):
+            pass
+
+    @contextmanager
+    def _mysql_conn():
+        yield _FakeConn()
+
+    return _mysql_conn
+
+
+def test_encode_log_obj_list():
+    """Encoded columns are replaced with their dictionary ids"""
+    tables, calls = {}, []
+    encoder = LogDictionaryEncoder()
+    log_obj_list = [
+        {"log_fid": "fid_a", "timestamp": "2024-01-01", "goal_type": "WORKER", "rta_status": 0},
+        {"log_fid": "fid_a", "timestamp": "2024-01-02", "goal_type": "LEADER", "rta_status": 1},
+    ]
+    result = encoder.encode_log_obj_list(
+        _gen_fake_mysql_conn(tables, calls),
+        log_obj_list,
+        {"log_fid": "log_fid_dict", "goal_type": "goal_type_dict"},
+    )
+
+    assert list(result[0].keys()) == ["log_fid_id", "timestamp", "goal_type_id", "rta_status"]
+    assert result[0]["log_fid_id"] == result[1]["log_fid_id"] == tables["log_fid_dict"]["fid_a"]
+    assert result[0]["goal_type_id"] == tables["goal_type_dict"]["WORKER"]
+    assert result[1]["goal_type_id"] == tables["goal_type_dict"]["LEADER"]
+    assert result[1]["timestamp"] == "2024-01-02"
+
+
+def test_get_ids_uses_cache_for_known_values():
+    """Known values are resolved without a database round trip"""
+    tables, calls = {}, []
+    encoder = LogDictionaryEncoder()
+    mysql_conn = _gen_fake_mysql_conn(tables, calls)
+
+    first = encoder.get_ids(mysql_conn, "log_fid_dict", ["fid_a", "fid_b"])
+    n_calls = len(calls)
+    second = encoder.get_ids(mysql_conn, "log_fid_dict", ["fid_b", "fid_a"])
+
+    assert first == second
+    assert len(calls) == n_calls
+
+    encoder.get_ids(mysql_conn, "log_fid_dict", ["fid_a", "fid_c"])
+    assert len(calls) == n_calls + 2
+    assert set(tables["log_fid_dict"]) == {"fid_a", "fid_b", "fid_c"}
@@ -3,6 +3,7 @@ Test mysql api
 The mysql server must be running in the appropriate port
 """
 
+import threading
 from typing import Callable
 import pytest
 from pymysql.connections import Connection
@@ -16,6 +17,9 @@ from app.api.mysql import (
     select_all_data_from_sql,
     delete_data_from_sql_with_id,
     run_sql_script,
+    explain_sql_script,
+    stream_sql_script,
+    RowBatchReader,
     table_exists,
     entries_exist,
 )
@@ -163,3 +167,58 @@ def test_run_select_sql_script_after_update(test_mysql_connec: Connection):
     resp2 = run_sql_script(test_mysql_connec, update_script, params, commit=False)
 
     assert sorted(resp1) == sorted(resp2)
+
+
+def test_explain_sql_script(test_mysql_connec: Connection):
+    """EXPLAIN dry runs report unknown columns without executing the query"""
+    valid_script = f"SELECT ID FROM {MYSQL_TEST_ANOMALY_DET_LOG_TABLE} WHERE ID = %s"
+    assert explain_sql_script(test_mysql_connec, valid_script, (MYSQL_TEST_ID,))["status"] == "success"
+
+    resp = explain_sql_script(test_mysql_connec, f"SELECT missing_column FROM {MYSQL_TEST_ANOMALY_DET_LOG_TABLE}")
+    assert resp["status"] == "failed"
+    assert "missing_column" in resp["message"]
+    assert (
+        explain_sql_script(test_mysql_connec, f"DELETE FROM {MYSQL_TEST_ANOMALY_DET_LOG_TABLE}")["status"] == "failed"
+    )
+
+
+def test_stream_sql_script(test_mysql_connec: Connection):
+    """Rows of a server-side cursor are yielded in batches"""
+    resp = run_sql_script(test_mysql_connec, f"SELECT ID FROM {MYSQL_TEST_ANOMALY_DET_LOG_TABLE}")
+    batches = list(
+        stream_sql_script(test_mysql_connec, f"SELECT ID FROM {MYSQL_TEST_ANOMALY_DET_LOG_TABLE}", batch_size=1)
+    )
+
+    assert all(len(batch) == 1 for batch in batches)
+    assert [row for batch in batches for row in batch] == list(resp["data"])
+    with pytest.raises(ValueError):
+        next(stream_sql_script(test_mysql_connec, f"DELETE FROM {MYSQL_TEST_ANOMALY_DET_LOG_TABLE}"))
+
+
+def test_row_batch_reader_close_waits_for_inflight_read():
+    reading, release, closed = threading.Event(), threading.Event(), threading.Event()
+
+    def _rows():
+        try:
+            yield [{"ID": 1}]
+            reading.set()
+            release.wait(5)
+            yield [{"ID": 2}]
+        finally:
+            closed.set()
+
+    reader = RowBatchReader(_rows())
+    assert reader.read() == [{"ID": 1}]
+    results = []
+    read_thread = threading.Thread(target=lambda: results.append(reader.read()))
+    read_thread.start()
+    assert reading.wait(5)
+    close_thread = threading.Thread(target=reader.close)
+    close_thread.start()
+    assert not closed.wait(0.1)  # close waits for the in-flight read instead of raising
+    release.set()
+    read_thread.join(5)
+    close_thread.join(5)
+    assert results == [[{"ID": 2}]]
+    assert closed.is_set()
+    assert reader.read() is None
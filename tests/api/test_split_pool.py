@@ -0,0 +1,42 @@
+"""
+Test document splitting in worker processes
+"""
+
+import asyncio
+
+from langchain_core.documents import Document
+
+from app.api import split_pool as split_pool_module
+from app.api.split_pool import SplitPool
+from app.utils.chunking import split_file
+
+
+def test_split_pool_matches_in_process_splitting(tmp_path):
+    fpath = tmp_path / "document.txt"
+    fpath.write_text("\n\n".join(f"paragraph {i} " + "word " * 100 for i in range(40)))
+    pool = SplitPool(max_workers=1)
+    try:
+        splits = asyncio.run(pool.split(str(fpath), ".txt"))
+    finally:
+        pool.shutdown()
+
+    expected = split_file(str(fpath), ".txt")
+    assert [split.page_content for split in splits] == [split.page_content for split in expected]
+    assert len(splits) > 1
+
+
+def test_split_pool_reassembles_pdf_page_ranges_in_order(monkeypatch):
+    calls = []
+
+    def _split_pdf_pages(fpath, start, end):
+        calls.append((start, end))
+        return [Document(page_content=f"page {page}", metadata={"page": page}) for page in range(start, min(end, 10))]
+
+    monkeypatch.setattr(split_pool_module, "count_pdf_pages", lambda fpath: 10)
+    monkeypatch.setattr(split_pool_module, "split_pdf_pages", _split_pdf_pages)
+    pool = SplitPool(max_workers=0, pages_per_task=3)
+
+    splits = asyncio.run(pool.split("report.pdf", ".pdf"))
+
+    assert sorted(calls) == [(0, 3), (3, 6), (6, 9), (9, 12)]
+    assert [split.metadata["page"] for split in splits] == list(range(10))
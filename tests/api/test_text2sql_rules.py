@@ -0,0 +1,97 @@
+"""
+Test rule-based text2sql intent matching
+"""
+
+import pytest
+
+from app.api.text2sql_rules import match_sql_intent
+
+
+@pytest.mark.parametrize(
+    "log_type, question, intent, params",
+    [
+        ("anomaly_detection_log", "Give me the latest 15 logs", "latest_records", (15,)),
+        ("anomaly_detection_log", "What are the recent anomaly predictions?", "latest_records", (5,)),
+        ("anomaly_detection_log", "How many anomalies were detected today?", "count_today", ()),
+        ("anomaly_detection_log", "What are the top 3 longest inference times recorded?", "top_inference_times", (3,)),
+        ("anomaly_detection_log", "Any anomalies detected on 2023-01-15?", "records_on_date", ("2023-01-15", 5)),
+        ("rta_worker_switch_log", "Group the different observed rta status today.", "status_distribution", ()),
+        ("rta_worker_switch_log", "What is the most common goal type?", "most_common_goal_type", (1,)),
+    ],
+)
+def test_match_sql_intent(log_type, question, intent, params):
+    intent_match = match_sql_intent(question, log_type, top_k=5)
+    assert intent_match.intent == intent
+    assert intent_match.params == params
+    assert intent_match.confidence == 1.0
+    assert log_type in intent_match.query
+    assert intent_match.query.count("%s") == len(params)
+
+
+def test_match_sql_intent_counts_only_anomalies():
+    intent_match = match_sql_intent("How many anomalies were detected today?", "anomaly_detection_log")
+    assert "prediction = 1" in intent_match.query
+    assert "CURRENT_DATE" in intent_match.query
+
+
+@pytest.mark.parametrize(
+    "log_type, question",
+    [
+        ("anomaly_detection_log", "latest 5 anomalies where inference time is above 100"),
+        ("rta_worker_switch_log", "latest records for goal type LEADER"),
+        ("anomaly_detection_log", "latest records from the last 30 days"),
+    ],
+)
+def test_match_sql_intent_low_confidence_for_unsupported_conditions(log_type, question):
+    assert match_sql_intent(question, log_type).confidence < 0.8
+
+
+def test_match_sql_intent_no_match():
+    assert match_sql_intent("What is the average inference time this month?", "anomaly_detection_log") is None
+    assert match_sql_intent("What is the most common goal type?", "anomaly_detection_log") is None
+
+
+@pytest.mark.parametrize(
+    "log_type, question",
+    [
+        ("anomaly_detection_log", "Show the latest 10 records with prediction 0"),
+        ("rta_worker_switch_log", "latest 5 rta status 3 records"),
+        ("anomaly_detection_log", "top 5 inference times of anomalies"),
+        ("rta_worker_switch_log", "latest records with rta status 3"),
+        ("rta_worker_switch_log", "most recent rta status records for worker 2"),
+        ("anomaly_detection_log", "latest records from the last 30 days"),
+    ],
+)
+def test_match_sql_intent_rejects_unbound_conditions(log_type, question):
+    assert match_sql_intent(question, log_type).confidence == 0.0
+
+
+def test_match_sql_intent_binds_dates():
+    intent_match = match_sql_intent("Show the latest records from 2024-01-15", "anomaly_detection_log")
+    assert intent_match.intent == "records_on_date"
+    assert intent_match.params == ("2024-01-15", 5)
+    assert intent_match.confidence == 1.0
+
+
+def test_match_sql_intent_filters_singular_anomaly():
+    intent_match = match_sql_intent("What was the last anomaly?", "anomaly_detection_log")
+    assert intent_match.intent == "latest_records"
+    assert "prediction = 1" in intent_match.query
+    assert intent_match.confidence == 1.0
+    # "anomaly" naming the model is not a status condition
+    intent_match = match_sql_intent("Show the latest 10 anomaly detection records", "anomaly_detection_log")
+    assert "prediction = 1" not in intent_match.query
+    assert intent_match.params == (10,)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "How many anomaly detection records today were not anomalies?",
+        "Show the latest records without anomalies",
+        "How many non-anomalous records today?",
+        "Latest records that weren't detected",
+    ],
+)
+def test_match_sql_intent_rejects_negations(question):
+    assert match_sql_intent(question, "anomaly_detection_log").confidence == 0.0
@@ -69,7 +69,13 @@ def test_mysql_connec():
             with mysql_conn() as conn:
                 try:
                     with conn.cursor() as cursor:
-                        cursor.execute(f"CREATE TABLE IF NOT EXISTS {test_tb} LIKE {orig_tb};")
+                        if orig_tb == ANOMALY_DETECTION_LOG_TEXT2SQL_CFG.table_name:
+                            # log tables are views over dictionary-encoded data tables
+                            cursor.execute(
+                                f"CREATE TABLE IF NOT EXISTS {test_tb} AS SELECT * FROM {orig_tb} WHERE 1 = 0;"
+                            )
+                        else:
+                            cursor.execute(f"CREATE TABLE IF NOT EXISTS {test_tb} LIKE {orig_tb};")
                         cursor.execute(f"DELETE FROM {test_tb};")
                     conn.commit()
                 except Exception as e:
@@ -188,18 +194,57 @@ def mock_text_to_sql(mocker):
     return mock_text2sql_resp
 
 
+@pytest.fixture
+def mock_atext_to_sql(mocker):
+    """Mock atext_to_sql, failing for questions that contain 'fail'"""
+    mock_text2sql_resp = f"SELECT * FROM {MYSQL_TEST_ANOMALY_DET_LOG_TABLE} LIMIT 5;"
+
+    async def _atext_to_sql(question: str, **kwargs) -> str:
+        if "fail" in question:
+            raise ValueError("No SQL query could be extracted from the LLM response.")
+        return mock_text2sql_resp
+
+    mocker.patch("app.server.sql.atext_to_sql", side_effect=_atext_to_sql)
+    return mock_text2sql_resp
+
+
 @pytest.fixture
 def mock_chroma_db(mocker):
-    """Mock Chroma db using a separate fixture"""
+    """Mock the resident Chroma collection using a separate fixture, disable the lexical index & answer cache"""
     mock_chroma = mocker.MagicMock()
-    mocker.patch("app.server.upsert.Chroma")
-    mocker.patch("app.server.upsert.Chroma.from_documents")
+    mocker.patch("app.server.upsert.vector_store_manager.get_vector_store", return_value=mock_chroma)
+    mocker.patch("app.server.upsert.sync_source_chunks")
+    mocker.patch("app.server.upsert.vector_store_manager.get_lexical_index", return_value=None)
+    mocker.patch("app.server.upsert.answer_cache.bump_collection_version")
     return mock_chroma
 
 
 @pytest.fixture
 def mock_openai_emb(mocker):
-    """Mock OpenAIEmbeddings"""
+    """Mock the OpenAIEmbeddings client & disable the chunk embedding store"""
     mock_openai_emb = mocker.MagicMock()
-    mocker.patch("app.server.upsert.OpenAIEmbeddings")
+    mock_openai_emb.embed_documents.side_effect = lambda texts: [[0.0, 1.0] for _ in texts]
+    mock_openai_emb.aembed_documents = mocker.AsyncMock(side_effect=lambda texts: [[0.0, 1.0] for _ in texts])
+    mocker.patch("app.server.upsert.vector_store_manager.get_embeddings", return_value=mock_openai_emb)
+    mocker.patch("app.server.upsert.vector_store_manager.get_chunk_embedding_store", return_value=None)
     return mock_openai_emb
+
+
+@pytest.fixture
+def tmp_job_store(mocker, tmp_path):
+    """Queue background jobs in a temporary on-disk job store"""
+    from app.api.jobs import JobStore, job_queue
+
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    mocker.patch.object(job_queue, "_store", store)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def tmp_file_storage(mocker, tmp_path):
+    """Persist the uploads in a temporary directory instead of FILE_STORAGE_DIR"""
+    storage_dir = tmp_path / "files"
+    storage_dir.mkdir()
+    mocker.patch("app.server.upsert.FILE_STORAGE_DIR", str(storage_dir))
+    return storage_dir
@@ -0,0 +1,61 @@
+"""
+Test the pooled mysql connections
+"""
+
+import pytest
+
+from app.core.setup import MySQLConnectionPool
+
+
+class _FakeConn:
+    def __init__(self):
+        self.closed = False
+        self.n_pings = 0
+        self.n_rollbacks = 0
+
+    def ping(self, reconnect: bool = True):
+        self.n_pings += 1
+
+    def rollback(self):
+        self.n_rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_pool_reuses_connections():
+    created = []
+
+    def _connect():
+        created.append(_FakeConn())
+        return created[-1]
+
+    pool = MySQLConnectionPool(2, connect=_connect)
+    with pool.connection() as conn1:
+        with pool.connection() as conn2:
+            assert conn1 is not conn2
+    with pool.connection() as conn3:
+        assert conn3 in (conn1, conn2)
+        assert conn3.n_pings == 1
+
+    assert len(created) == 2
+    assert all(conn.n_rollbacks >= 1 for conn in created)
+    pool.close()
+    assert all(conn.closed for conn in created)
+
+
+def test_pool_discards_connection_on_error():
+    created = []
+
+    def _connect():
+        created.append(_FakeConn())
+        return created[-1]
+
+    pool = MySQLConnectionPool(1, connect=_connect)
+    with pytest.raises(RuntimeError):
+        with pool.connection():
+            raise RuntimeError("query failed")
+    assert created[0].closed
+
+    with pool.connection() as conn:
+        assert conn is created[1]
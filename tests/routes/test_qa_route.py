@@ -0,0 +1,82 @@
+"""
+Test qa route
+"""
+
+import json
+
+import httpx
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeStreamingListLLM
+from langchain_core.output_parsers import StrOutputParser
+
+from app.api.langchain_custom.answer_cache import AnswerCache
+from app.routes import qa
+
+_ANSWER = "Node E-1023 timed out twice."
+
+
+@pytest.fixture
+def mock_qa_pipeline(monkeypatch):
+    """Fixed retrieval, a streaming fake llm & a fresh answer cache for /qa"""
+    docs = [Document(page_content="E-1023 timed out at 10:02", metadata={"source": "run.log", "chunk_index": 0})]
+    monkeypatch.setattr(qa, "retrieve_docs", lambda question, k=6, where=None: docs)
+    monkeypatch.setattr(
+        qa,
+        "get_rag_chain",
+        lambda model: qa.RAG_PROMPT | FakeStreamingListLLM(responses=[_ANSWER]) | StrOutputParser(),
+    )
+    monkeypatch.setattr(qa, "answer_cache", AnswerCache(capacity=8, ttl=0))
+
+
+def _parse_events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+async def _stream(client: httpx.AsyncClient, request_data: dict) -> list:
+    async with client.stream("POST", "/qa/stream", json=request_data) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join([chunk async for chunk in response.aiter_text()])
+    return _parse_events(body)
+
+
+@pytest.mark.asyncio
+async def test_question_answer_stream(test_app_asyncio: httpx.AsyncClient, mock_qa_pipeline):
+    request_data = {"query": "What happened to E-1023?", "k": 3}
+    events = await _stream(test_app_asyncio, request_data)
+
+    names = [name for name, _ in events]
+    assert names[0] == "retrieval" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"} and len(names) > 3
+    retrieval = events[0][1]
+    assert retrieval["cache"] == "miss"
+    assert retrieval["context"]["chunks"] == 1
+    assert set(retrieval["timings"]) == {"retrieval_s", "rerank_s", "assembly_s"}
+    assert "".join(data["text"] for name, data in events if name == "token") == _ANSWER
+    done = events[-1][1]
+    assert done["n_tokens"] == len(names) - 2
+    assert done["timings"]["first_token_s"] <= done["timings"]["total_s"]
+
+    # the streamed answer is cached & served by both endpoints
+    events = await _stream(test_app_asyncio, request_data)
+    assert [name for name, _ in events] == ["retrieval", "token", "done"]
+    assert events[0][1]["cache"] == "hit"
+    assert events[1][1]["text"] == _ANSWER
+    response = await test_app_asyncio.post("/qa", json=request_data)
+    assert response.json()["cache"] == "hit"
+    assert response.json()["answer"] == _ANSWER
+
+
+@pytest.mark.asyncio
+async def test_question_answer_stream_error_event(test_app_asyncio: httpx.AsyncClient, mock_qa_pipeline, monkeypatch):
+    def _failing_retrieval(question, k=6, where=None):
+        raise ConnectionError("vector store unavailable")
+
+    monkeypatch.setattr(qa, "retrieve_docs", _failing_retrieval)
+    events = await _stream(test_app_asyncio, {"query": "What happened to E-1023?"})
+    assert events == [("error", {"status": "failed", "detail": "failed to conduct query search in server"})]
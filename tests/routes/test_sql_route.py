@@ -2,6 +2,8 @@
 Test sql route
 """
 
+import asyncio
+
 import pytest
 import httpx
 from pymysql.connections import Connection
@@ -39,3 +41,136 @@ async def test_sql_question_answer(
     assert data["status"] == "success"
     assert data["response"]["status"] == "success"
     assert data["response"]["message"] == "SQL script executed successfully, fetched results."
+
+
+@pytest.mark.asyncio
+async def test_sql_question_answer_rules_path(test_app_asyncio: httpx.AsyncClient, test_mysql_connec: Connection):
+    request_data = {
+        "log_type": "anomaly_detection_log",
+        "question": "What are the top 3 longest inference times recorded?",
+        "model": "llamafile",
+    }
+    response = await test_app_asyncio.post("/sql/qa", json=request_data)
+    data = response.json()
+    assert response.status_code == 200
+    assert data["sql_path"] == "rules"
+    assert data["intent"] == "top_inference_times"
+    assert data["params"] == [3]
+    assert data["response"]["status"] == "success"
+
+
+@pytest.mark.asyncio
+async def test_sql_question_answer_llm_fallback(
+    test_app_asyncio: httpx.AsyncClient, test_mysql_connec: Connection, mock_text_to_sql
+):
+    request_data = {
+        "log_type": "anomaly_detection_log",
+        "question": "Which log files have an inference time above the daily median?",
+        "model": "llamafile",
+    }
+    response = await test_app_asyncio.post("/sql/qa", json=request_data)
+    data = response.json()
+    assert response.status_code == 200
+    assert data["sql_path"] == "llm"
+    assert data["query"] == mock_text_to_sql
+
+
+@pytest.mark.asyncio
+async def test_sql_question_answer_repairs_failed_sql(
+    test_app_asyncio: httpx.AsyncClient, test_mysql_connec: Connection, mocker
+):
+    failed_query = f"SELECT missing_column FROM {MYSQL_TEST_ANOMALY_DET_LOG_TABLE} LIMIT 5;"
+    repaired_query = f"SELECT ID, inference_time FROM {MYSQL_TEST_ANOMALY_DET_LOG_TABLE} LIMIT 5;"
+    mock_text2sql = mocker.patch("app.server.sql.text_to_sql", side_effect=[failed_query, repaired_query])
+    request_data = {
+        "log_type": "anomaly_detection_log",
+        "question": "Which log files have an inference time above the daily median?",
+        "model": "llamafile",
+    }
+    response = await test_app_asyncio.post("/sql/qa", json=request_data)
+    data = response.json()
+    assert response.status_code == 200
+    assert data["query"] == repaired_query
+    assert data["attempts"] == 2
+    assert "missing_column" in data["repaired_errors"][0]
+    assert {"llm_s", "explain_s", "execute_s"} <= set(data["timings"])
+    assert mock_text2sql.call_args.kwargs["failed_attempts"][0][0] == failed_query
+
+
+@pytest.mark.asyncio
+async def test_sql_question_answer_batch(
+    test_app_asyncio: httpx.AsyncClient, test_mysql_connec: Connection, mock_atext_to_sql
+):
+    request_data = {
+        "items": [
+            {"log_type": "anomaly_detection_log", "question": "Give me the latest 3 logs"},
+            {"log_type": "anomaly_detection_log", "question": "Which log files have inference times above the median?"},
+            {"log_type": "anomaly_detection_log", "question": "This question should fail in the llm"},
+        ],
+        "max_concurrency": 2,
+    }
+    response = await test_app_asyncio.post("/sql/qa/batch", json=request_data)
+    data = response.json()
+    assert response.status_code == 200
+    assert data["status"] == "success"
+    assert [result["index"] for result in data["results"]] == [0, 1, 2]
+    assert data["results"][0]["sql_path"] == "rules"
+    assert data["results"][1]["sql_path"] == "llm"
+    assert data["results"][1]["query"] == mock_atext_to_sql
+    assert data["results"][2]["status"] == "failed"
+    assert "No SQL query" in data["results"][2]["detail"]
+
+
+@pytest.mark.asyncio
+async def test_sql_question_answer_batch_caps_concurrency(test_app_asyncio: httpx.AsyncClient, mocker):
+    """A client asking for more than SQL_QA_BATCH_CONCURRENCY in-flight items gets the configured limit"""
+    in_flight, max_in_flight = 0, 0
+
+    async def _agenerate_sql_plan(item):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return None, None
+
+    mocker.patch("app.server.sql.SQL_QA_BATCH_CONCURRENCY", 2)
+    mocker.patch("app.server.sql._agenerate_sql_plan", side_effect=_agenerate_sql_plan)
+    mocker.patch("app.server.sql._execute_sql_plan", return_value={"status": "success"})
+    request_data = {
+        "items": [{"log_type": "anomaly_detection_log", "question": f"question {i}"} for i in range(8)],
+        "max_concurrency": 100,
+    }
+    response = await test_app_asyncio.post("/sql/qa/batch", json=request_data)
+    assert response.status_code == 200
+    assert response.json()["detail"] == "8 of 8 item(s) succeeded."
+    assert max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_sql_question_answer_stream(
+    test_app_asyncio: httpx.AsyncClient, test_mysql_connec: Connection, mock_atext_to_sql
+):
+    request_data = {
+        "log_type": "anomaly_detection_log",
+        "question": "Which log files have an inference time above the daily median?",
+    }
+    async with test_app_asyncio.stream("POST", "/sql/qa/stream", json=request_data) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join([chunk async for chunk in response.aiter_text()])
+
+    events = [line.removeprefix("event: ") for line in body.splitlines() if line.startswith("event: ")]
+    assert events[:2] == ["sql", "execution_started"]
+    assert events[-1] == "summary"
+    assert set(events[2:-1]) <= {"rows"}
+    assert f'data: {{"question": "{request_data["question"]}", "query": ' in body
+
+
+@pytest.mark.asyncio
+async def test_sql_question_answer_stream_error_event(test_app_asyncio: httpx.AsyncClient, mock_atext_to_sql):
+    request_data = {"log_type": "anomaly_detection_log", "question": "This question should fail in the llm"}
+    response = await test_app_asyncio.post("/sql/qa/stream", json=request_data)
+    assert response.status_code == 200
+    assert response.text.startswith("event: error\n")
+    assert "No SQL query" in response.text
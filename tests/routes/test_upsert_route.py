@@ -2,6 +2,7 @@
 Test upsert route
 """
 
+import os
 from typing import Tuple
 from pymysql.connections import Connection
 import pytest
@@ -10,6 +11,8 @@ import httpx
 from app.server import upsert
 from app.utils.common import get_file_md5
 
+pytestmark = pytest.mark.usefixtures("tmp_file_storage")
+
 
 @pytest.mark.asyncio
 async def test_log_upsert(
@@ -108,6 +111,21 @@ async def test_log_upsert_invalid_content_does_not_insert_log_fid_metadata(
     assert result["cnt"] == 0
 
 
+@pytest.mark.asyncio
+async def test_ingest_log_files_removes_all_uploads_on_failure(tmp_file_storage, mocker):
+    """The uploads after a failing one are removed as well"""
+    uploads = []
+    for fname in ("first.log", "second.log"):
+        fpath = tmp_file_storage / fname
+        fpath.write_bytes(b"2024-01-01T12:00:00Z, 100ms, 1\n")
+        uploads.append({"filename": fname, "path": str(fpath), "md5": get_file_md5(fpath.read_bytes()), "size": 31})
+    mocker.patch("app.server.upsert._store_log_file", side_effect=ConnectionError("mysql unavailable"))
+
+    with pytest.raises(ConnectionError):
+        await upsert.ingest_log_files("anomaly_detection_log", "log_group", uploads)
+    assert list(tmp_file_storage.iterdir()) == []
+
+
 @pytest.mark.asyncio
 async def test_file_upsert_success(
     test_app_asyncio: httpx.AsyncClient,
@@ -148,3 +166,129 @@ async def test_file_upsert_unsupported_file(test_app_asyncio: httpx.AsyncClient)
     response = await test_app_asyncio.post("/upsert/files", files=files)
     assert response.status_code == 400
     assert "invalid" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_log_upsert_background_job(test_app_asyncio: httpx.AsyncClient, tmp_job_store):
+    """A background upsert persists the upload, queues a job & returns its id immediately"""
+    files = [("files", ("sample.log", b"2024-01-01T12:00:00Z, 100ms, 1\n", "text/plain"))]
+    response = await test_app_asyncio.post(
+        "/upsert/logs?log_type=anomaly_detection_log&background=true",
+        data={"log_file_id": "background_log_group"},
+        files=files,
+    )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    upload = tmp_job_store.get(job_id)["payload"]["uploads"][0]
+    assert upload["filename"] == "sample.log"
+    assert upload["md5"] == get_file_md5(b"2024-01-01T12:00:00Z, 100ms, 1\n")
+    assert upload["size"] == 31
+    with open(upload["path"], "rb") as f_read:
+        assert f_read.read() == b"2024-01-01T12:00:00Z, 100ms, 1\n"
+    os.remove(upload["path"])
+
+    response = await test_app_asyncio.get(f"/jobs/{job_id}")
+    data = response.json()
+    assert response.status_code == 200
+    assert data["status"] == "queued"
+    assert data["kind"] == "log_upsert"
+
+    response = await test_app_asyncio.get("/jobs/unknown")
+    assert response.status_code == 404
+
+
+@pytest.fixture
+def mock_source_store(mock_chroma_db, mocker):
+    """Keep the chunk ids & the file md5 stored per source in the mocked collection, register files in a list"""
+    stored, registered = {}, []
+
+    def _get(where, include, limit=None):
+        conditions = {key: value for condition in where.get("$and", [where]) for key, value in condition.items()}
+        entry = stored.get(conditions["source"])
+        if entry is None or conditions.get("file_md5", entry["md5"]) != entry["md5"]:
+            return {"ids": []}
+        return {"ids": list(entry["ids"])}
+
+    def _sync_source_chunks(vector_store, diff, new_documents, new_vectors, kept_documents):
+        metadata = (new_documents + kept_documents)[0].metadata
+        stored[metadata["source"]] = {"md5": metadata["file_md5"], "ids": diff.new_ids + diff.kept_ids}
+
+    mock_chroma_db._collection.get.side_effect = _get
+    mocker.patch("app.server.upsert.sync_source_chunks", side_effect=_sync_source_chunks)
+    mocker.patch(
+        "app.server.upsert.entries_exist", side_effect=lambda conn, tb_name, data: data["file_md5"] in registered
+    )
+    mocker.patch(
+        "app.server.upsert.insert_data_into_sql",
+        side_effect=lambda conn, tb_name, data_dict: registered.append(data_dict["file_md5"]) or {"status": "success"},
+    )
+    return registered
+
+
+@pytest.mark.asyncio
+async def test_file_upsert_registers_only_indexed_files(
+    test_app_asyncio: httpx.AsyncClient, mock_source_store, mock_openai_emb
+):
+    """A file failing to index is not registered, the files after it are still ingested & registered"""
+    registered, sync_source_chunks = mock_source_store, upsert.sync_source_chunks.side_effect
+
+    def _failing_sync_source_chunks(vector_store, diff, new_documents, new_vectors, kept_documents):
+        if new_documents[0].metadata["source"] == "second.txt":
+            raise ConnectionError("vector store unavailable")
+        sync_source_chunks(vector_store, diff, new_documents, new_vectors, kept_documents)
+
+    upsert.sync_source_chunks.side_effect = _failing_sync_source_chunks
+    contents = {"first.txt": b"first file content", "second.txt": b"second file content", "third.txt": b"third file"}
+    files = [("files", (fname, content, "text/plain")) for fname, content in contents.items()]
+    response = await test_app_asyncio.post("/upsert/files", files=files)
+    data = response.json()
+    assert response.status_code == 200
+    assert data["status"] == "success"
+    assert data["content"] == ["first.txt", "third.txt"]
+    assert data["failed"] == ["second.txt"]
+    assert registered == [get_file_md5(contents["first.txt"]), get_file_md5(contents["third.txt"])]
+
+    # the failed file is ingested when uploaded again, the indexed ones are skipped
+    upsert.sync_source_chunks.side_effect = sync_source_chunks
+    response = await test_app_asyncio.post("/upsert/files", files=files)
+    assert response.json()["content"] == ["second.txt"]
+    assert registered[-1] == get_file_md5(contents["second.txt"])
+
+
+@pytest.mark.asyncio
+async def test_file_upsert_duplicate_file_names(test_app_asyncio: httpx.AsyncClient):
+    """Files are keyed by their file name, an upload with the same name twice is rejected"""
+    files = [
+        ("files", ("notes.txt", b"first notes", "text/plain")),
+        ("files", ("notes.txt", b"other notes", "text/plain")),
+    ]
+    response = await test_app_asyncio.post("/upsert/files", files=files)
+    assert response.status_code == 400
+    assert "notes.txt" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_file_upsert_replaces_file_of_same_name(
+    test_app_asyncio: httpx.AsyncClient, mock_source_store, mock_openai_emb
+):
+    """A document uploaded under a stored file name replaces the stored document, also an earlier version"""
+
+    async def _upload(content: bytes) -> dict:
+        response = await test_app_asyncio.post("/upsert/files", files=[("files", ("notes.txt", content, "text/plain"))])
+        return response.json()
+
+    data = await _upload(b"first notes")
+    assert data["status"] == "success"
+    first_ids = upsert.sync_source_chunks.call_args.args[1].new_ids
+
+    data = await _upload(b"unrelated document")
+    assert data["status"] == "success"
+    assert data["chunks"]["deleted"] == len(first_ids)
+    assert upsert.sync_source_chunks.call_args.args[1].stale_ids == sorted(first_ids)
+
+    # the earlier version uploaded again replaces the current one, the current version itself is skipped
+    data = await _upload(b"first notes")
+    assert data["status"] == "success"
+    assert upsert.sync_source_chunks.call_args.args[1].new_ids == first_ids
+    data = await _upload(b"first notes")
+    assert data["status"] == "failed"